@@ -0,0 +1,312 @@
+"""
+Benchmark of `plush generate` with synthetic nginx.toml
+
+    python -m benchmark.generate
+    python -m benchmark.generate --sizes 10 100 1000 --output /tmp/result.json
+    python -m benchmark.generate --output-mode consolidated
+
+results are saved as benchmark/results/<plush version>.json by default(git
+ignored), compare them across releases to find regressions
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+from plush import __version__
+from plush.config import get_config_from_file
+from plush.deploy_stage import get_file_path
+from plush.nginx import NginxGenerator
+from plush.nginx.generation import ConfGenerations
+from plush.nginx.manifest import ConfManifest
+
+from .importtime import measure_command
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 50000]
+RESULTS_DIR = Path(__file__).parent.joinpath("results")
+
+
+def synthesize_nginx_toml(size: int, output_mode: str = "split") -> str:
+    """size is the total number of servers, mixed as http/stream/mail"""
+    lines = [
+        "[generate]",
+        f'output_mode = "{output_mode}"',
+        "",
+        "[ssl_cert]",
+        'default_ssl_cert_domain = "example.com"',
+        "",
+    ]
+
+    upstream_count = max(1, size // 50)
+    for i in range(upstream_count):
+        lines += [
+            "[[http_upstream]]",
+            f'name = "http_upstream_{i}"',
+            'content = """',
+            "    least_conn;",
+            f"    server 127.0.0.1:{8000 + i};",
+            f"    server 127.0.0.2:{8000 + i};",
+            '"""',
+            "",
+            "[[stream_upstream]]",
+            f'name = "stream_upstream_{i}"',
+            'content = """',
+            f"    server 127.0.0.1:{9000 + i};",
+            '"""',
+            "",
+        ]
+
+    mail_count = max(1, size // 100)
+    stream_count = max(1, size // 10)
+    http_count = max(1, size - stream_count - mail_count)
+
+    for i in range(http_count):
+        server_name = f"s{i}.example.com"
+        match i % 5:
+            case 0:
+                lines += [
+                    "[[http_server]]",
+                    f'server_name = "{server_name}"',
+                    "listen = 10080",
+                    "listen_ssl = 10443",
+                    f'proxy_pass = "http://127.0.0.1:{8000 + i % 100}"',
+                    'client_max_body_size = "100m"',
+                    "hsts = true",
+                ]
+            case 1:
+                lines += [
+                    "[[http_server]]",
+                    f'server_name = "{server_name}"',
+                    "listen_ssl = 10443",
+                    f'root_path = "/var/www/{server_name}"',
+                ]
+            case 2:
+                lines += [
+                    "[[http_server]]",
+                    f'server_name = "{server_name}"',
+                    "listen_ssl = 10443",
+                    f'proxy_pass = "http_upstream_{i % upstream_count}"',
+                    "support_websocket = true",
+                    'location."/api" = """',
+                    "proxy_pass $proxy_pass;",
+                    '"""',
+                    'location."/static" = """',
+                    f"root /var/www/{server_name};",
+                    '"""',
+                ]
+            case 3:
+                lines += [
+                    "[[http_server]]",
+                    f'server_name = "{server_name}"',
+                    "listen = 10080",
+                    'proxy_pass = "http://127.0.0.1:8000"',
+                ]
+            case _:
+                lines += [
+                    "[[http_server]]",
+                    f'server_name = "{server_name}"',
+                    "listen_ssl = 10443",
+                    "listen_http2 = false",
+                    'proxy_pass = "http://127.0.0.1:8000"',
+                    'location."/" = """',
+                    "proxy_pass $proxy_pass;",
+                    '"""',
+                ]
+        lines.append("")
+
+    for i in range(stream_count):
+        lines += [
+            "[[stream_server]]",
+            f'comment = "stream {i}"',
+            f"listen = {20000 + i}",
+        ]
+        if i % 2:
+            lines.append(f"listen_ssl = {40000 + i}")
+        lines += [f'proxy_pass = "stream_upstream_{i % upstream_count}"', ""]
+
+    for i in range(mail_count):
+        lines += [
+            "[[mail_server]]",
+            f'type = "{"ssl" if i % 2 else "starttls"}"',
+            f"port = {1000 + i}",
+            'auth_http = "localhost:8000/api/smtpd/auth"',
+            "",
+        ]
+
+    return "\n".join(lines)
+
+
+def _timeit(func, *args, **kwargs) -> tuple[float, object]:
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def bench_in_process(toml_file: Path, conf_dir: Path) -> dict:
+    generator = NginxGenerator(config_nginx_toml=toml_file, nginx_conf_dir=conf_dir)
+
+    parse_seconds, generator.config = _timeit(
+        get_config_from_file, toml_file, use_cache=False
+    )
+    # first call fills the cache
+    get_config_from_file(toml_file)
+    cached_parse_seconds, _ = _timeit(get_config_from_file, toml_file)
+
+    # per generator type render time
+    generators = generator.build_generators()
+    render_seconds = defaultdict(float)
+    render_count = defaultdict(int)
+    contents = list()
+    for one in generators:
+        seconds, content = _timeit(one._generate_conf_content)
+        render_seconds[type(one).__name__] += seconds
+        render_count[type(one).__name__] += 1
+        contents.append(content)
+
+    manifest = ConfManifest(live_dir=generator.NGINX_CONF_LIVE_DIR)
+    for one, content in zip(generators, contents):
+        one.generate(manifest, content=content)
+
+    consolidate_seconds, _ = _timeit(generator.consolidate, manifest)
+
+    generations = ConfGenerations(conf_dir=generator.NGINX_CONF_DIR)
+    write_seconds, staging_dir = _timeit(
+        generations.stage, manifest=manifest, managed_dirs=generator.managed_dirs
+    )
+    publish_seconds, _ = _timeit(generations.publish, staging_dir)
+
+    return {
+        "parse_seconds": parse_seconds,
+        "cached_parse_seconds": cached_parse_seconds,
+        "render_seconds": dict(render_seconds),
+        "render_count": dict(render_count),
+        "consolidate_seconds": consolidate_seconds,
+        "write_seconds": write_seconds,
+        "publish_seconds": publish_seconds,
+        "files": len(manifest.files),
+        "bytes": sum(len(content) for content in manifest.files.values()),
+    }
+
+
+def bench_subprocess(toml_file: Path, work_dir: Path, jobs: int) -> dict:
+    """cold `python -m plush generate`, wall time and peak RSS"""
+    # keep every output file inside work_dir
+    env = os.environ | {
+        "PLUSH_CRONTAB_FILE": work_dir.joinpath("crontabs").as_posix(),
+        "PLUSH_LOGROTATE_CONF": work_dir.joinpath("logrotate.conf").as_posix(),
+    }
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "plush",
+            "generate",
+            "--config-nginx-toml",
+            toml_file.as_posix(),
+            "--nginx-conf-dir",
+            work_dir.joinpath("nginx").as_posix(),
+            "--jobs",
+            str(jobs),
+        ],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    _, status, rusage = os.wait4(process.pid, 0)
+    seconds = time.perf_counter() - started
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    for name in ("nginx", "crontabs", "logrotate.conf"):
+        path = get_file_path(work_dir.joinpath(name))
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)
+
+    return {
+        "jobs": jobs,
+        "returncode": process.returncode,
+        "wall_seconds": seconds,
+        # ru_maxrss is KiB on Linux
+        "peak_rss_kib": rusage.ru_maxrss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark of plush generate")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--jobs", type=int, default=1)
+    parser.add_argument(
+        "--output-mode", choices=["split", "consolidated"], default="split"
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=RESULTS_DIR.joinpath(f"{__version__}.json"),
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    result = {
+        "plush_version": __version__,
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "output_mode": args.output_mode,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        # cold start of `python -m plush generate`, before doing any work
+        "startup": measure_command(["generate", "--help"]),
+        "sizes": dict(),
+    }
+    print(
+        f"startup: plush.cli import:{result['startup']['plush_cli_ms']:.1f}ms"
+        f" wall:{result['startup']['wall_seconds'] * 1000:.1f}ms"
+    )
+    with tempfile.TemporaryDirectory(prefix="plush-benchmark-") as work_dir:
+        for size in args.sizes:
+            toml_file = Path(work_dir).joinpath(f"nginx-{size}.toml")
+            toml_file.write_text(synthesize_nginx_toml(size, args.output_mode))
+
+            conf_dir = Path(work_dir).joinpath(f"nginx-{size}")
+            in_process = bench_in_process(toml_file, conf_dir)
+            shutil.rmtree(get_file_path(conf_dir), ignore_errors=True)
+
+            cold_generate = bench_subprocess(
+                toml_file, work_dir=Path(work_dir), jobs=args.jobs
+            )
+
+            result["sizes"][str(size)] = {
+                "in_process": in_process,
+                "cold_generate": cold_generate,
+            }
+            print(
+                f"size:{size:>6} parse:{in_process['parse_seconds']:.3f}s"
+                f" cached_parse:{in_process['cached_parse_seconds']:.3f}s"
+                f" render:{sum(in_process['render_seconds'].values()):.3f}s"
+                f" write:{in_process['write_seconds']:.3f}s"
+                f" files:{in_process['files']}"
+                f" cold:{cold_generate['wall_seconds']:.3f}s"
+                f" peak_rss:{cold_generate['peak_rss_kib']}KiB"
+            )
+
+    args.output.parent.mkdir(parents=True, exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(result, f, indent=2)
+
+    print(f"Save result to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Import time budget of the plush CLI, based on `python -X importtime`
+
+    python -m benchmark.importtime
+    python -m benchmark.importtime --budget-ms 200
+
+exit code is 1 if any command is over budget, or imports a module it does not use
+"""
+
+import argparse
+import subprocess
+import sys
+import time
+
+DEFAULT_BUDGET_MS = 150
+
+# `--help` of every command should only import typer and plush.cli
+COMMANDS = [
+    ["--help"],
+    ["generate", "--help"],
+    ["watch", "--help"],
+    ["cert-check", "--help"],
+    ["reload", "--help"],
+    ["precompress", "--help"],
+    ["stats", "--help"],
+    ["rollback", "--help"],
+    ["cron", "--help"],
+    ["worker", "start", "--help"],
+]
+LAZY_MODULES = [
+    "jinja2",
+    "crontab",
+    "daemon",
+    "lockfile",
+    "dataclass_wizard",
+    "tomllib",
+    "plush.nginx",
+    "plush.config",
+    "plush.deploy_stage",
+    "plush.cert",
+    "plush.reload",
+    "plush.precompress",
+    "plush.stats",
+]
+
+
+def measure_command(args: list[str]) -> dict:
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "plush"] + args,
+        capture_output=True,
+        text=True,
+    )
+    wall_seconds = time.perf_counter() - started
+
+    # import time: self [us] | cumulative | imported package
+    imported = dict()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+
+        try:
+            _, cumulative, name = line[len("import time:") :].split("|")
+            cumulative_us = int(cumulative)
+        except ValueError:
+            continue
+
+        name = name.rstrip()
+        # top level import has no indent
+        imported[name.strip()] = {
+            "cumulative_us": cumulative_us,
+            "top_level": not name.startswith("  "),
+        }
+
+    return {
+        "command": " ".join(args),
+        "returncode": result.returncode,
+        "wall_seconds": wall_seconds,
+        "import_ms": sum(
+            v["cumulative_us"] for v in imported.values() if v["top_level"]
+        )
+        / 1000,
+        "plush_cli_ms": imported.get("plush.cli", {}).get("cumulative_us", 0) / 1000,
+        "unexpected_modules": sorted(
+            name
+            for name in imported
+            if any(
+                name == module or name.startswith(f"{module}.")
+                for module in LAZY_MODULES
+            )
+        ),
+    }
+
+
+def measure_all() -> list[dict]:
+    return [measure_command(args) for args in COMMANDS]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="import time budget of plush CLI")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    args = parser.parse_args()
+
+    failed = False
+    for result in measure_all():
+        message = (
+            f"plush {result['command']:<22}"
+            f" plush.cli:{result['plush_cli_ms']:>7.1f}ms"
+            f" all:{result['import_ms']:>7.1f}ms"
+            f" wall:{result['wall_seconds'] * 1000:>7.1f}ms"
+        )
+        if result["returncode"] != 0:
+            message += f" FAILED(returncode:{result['returncode']})"
+            failed = True
+        if result["plush_cli_ms"] > args.budget_ms:
+            message += f" OVER BUDGET({args.budget_ms}ms)"
+            failed = True
+        if result["unexpected_modules"]:
+            message += f" UNEXPECTED IMPORT({', '.join(result['unexpected_modules'])})"
+            failed = True
+
+        print(message)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
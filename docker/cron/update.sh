@@ -5,16 +5,37 @@ if [ "$DNSROBOCERT" = "enable" ]; then
     /usr/local/bin/dnsrobocert --config /config/dnsrobocert.yml --directory /data/dnsrobocert --one-shot
 fi
 
+# generate nginx *.conf, exit code 3 means something changed
+python -m plush generate --exit-code
+generate_returncode=$?
+
+# .gz/.br/.zst siblings for http_server with precompress = true, incremental
+python -m plush precompress
+
+# certs changed since NGINX loaded them, exit code 3 means renewed
+python -m plush cert-check --exit-code
+cert_check_returncode=$?
+
 # reload/start nginx
-# 在 macOS 的 otbstack 中 `pgrep /usr/sbin/nginx` 返回为空
-nginx_pid=$(pgrep nginx)
+# 在 macOS 的 otbstack 中 `pgrep /usr/sbin/nginx` 返回为空, 读取 pid 文件
+nginx_pid=""
+[ -f /run/nginx/nginx.pid ] && read -r nginx_pid < /run/nginx/nginx.pid
+
+if [ -n "$nginx_pid" ] && kill -0 "$nginx_pid" 2>/dev/null; then
+    # reload only if anything changed, a tree rejected by `nginx -t` is not published
+    if [ "$generate_returncode" != "3" ] && [ "$cert_check_returncode" != "3" ]; then
+        echo "NGINX is running, PID is $nginx_pid, config/cert unchanged, skip reload."
+        exit 0
+    fi
 
-if [ -n "$nginx_pid" ]; then
     echo "NGINX is running, PID is $nginx_pid, Reloading..."
-    /usr/sbin/nginx -e /logs/nginx/error.log -s reload
-    echo "Restart NGINX done."
+    # SIGHUP, wait for new workers up
+    python -m plush reload --reason update
 else
     echo "NGINX is not running, Starting..."
-    /usr/sbin/nginx -e /logs/nginx/error.log
+    # certs loaded by this start, a reload records them too
+    python -m plush cert-check --record
+    # nginx.conf is generated by plush, sized for this container
+    /usr/sbin/nginx -e /logs/nginx/error.log -c /data/nginx/live/nginx.conf
     echo "Start NGINX done."
 fi
@@ -1,24 +1,20 @@
 #!/bin/sh
 
-# 这似乎是一个系统级别的 bug,设置一下即可解决 worker CPU 占用 100% 的问题
-#ulimit -n 65536;
+# `ulimit -n` is not needed, worker_rlimit_nofile is set in generated nginx.conf
 
 # prepare data path
 mkdir -p /data/lexicon_tld_set
 mkdir -p /data/dnsrobocert
-mkdir -p /data/nginx/http_server.d
-mkdir -p /data/nginx/http_upstream.d
-mkdir -p /data/nginx/stream_server.d
+mkdir -p /data/nginx
+mkdir -p /data/nginx/cache
 mkdir -p /logs/dnsrobocert
 mkdir -p /logs/nginx
 mkdir -p /logs/plush
 
-# call plush init
-run_plush_generate="python -m plush generate"
-while ! $run_plush_generate; do
-    echo "Run plush generate failed, retrying..."
-    sleep 1
-done
+# call plush init, not fatal: update.sh issues certs, generates again and retries
+if ! python -m plush generate; then
+    echo "Run plush generate failed, continue to update cert..."
+fi
 
 # update cert, start nginx service
 start_nginx_service="/app/cron/update.sh"
@@ -28,6 +24,11 @@ while ! $start_nginx_service; do
     echo "retrying..."
 done
 
+# watch nginx.toml, regenerate and reload NGINX on change
+if [ "$PLUSH_WATCH" = "enable" ]; then
+    python -m plush watch > /proc/1/fd/1 2>&1 &
+fi
+
 # start cron
 #supercronic "$PLUSH_CRONTAB_FILE" 2>&1 | tee -a /logs/supercronic.log > /proc/1/fd/1 &
 exec /usr/bin/supercronic "$PLUSH_CRONTAB_FILE" > /proc/1/fd/1 2>&1
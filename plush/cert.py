@@ -0,0 +1,126 @@
+import json
+import re
+from hashlib import sha256
+from logging import getLogger
+from pathlib import Path
+
+from .config import Config
+from .constants import CERT_FINGERPRINT_FILE, NGINX_CONF_DIR, NGINX_CONF_LIVE
+from .deploy_stage import get_file_path
+
+logger = getLogger(__name__)
+
+# `ssl_certificate data:$empty;` of http_default.conf is not a file
+_SSL_CERTIFICATE = re.compile(r"^\s*ssl_certificate(?:_key)?\s+(/[^\s;]+)\s*;", re.M)
+
+
+def get_referenced_cert_dirs(config: Config) -> list[Path]:
+    """cert dirs in use by generated servers, e.g. /data/dnsrobocert/live/example.com"""
+    cert_dirs = set()
+    for server in config.http_server + config.stream_server:
+        if not server.enable or server.listen_ssl is None:
+            continue
+
+        cert_dirs.add(config.ssl_cert.get_pem_file_base_path(server.ssl_cert_domain))
+
+    for server in config.mail_server:
+        if not server.enable:
+            continue
+
+        cert_dirs.add(config.ssl_cert.get_pem_file_base_path(server.ssl_cert_domain))
+
+    cert_dirs.discard(None)
+    return sorted(cert_dirs)
+
+
+def get_live_cert_files(live_dir: Path) -> list[Path]:
+    """pem files referenced by the live tree, the ones NGINX loads on start/reload"""
+    result = set()
+    for path in live_dir.rglob("*.conf"):
+        try:
+            result.update(_SSL_CERTIFICATE.findall(path.read_text()))
+        except OSError as e:
+            logger.warning(f"Read {path} failed, {e}")
+
+    return sorted(Path(v) for v in result)
+
+
+def fingerprint_files(paths: list[Path]) -> dict[str, str]:
+    """sha256 of every pem file, symlinks are followed; missing file is ''"""
+    result = dict()
+    for path in paths:
+        try:
+            result[path.as_posix()] = sha256(path.read_bytes()).hexdigest()
+        except FileNotFoundError:
+            result[path.as_posix()] = ""
+        except OSError as e:
+            logger.warning(f"Read {path} failed, {e}")
+            result[path.as_posix()] = ""
+
+    return result
+
+
+class CertFingerprint:
+    """fingerprints of the certs loaded by the running NGINX
+
+    recorded only when NGINX is started/reloaded, so every consumer(cron
+    update.sh, watch, worker) compares with what NGINX actually loaded, a
+    renewal seen by one of them is still seen by the others until reloaded
+    """
+
+    state_file: Path
+    live_dir: Path
+
+    def __init__(
+        self,
+        state_file: str | Path = CERT_FINGERPRINT_FILE,
+        nginx_conf_dir: str | Path = NGINX_CONF_DIR,
+    ):
+        self.state_file = get_file_path(state_file)
+        self.live_dir = get_file_path(nginx_conf_dir).joinpath(NGINX_CONF_LIVE)
+
+    def load(self) -> dict[str, str] | None:
+        try:
+            with open(self.state_file) as f:
+                data = json.load(f)
+
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Load {self.state_file} failed, {e}")
+            return None
+
+        if not isinstance(data, dict):
+            return None
+
+        return data
+
+    def save(self, fingerprint: dict[str, str]):
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.state_file.with_name(f".{self.state_file.name}.tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(fingerprint, f, indent=2, sort_keys=True)
+
+        tmp_file.replace(self.state_file)
+
+    def current(self) -> dict[str, str]:
+        return fingerprint_files(get_live_cert_files(self.live_dir))
+
+    def check(self) -> list[str]:
+        """return pem files changed since NGINX loaded them, state is not changed
+
+        without recorded state, every pem file of the live tree is treated as changed
+        """
+        current = self.current()
+        previous = self.load()
+        if previous is None:
+            changed = sorted(current.keys())
+        else:
+            changed = sorted(
+                k for k in current.keys() if current.get(k) != previous.get(k)
+            )
+
+        for path in changed:
+            logger.info(f"Cert file changed: {path}")
+
+        return changed
@@ -4,11 +4,15 @@ from pathlib import Path
 import typer
 
 from . import __version__
-from .constants import CONFIG_NGINX_TOML, NGINX_CONF_DIR
-from .crontab import update_crontab_file
-from .logrotate import generate_logrotate_conf
-from .nginx import NginxGenerator
-from .worker import ScheduleDaemon, task_nginx_reload
+from .constants import (
+    CERT_CHECK_EXIT_CODE_CHANGED,
+    CONFIG_NGINX_TOML,
+    GENERATE_EXIT_CODE_CHANGED,
+    NGINX_CONF_DIR,
+    WATCH_DEBOUNCE_SECONDS,
+)
+
+# every command imports what it uses, keep startup cheap, e.g. `plush cron`
 
 logger = getLogger(__name__)
 
@@ -20,11 +24,15 @@ app.add_typer(worker_app, name="worker", help="Task Worker")
 
 @worker_app.command("start", help="Start Worker")
 def worker_start():
+    from .worker import ScheduleDaemon
+
     ScheduleDaemon().start()
 
 
 @worker_app.command("stop", help="Stop Worker")
 def worker_stop():
+    from .worker import ScheduleDaemon
+
     ScheduleDaemon().stop()
 
 
@@ -32,11 +40,27 @@ def worker_stop():
 def generate(
     config_nginx_toml: str = typer.Option(
         CONFIG_NGINX_TOML, help=f"[default:{CONFIG_NGINX_TOML}]"
-    )
+    ),
+    exit_code: bool = typer.Option(
+        False,
+        help=f"exit with code {GENERATE_EXIT_CODE_CHANGED} if any nginx *.conf changed",
+    ),
+    jobs: int = typer.Option(
+        1, help="render in N processes and write in N threads [default:1]"
+    ),
+    nginx_conf_dir: str = typer.Option(
+        NGINX_CONF_DIR, help=f"[default:{NGINX_CONF_DIR}]"
+    ),
 ):
+    from .crontab import update_crontab_file
+    from .logrotate import generate_logrotate_conf
+    from .nginx import NginxGenerator
+
     # generate nginx *.conf
-    NginxGenerator(
-        config_nginx_toml=Path(config_nginx_toml), nginx_conf_dir=Path(NGINX_CONF_DIR)
+    changed = NginxGenerator(
+        config_nginx_toml=Path(config_nginx_toml),
+        nginx_conf_dir=Path(nginx_conf_dir),
+        jobs=jobs,
     )()
 
     # generate logrotate.conf file
@@ -45,12 +69,122 @@ def generate(
     # generate crontab file
     update_crontab_file()
 
+    if exit_code and changed:
+        raise typer.Exit(GENERATE_EXIT_CODE_CHANGED)
+
+
+@app.command("watch", help="regenerate and reload NGINX on nginx.toml change")
+def watch(
+    config_nginx_toml: str = typer.Option(
+        CONFIG_NGINX_TOML, help=f"[default:{CONFIG_NGINX_TOML}]"
+    ),
+    nginx_conf_dir: str = typer.Option(
+        NGINX_CONF_DIR, help=f"[default:{NGINX_CONF_DIR}]"
+    ),
+    debounce: float = typer.Option(
+        WATCH_DEBOUNCE_SECONDS,
+        help=f"seconds without new write before regenerate [default:{WATCH_DEBOUNCE_SECONDS}]",
+    ),
+):
+    from .watch import NginxTomlWatcher
+
+    NginxTomlWatcher(
+        config_nginx_toml=Path(config_nginx_toml),
+        nginx_conf_dir=Path(nginx_conf_dir),
+        debounce_seconds=debounce,
+    ).run()
+
+
+@app.command("cert-check", help="check certs loaded by NGINX for renewal")
+def cert_check(
+    nginx_conf_dir: str = typer.Option(
+        NGINX_CONF_DIR, help=f"[default:{NGINX_CONF_DIR}]"
+    ),
+    exit_code: bool = typer.Option(
+        False,
+        help=f"exit with code {CERT_CHECK_EXIT_CODE_CHANGED} if any cert changed",
+    ),
+    record: bool = typer.Option(
+        False, help="record certs of the live tree as loaded, e.g. NGINX started"
+    ),
+):
+    from .cert import CertFingerprint
+
+    cert_fingerprint = CertFingerprint(nginx_conf_dir=nginx_conf_dir)
+    if record:
+        cert_fingerprint.save(cert_fingerprint.current())
+        return
+
+    changed = cert_fingerprint.check()
+    if not changed:
+        logger.info("Cert unchanged")
+
+    if exit_code and changed:
+        raise typer.Exit(CERT_CHECK_EXIT_CODE_CHANGED)
+
+
+@app.command("precompress", help="write .gz/.br/.zst siblings for static roots")
+def precompress(
+    config_nginx_toml: str = typer.Option(
+        CONFIG_NGINX_TOML, help=f"[default:{CONFIG_NGINX_TOML}]"
+    ),
+    jobs: int = typer.Option(0, help="compress in N processes [default:CPU count]"),
+):
+    import os
+
+    from .config import get_config_from_file
+    from .precompress import Precompressor, get_precompress_roots
+
+    config = get_config_from_file(config_nginx_toml)
+    Precompressor(
+        roots=get_precompress_roots(config),
+        formats=config.precompress.formats,
+        min_size=config.precompress.min_size,
+        jobs=jobs or os.cpu_count() or 1,
+    )()
+
+
+@app.command("stats", help="latency/bytes/error rate from NGINX access logs")
+def stats(
+    paths: list[str] = typer.Argument(
+        None, help="log files or globs [default: access logs by logrotate.conf]"
+    ),
+    jobs: int = typer.Option(1, help="read files in N processes [default:1]"),
+    top: int = typer.Option(20, help="rows per group [default:20]"),
+    as_json: bool = typer.Option(False, "--json", help="print JSON"),
+):
+    from .stats import run_stats
+
+    print(run_stats(paths or [], jobs=jobs, top=top, as_json=as_json))
+
+
+@app.command("rollback", help="switch nginx *.conf back to previous generation")
+def rollback():
+    from .deploy_stage import get_file_path
+    from .nginx.generation import ConfGenerations
+
+    generations = ConfGenerations(conf_dir=get_file_path(NGINX_CONF_DIR))
+    with generations.lock():
+        if not generations.rollback():
+            raise typer.Exit(1)
+
+
+@app.command("reload", help="reload NGINX, coalesced by worker if it is running")
+def reload(reason: str = typer.Option("cli", help="[default:cli]")):
+    from .reload import request_reload
+
+    if not request_reload(reason):
+        raise typer.Exit(1)
+
 
 @app.command(help="for crontab")
 def cron():
-    task_nginx_reload()
+    from .reload import request_reload
+
+    request_reload("cron")
 
 
 def main():
-    typer.echo(f"Plush v{__version__}")
+    # stderr, keep stdout clean for `plush stats --json`
+    typer.echo(f"Plush v{__version__}", err=True)
     app()
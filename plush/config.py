@@ -1,16 +1,33 @@
+import json
 import tomllib
-from dataclasses import KW_ONLY, field
+from collections.abc import Callable
+from dataclasses import KW_ONLY, MISSING, field, fields, is_dataclass
+from enum import Enum
+from functools import cache
+from hashlib import sha256
 from logging import getLogger
 from pathlib import Path
 
 from dataclass_wizard import Alias, DataclassWizard
 
+from . import __version__
 from .constants import (
+    CONFIG_CACHE_FILE,
     DNSROBOCERT_SSL_FILE_DIR,
+    NGINX_ACCESS_LOG_BUFFER,
+    NGINX_ACCESS_LOG_FLUSH,
+    NGINX_HTTP_ACCESS_LOG,
     NGINX_HTTP_DEFAULT_LISTEN,
     NGINX_HTTP_DEFAULT_LISTEN_SSL,
+    NGINX_STREAM_ACCESS_LOG,
+    PRECOMPRESS_MIN_SIZE,
+    AccessLogFormat,
+    NginxConfOutputMode,
     NginxMailServerType,
+    PrecompressFormat,
+    ProxyCachePreset,
 )
+from .deploy_stage import get_file_path
 
 logger = getLogger(__name__)
 
@@ -22,6 +39,42 @@ class SSLCert(DataclassWizard):
         load=["default_ssl_cert_domain", "ssl_cert_domain"], default_factory=str
     )
 
+    def get_pem_file_base_path(self, ssl_cert_domain: str | None) -> Path | None:
+        """ssl_cert_domain: from server, fallback to default_ssl_cert_domain"""
+        if ssl_cert_domain is None:
+            ssl_cert_domain = self.default_ssl_cert_domain
+
+        if ssl_cert_domain is None:
+            # default is None
+            return None
+
+        return Path(self.pem_file_base_path).joinpath(ssl_cert_domain)
+
+
+class Generate(DataclassWizard):
+    output_mode: NginxConfOutputMode = NginxConfOutputMode.SPLIT
+    # write proxy_pass/root_path into directives instead of `set $...`
+    inline_values: bool = False
+    # one server block for http_server with the same effective config
+    merge_servers: bool = False
+
+
+class Precompress(DataclassWizard):
+    # `plush precompress`, for http_server with precompress = true
+    formats: list[PrecompressFormat] = field(
+        default_factory=lambda: list(PrecompressFormat)
+    )
+    min_size: int = PRECOMPRESS_MIN_SIZE
+
+
+class NginxMain(DataclassWizard):
+    # nginx.conf, None: sized from cgroup cpu/memory and fd limit
+    worker_processes: int | str | None = None
+    worker_cpu_affinity: str | None = None  # "" to disable
+    worker_connections: int | None = None
+    worker_rlimit_nofile: int | None = None
+    ssl_session_cache_size: str | None = None
+
 
 class HttpDeafult(DataclassWizard):
     http_default_listen: list[int] = field(
@@ -32,13 +85,115 @@ class HttpDeafult(DataclassWizard):
     )
 
 
+class UpstreamServer(DataclassWizard):
+    address: str = field(default_factory=str)
+
+    weight: int | None = None
+    max_fails: int | None = None
+    fail_timeout: str | None = None
+    backup: bool = False
+    down: bool = False
+
+
 class Upstream(DataclassWizard):
     # 配置文件兼容 http upstream 和 stream upstream
     enable: bool = True
 
     name: str = field(default_factory=str)
+    # raw content, after balance/zone/servers, before keepalive*
     content: str = field(default_factory=str)
 
+    # structured, e.g. balance = "least_conn"
+    balance: str | None = None
+    zone: str | None = None
+    servers: list[UpstreamServer] = field(default_factory=list)
+
+    # http upstream only
+    keepalive: int | None = None
+    keepalive_requests: int | None = None
+    keepalive_timeout: str | None = None
+
+
+class ProxyCacheZone(DataclassWizard):
+    # proxy_cache_path, http level
+    name: str = field(default_factory=str)
+
+    path: str | None = None  # default: NGINX_PROXY_CACHE_DIR/<name>
+    levels: str = "1:2"
+    keys_zone_size: str = "10m"
+    max_size: str | None = None
+    inactive: str | None = None
+    use_temp_path: bool = False
+
+
+class ProxyCache(DataclassWizard):
+    # proxy_cache*, server or location level
+    zone: str | None = None
+    preset: ProxyCachePreset | None = None
+
+    # e.g. ["200 302 10m", "404 1m"]
+    valid: list[str] | None = None
+    # e.g. "error timeout updating http_500"
+    use_stale: str | None = None
+    lock: bool | None = None
+    background_update: bool | None = None
+
+
+class ProxySettings(DataclassWizard):
+    # proxy buffering/timeouts, server or location level
+    buffering: bool | None = None
+    buffers: str | None = None  # e.g. "8 16k"
+    buffer_size: str | None = None
+    busy_buffers_size: str | None = None
+    request_buffering: bool | None = None
+
+    connect_timeout: str | None = None
+    read_timeout: str | None = None
+    send_timeout: str | None = None
+
+
+class AccessLog(DataclassWizard):
+    # per server, unset ones are inherited from [access_log]
+    enable: bool | None = None  # false: `access_log off`
+    path: str | None = None
+    format: AccessLogFormat | None = None
+    buffer: str | None = None
+    flush: str | None = None
+    gzip: int | None = None  # 1-9
+
+
+class AccessLogDefault(DataclassWizard):
+    # [access_log], http/stream level of nginx.conf
+    http_path: str = NGINX_HTTP_ACCESS_LOG
+    stream_path: str = NGINX_STREAM_ACCESS_LOG
+    format: AccessLogFormat = AccessLogFormat.MAIN
+    buffer: str | None = NGINX_ACCESS_LOG_BUFFER  # none: unbuffered
+    flush: str | None = NGINX_ACCESS_LOG_FLUSH
+    gzip: int | None = None
+
+    # requests to these paths(exact $uri) are logged by sampling, http only
+    health_check_paths: list[str] = field(default_factory=list)
+    health_check_sample: str = "1%"
+
+
+class StaticProfile(DataclassWizard):
+    # for root_path servers, `static = {}` for defaults
+    sendfile: bool = True
+    tcp_nopush: bool = True
+
+    open_file_cache: str | None = "max=10000 inactive=60s"
+    open_file_cache_valid: str = "60s"
+    open_file_cache_min_uses: int = 2
+    open_file_cache_errors: bool = True
+
+    # `aio threads` needs NGINX built --with-threads
+    aio_threads: bool = True
+    # files larger than it are read by direct I/O, bypass page cache
+    directio: str | None = "8m"
+
+    expires: str | None = "7d"
+    cache_control: str | None = None  # e.g. "public"
+
 
 class ServerAbc(DataclassWizard):
     enable: bool = True
@@ -56,6 +211,9 @@ class HttpServer(ServerAbc):
     listen_ipv6: bool = True
 
     root_path: str | None = None
+    static: StaticProfile | None = None
+    # serve siblings by `plush precompress`
+    precompress: bool = False
     proxy_pass: str | None = None
     redirect_domain: str | None = None
     return_301: str | None = None
@@ -63,11 +221,19 @@ class HttpServer(ServerAbc):
 
     location: dict[str, str] = field(default_factory=dict)
 
+    proxy_cache: ProxyCache | None = None
+    # key is the path of custom location
+    location_proxy_cache: dict[str, ProxyCache] = field(default_factory=dict)
+    proxy: ProxySettings | None = None
+    location_proxy: dict[str, ProxySettings] = field(default_factory=dict)
+
     client_max_body_size: str | None = None
     support_websocket: bool = False
     hsts: bool = False
     hsts_max_age: int = 31536000
 
+    access_log: AccessLog | None = None
+
     @property
     def name(self) -> str:
         return self.server_name
@@ -78,6 +244,8 @@ class StreamServer(ServerAbc):
 
     proxy_pass: str = field(default_factory=str)
 
+    access_log: AccessLog | None = None
+
     @property
     def name(self) -> str:
         data = list()
@@ -113,8 +281,13 @@ class Config(DataclassWizard):
         pass
 
     ssl_cert: SSLCert = Alias(load=["ssl_cert", "common", "default"])
+    generate: Generate = field(default_factory=Generate)
+    precompress: Precompress = field(default_factory=Precompress)
+    nginx: NginxMain = field(default_factory=NginxMain)
+    access_log: AccessLogDefault = field(default_factory=AccessLogDefault)
 
     http_default: HttpDeafult = field(default_factory=HttpDeafult)
+    proxy_cache_zone: list[ProxyCacheZone] = field(default_factory=list)
     http_upstream: list[Upstream] = field(default_factory=list)
     http_server: list[HttpServer] = Alias(
         load=["http_server", "http_d"], default_factory=list
@@ -128,16 +301,169 @@ class Config(DataclassWizard):
     mail_server: list[MailServer] = field(default_factory=list)
 
 
-def get_config_from_file(toml_file: str | Path) -> Config:
-    # parse nginx.toml
+# every class in the cache, by name, nothing else can be created by loading it
+_CACHE_TYPES = {
+    t.__name__: t
+    for t in (
+        SSLCert,
+        Generate,
+        Precompress,
+        NginxMain,
+        HttpDeafult,
+        UpstreamServer,
+        Upstream,
+        ProxyCacheZone,
+        ProxyCache,
+        ProxySettings,
+        AccessLog,
+        AccessLogDefault,
+        StaticProfile,
+        HttpServer,
+        StreamServer,
+        MailServer,
+        Config,
+        AccessLogFormat,
+        NginxConfOutputMode,
+        NginxMailServerType,
+        PrecompressFormat,
+        ProxyCachePreset,
+    )
+}
+_CACHE_TYPE_KEY = "__type__"
+
+
+@cache
+def get_source_stamp() -> str:
+    """count and latest mtime of plush source files, stat only, changed by any upgrade"""
+    mtimes = [path.stat().st_mtime_ns for path in Path(__file__).parent.rglob("*.py")]
+    return f"{len(mtimes)}-{max(mtimes)}"
+
+
+@cache
+def _get_cache_defaults(cls: type) -> tuple[dict, dict[str, Callable]]:
+    """(defaults, default factories) of fields, dataclass defaults are immutable"""
+    defaults, factories = dict(), dict()
+    for f in fields(cls):
+        if f.default is not MISSING:
+            defaults[f.name] = f.default
+        elif f.default_factory is not MISSING:
+            factories[f.name] = f.default_factory
+
+    return defaults, factories
+
+
+def _is_default(cls: type, name: str, value) -> bool:
+    defaults, factories = _get_cache_defaults(cls)
+    if name in defaults:
+        return value == defaults[name]
+    if name in factories:
+        return value == factories[name]()
+
+    return False
+
+
+def _dump_cache_value(value):
+    """validated Config as JSON, classes and enums are tagged by name"""
+    if is_dataclass(value):
+        # most fields are default, left out, the file is smaller and faster to parse
+        data = {
+            f.name: _dump_cache_value(getattr(value, f.name))
+            for f in fields(value)
+            if not _is_default(type(value), f.name, getattr(value, f.name))
+        }
+        data[_CACHE_TYPE_KEY] = type(value).__name__
+        return data
+    if isinstance(value, Enum):
+        return {_CACHE_TYPE_KEY: type(value).__name__, "value": value.value}
+    if isinstance(value, (list, tuple)):
+        return [_dump_cache_value(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _dump_cache_value(v) for k, v in value.items()}
+
+    return value
+
+
+def _load_cache_object(data: dict):
+    """object_hook of json.load, the fields are already validated, skip from_dict()"""
+    type_name = data.pop(_CACHE_TYPE_KEY, None)
+    if type_name is None:
+        return data
+
+    cls = _CACHE_TYPES[type_name]
+    if issubclass(cls, Enum):
+        return cls(data["value"])
+
+    defaults, factories = _get_cache_defaults(cls)
+    values = {**defaults, **data}
+    for name, factory in factories.items():
+        if name not in data:
+            values[name] = factory()
+
+    obj = object.__new__(cls)
+    obj.__dict__ = values
+    return obj
+
+
+def _load_config_cache(cache_file: Path, cache_key: str) -> Config | None:
+    # plain JSON, a tampered cache file can not run code, only fail to load
+    try:
+        with open(cache_file, "rb") as f:
+            # the key first, skip decoding the config of another key
+            if f.readline().decode("utf-8").strip() != cache_key:
+                return None
+
+            config = json.load(f, object_hook=_load_cache_object)
+
+    except FileNotFoundError:
+        return None
+    except (OSError, KeyError, ValueError) as e:
+        logger.warning(f"Load config cache {cache_file} failed, {e}")
+        return None
+
+    if not isinstance(config, Config):
+        return None
+
+    return config
+
+
+def _save_config_cache(cache_file: Path, cache_key: str, config: Config):
+    tmp_file = cache_file.with_name(f".{cache_file.name}.tmp")
+    try:
+        cache_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(tmp_file, "w") as f:
+            f.write(f"{cache_key}\n")
+            json.dump(_dump_cache_value(config), f)
+
+        tmp_file.replace(cache_file)
+
+    except Exception as e:
+        logger.warning(f"Save config cache {cache_file} failed, {e}")
+
+
+def get_config_from_file(toml_file: str | Path, use_cache: bool = True) -> Config:
+    # read nginx.toml
     try:
         with open(toml_file, "rb") as f:
-            config_obj = tomllib.load(f)
+            toml_content = f.read()
 
     except FileNotFoundError as e:
         logger.critical(f"Open file {toml_file} failed, {e}")
         exit(1)
-    except tomllib.TOMLDecodeError as e:
+
+    # validated Config is cached, key is plush version, source stamp and toml hash
+    cache_file = get_file_path(CONFIG_CACHE_FILE)
+    cache_key = f"{__version__}:{get_source_stamp()}:{sha256(toml_content).hexdigest()}"
+    if use_cache:
+        config = _load_config_cache(cache_file, cache_key)
+        if config is not None:
+            logger.debug(f"Load {toml_file} from cache {cache_file}")
+            return config
+
+    # parse nginx.toml
+    try:
+        config_obj = tomllib.loads(toml_content.decode("utf-8"))
+
+    except (tomllib.TOMLDecodeError, UnicodeDecodeError) as e:
         logger.critical(f"Parse file {toml_file} failed, {e}")
         exit(1)
 
@@ -148,4 +474,7 @@ def get_config_from_file(toml_file: str | Path) -> Config:
         logger.critical(f"Parse file {toml_file} failed, {e}")
         exit(1)
 
+    if use_cache:
+        _save_config_cache(cache_file, cache_key, config)
+
     return config
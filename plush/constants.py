@@ -3,14 +3,58 @@ from enum import StrEnum, auto
 # Worker
 WORKER_PID = "/tmp/plush-worker.pid"
 WORKER_LOG = "/logs/plush/worker.log"
+RELOAD_FIFO = "/tmp/plush-reload.fifo"
+# requester waits for the result, coalesce window + min interval + reload + drain
+RELOAD_REPLY_TIMEOUT = 120.0
 
 # NGINX
 CONFIG_NGINX_TOML = "/config/nginx.toml"
+CONFIG_CACHE_FILE = "/data/plush/config-cache.json"
 
 NGINX_CONF_DIR = "/data/nginx"
-NGINX_RELOAD_SH = "/app/nginx/reload.sh"  # 已废弃
+NGINX_CONF_MANIFEST = ".manifest.json"
+NGINX_CONF_GENERATIONS_DIR = "generations"
+NGINX_CONF_LIVE = "live"
+NGINX_CONF_PREVIOUS = "previous"
+NGINX_CONF_LOCK = ".lock"  # flock, one generation at a time
 
+NGINX_BIN = "/usr/sbin/nginx"
+NGINX_MAIN_CONF = "/etc/nginx/nginx.conf"  # fallback for validate
+NGINX_VALIDATE_TIMEOUT = 30
+NGINX_PID = "/run/nginx/nginx.pid"
+NGINX_ERROR_LOG = "/logs/nginx/error.log"
+# nginx.conf sizing
+NGINX_WORKER_CONNECTIONS_MIN = 1024
+NGINX_WORKER_CONNECTIONS_MAX = 65535
+NGINX_RLIMIT_NOFILE_MAX = 1048576
+NGINX_CONNECTION_MEMORY = 64 * 1024  # buffers of one proxied connection, roughly
+NGINX_SSL_SESSION_CACHE_MIN_MB = 8
+# SIGHUP reload, wait for new workers up, in seconds
+NGINX_RELOAD_TIMEOUT = 30.0
+# then for old workers exited, websocket etc. may keep them longer, not a failure
+NGINX_RELOAD_DRAIN_TIMEOUT = 30.0
+NGINX_RELOAD_POLL_INTERVAL = 0.05
+# process title of workers, cache manager/loader are children of master too
+NGINX_WORKER_TITLE = b"nginx: worker process"
+
+NGINX_MAIN_CONF_NAME = "nginx.conf"  # generated, `nginx -c /data/nginx/live/nginx.conf`
 NGINX_HTTP_DEFAULT_CONF = "http_default.conf"
+NGINX_HTTP_PROXY_CACHE_CONF = "http_proxy_cache.conf"
+NGINX_HTTP_HASH_CONF = "http_hash.conf"
+# (max_size, bucket_size) of nginx.conf before, the floor of generated values
+NGINX_HASH_SIZE_DEFAULTS = {
+    "server_names_hash": (512, 64),
+    # 512/64 warned "could not build optimal proxy_headers_hash", as NGINX suggests
+    "proxy_headers_hash": (1024, 128),
+    "types_hash": (2048, 64),
+    "map_hash": (2048, 64),
+}
+NGINX_PROXY_CACHE_DIR = "/data/nginx/cache"
+# access_log, buffered writes by default
+NGINX_HTTP_ACCESS_LOG = "/logs/nginx/http_access.log"
+NGINX_STREAM_ACCESS_LOG = "/logs/nginx/stream_access.log"
+NGINX_ACCESS_LOG_BUFFER = "64k"
+NGINX_ACCESS_LOG_FLUSH = "5s"
 NGINX_HTTP_DEFAULT_LISTEN = 10080
 NGINX_HTTP_DEFAULT_LISTEN_SSL = 10443
 
@@ -22,11 +66,94 @@ NGINX_STREAM_SERVER_DIR = "stream_server.d"
 
 NGINX_MAIL_SERVER_DIR = "mail_server.d"
 
+# output_mode = "consolidated", one file per section dir
+NGINX_CONF_CONSOLIDATED = "consolidated.conf"
+NGINX_CONF_CONSOLIDATED_INDEX = "consolidated.index.json"
+
 
 class NginxMailServerType(StrEnum):
     SSL = auto()
     STARTTLS = auto()
 
 
+class ProxyCachePreset(StrEnum):
+    MICROCACHE = auto()  # 1s, absorb spikes on dynamic pages
+
+
+class AccessLogFormat(StrEnum):
+    MAIN = auto()  # combined + x_forwarded_for, as before
+    TIMED = auto()  # main + request/upstream timing and request_id
+    JSON = auto()  # escape=json, timing fields
+
+
+class NginxConfOutputMode(StrEnum):
+    SPLIT = auto()  # one *.conf per upstream/server
+    CONSOLIDATED = auto()
+
+
+# `plush generate --exit-code`
+GENERATE_EXIT_CODE_CHANGED = 3
+# `[generate] merge_servers`, rough per-process costs for the savings report
+NGINX_SERVER_BLOCK_MEMORY = 8 * 1024  # server conf, location tree, variables
+NGINX_SSL_CONTEXT_MEMORY = 100 * 1024  # SSL_CTX with parsed cert chain and key
+NGINX_SSL_CONTEXT_LOAD_MS = 1.0  # read/parse pem files, check key on reload
+
+# `plush watch`
+WATCH_DEBOUNCE_SECONDS = 1.0
+
+
 # dnsrobocert
 DNSROBOCERT_SSL_FILE_DIR = "/data/dnsrobocert/live"
+
+# `plush precompress`
+PRECOMPRESS_STATE_FILE = "/data/plush/precompress.json"
+PRECOMPRESS_MIN_SIZE = 256
+# compressed/original, a sibling above it is not worth it, NGINX serves the original
+PRECOMPRESS_MAX_RATIO = 0.95
+
+
+class PrecompressFormat(StrEnum):
+    GZIP = "gzip"
+    BROTLI = "br"
+    ZSTD = "zstd"
+
+
+PRECOMPRESS_SUFFIXES = {
+    PrecompressFormat.GZIP: ".gz",
+    PrecompressFormat.BROTLI: ".br",
+    PrecompressFormat.ZSTD: ".zst",
+}
+PRECOMPRESS_LEVELS = {
+    PrecompressFormat.GZIP: 9,
+    PrecompressFormat.BROTLI: 11,
+    PrecompressFormat.ZSTD: 19,
+}
+# besides text/*
+PRECOMPRESS_TYPES = {
+    "application/javascript",
+    "application/json",
+    "application/manifest+json",
+    "application/wasm",
+    "application/xml",
+    "application/xhtml+xml",
+    "application/rss+xml",
+    "application/atom+xml",
+    "image/svg+xml",
+    "image/x-icon",
+    "image/vnd.microsoft.icon",
+    "font/ttf",
+    "font/otf",
+    "application/vnd.ms-fontobject",
+}
+
+# `plush cert-check`
+CERT_PEM_FILES = ("fullchain.pem", "privkey.pem")
+CERT_FINGERPRINT_FILE = "/data/plush/cert-fingerprint.json"
+CERT_CHECK_EXIT_CODE_CHANGED = 3
+
+# `plush stats`, access logs and their rotated files, by logrotate.conf
+STATS_LOG_GLOB = "/logs/nginx/*.log"  # if logrotate.conf is not generated yet
+STATS_SKETCH_ACCURACY = 0.01  # relative error of quantiles
+STATS_SKETCH_MAX_BUCKETS = 2048
+STATS_MAX_KEYS = 1000  # per group, more are counted as "(other)"
+STATS_QUANTILES = (0.5, 0.95, 0.99)
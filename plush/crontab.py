@@ -2,7 +2,7 @@ from logging import getLogger
 
 from crontab import CronTab
 
-from .deploy_stage import EV, get_file_path
+from .deploy_stage import get_env_value, get_file_path
 
 logger = getLogger(__name__)
 
@@ -10,6 +10,7 @@ _CRON_COMMENT_TAG = "PLUSH"
 
 
 def update_crontab_file():
+    EV = get_env_value()
     filename = get_file_path(EV.CRONTAB_FILE).as_posix()
 
     cron = CronTab()
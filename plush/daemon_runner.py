@@ -11,10 +11,6 @@ from logging import getLogger
 from os import kill
 from pathlib import Path
 
-from daemon import DaemonContext
-from daemon.pidfile import TimeoutPIDLockFile
-from lockfile import AlreadyLocked
-
 from .deploy_stage import get_file_path
 
 logger = getLogger(__name__)
@@ -27,6 +23,9 @@ class DaemonRunner:
         func_daemon: Callable,
         func_cleanup: Callable | None = None,
     ) -> None:
+        # python-daemon/lockfile are only needed by `plush worker`
+        from daemon.pidfile import TimeoutPIDLockFile
+
         self.pid_file = get_file_path(pid_file)
         self.pid_lock = TimeoutPIDLockFile(self.pid_file)
         self.func_daemon = func_daemon
@@ -42,6 +41,9 @@ class DaemonRunner:
         exit(0)
 
     def start(self, **kwargs):
+        from daemon import DaemonContext
+        from lockfile import AlreadyLocked
+
         try:
             with DaemonContext(
                 detach_process=True,
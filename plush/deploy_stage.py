@@ -1,8 +1,12 @@
+import os
 from enum import StrEnum, auto
+from functools import cache
 from logging import getLogger
 from pathlib import Path
+from typing import TYPE_CHECKING
 
-from dataclass_wizard import EnvWizard
+if TYPE_CHECKING:
+    from .env_value import EnvValue
 
 logger = getLogger(__name__)
 
@@ -18,30 +22,41 @@ class DeployStage(StrEnum):
     PRD = auto()
 
 
-class EnvValue(EnvWizard):
-    class _(EnvWizard.Meta):
-        env_prefix = "PLUSH_"
-        env_file = True
+@cache
+def get_env_value() -> "EnvValue":
+    # parse environment and .env on first use, not at import time
+    from .env_value import EnvValue
 
-    DEPLOY_STAGE: str = DeployStage.DEV
+    return EnvValue()
 
-    CRONTAB_FILE: str = "/data/crontabs"
-    CRONTAB_UPDATE: str = "0 2 * * *"
-    CRONTAB_LOGROTATE: str = "0 0 * * *"
 
-    LOGROTATE_CONF: str = "/data/logrotate.conf"
-    LOGROTATE_SIZE: str = "100M"
-    LOGROTATE_ROTATE: str = "10"
+@cache
+def get_deploy_stage() -> str:
+    """PLUSH_DEPLOY_STAGE, as set in Docker, without loading dataclass_wizard"""
+    value = os.environ.get("PLUSH_DEPLOY_STAGE")
+    if value is not None:
+        return value
 
+    # maybe in .env
+    return get_env_value().DEPLOY_STAGE
 
-EV = EnvValue()
+
+def __getattr__(name: str):
+    if name == "EV":
+        return get_env_value()
+    if name == "EnvValue":
+        from .env_value import EnvValue
+
+        return EnvValue
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def get_file_path(path: str | Path) -> Path:
     if isinstance(path, str):
         path = Path(path)
 
-    if EV.DEPLOY_STAGE == DeployStage.DEV:
+    if get_deploy_stage() == DeployStage.DEV:
         return Path(f"/tmp/plush{Path(path).absolute().as_posix().replace("/", "_")}")
 
     else:
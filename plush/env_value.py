@@ -0,0 +1,23 @@
+from dataclass_wizard import EnvWizard
+
+from .deploy_stage import DeployStage
+
+
+class EnvValue(EnvWizard):
+    class _(EnvWizard.Meta):
+        env_prefix = "PLUSH_"
+        env_file = True
+
+    DEPLOY_STAGE: str = DeployStage.DEV
+
+    CRONTAB_FILE: str = "/data/crontabs"
+    CRONTAB_UPDATE: str = "0 2 * * *"
+    CRONTAB_LOGROTATE: str = "0 0 * * *"
+
+    LOGROTATE_CONF: str = "/data/logrotate.conf"
+    LOGROTATE_SIZE: str = "100M"
+    LOGROTATE_ROTATE: str = "10"
+
+    # worker reload queue, in seconds
+    RELOAD_COALESCE_WINDOW: float = 2.0
+    RELOAD_MIN_INTERVAL: float = 10.0
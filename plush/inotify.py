@@ -0,0 +1,112 @@
+"""
+minimal inotify(7) binding by ctypes, Linux only
+
+- https://man7.org/linux/man-pages/man7/inotify.7.html
+"""
+
+import ctypes
+import os
+import select
+import struct
+from pathlib import Path
+from typing import NamedTuple
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+
+IN_CLOEXEC = os.O_CLOEXEC
+
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+_READ_SIZE = 64 * 1024
+
+
+class InotifyEvent(NamedTuple):
+    wd: int
+    mask: int
+    cookie: int
+    name: str
+    path: Path
+
+
+class Inotify:
+    fd: int
+    watches: dict[int, Path]
+
+    def __init__(self):
+        # CDLL(None): symbols of the running process, works on glibc and musl
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self._libc.inotify_add_watch.argtypes = [
+            ctypes.c_int,
+            ctypes.c_char_p,
+            ctypes.c_uint32,
+        ]
+
+        fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1 failed, {os.strerror(errno)}")
+
+        self.fd = fd
+        self.watches = dict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def add_watch(self, path: Path, mask: int) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_add_watch {path} failed", str(path))
+
+        self.watches[wd] = path
+        return wd
+
+    def read_events(self, timeout: float | None = None) -> list[InotifyEvent]:
+        """block until events arrive, return [] if timeout"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        data = os.read(self.fd, _READ_SIZE)
+        events = list()
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+
+            base_path = self.watches.get(wd, Path())
+            events.append(
+                InotifyEvent(
+                    wd=wd,
+                    mask=mask,
+                    cookie=cookie,
+                    name=name,
+                    path=base_path.joinpath(name) if name else base_path,
+                )
+            )
+            if mask & IN_IGNORED:
+                # removed by kernel, e.g. the dir is deleted or replaced
+                self.watches.pop(wd, None)
+
+        return events
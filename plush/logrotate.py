@@ -1,6 +1,6 @@
 from logging import getLogger
 
-from .deploy_stage import EV, get_file_path
+from .deploy_stage import get_env_value, get_file_path
 from .tempalte import Template
 
 logger = getLogger(__name__)
@@ -42,6 +42,7 @@ logrotate_conf_template = """
 
 
 def generate_logrotate_conf():
+    EV = get_env_value()
     filename = get_file_path(EV.LOGROTATE_CONF)
     conf_content = Template().render(logrotate_conf_template, EV=EV)
 
@@ -1,21 +1,40 @@
+import json
 from logging import getLogger
 from pathlib import Path
 
 from ..config import Config, get_config_from_file
 from ..constants import (
+    NGINX_CONF_CONSOLIDATED,
+    NGINX_CONF_CONSOLIDATED_INDEX,
+    NGINX_CONF_LIVE,
     NGINX_HTTP_DEFAULT_CONF,
+    NGINX_HTTP_HASH_CONF,
+    NGINX_HTTP_PROXY_CACHE_CONF,
     NGINX_HTTP_SERVER_DIR,
     NGINX_HTTP_UPSTREAM_DIR,
     NGINX_MAIL_SERVER_DIR,
+    NGINX_MAIN_CONF_NAME,
     NGINX_STREAM_SERVER_DIR,
     NGINX_STREAM_UPSTREAM_DIR,
+    NginxConfOutputMode,
 )
 from ..deploy_stage import get_file_path
+from ..precompress import get_precompress_formats
+from ..tempalte import template_registry
+from .common import GenerateOneConfAbc
+from .generation import ConfGenerations
+from .hash_size import GenerateHttpHashConf
 from .http_default import GenerateHttpDefaultConf
 from .http_server import GenerateOneHttpServerConf
 from .mail_server import GenerateOneMailServerConf
+from .main_conf import GenerateNginxMainConf
+from .manifest import ConfManifest
+from .merge import merge_http_servers
+from .pool import render_all
+from .proxy_cache import GenerateHttpProxyCacheConf, get_proxy_cache_zones
 from .stream_server import GenerateOneStreamServerConf
-from .upstream import GenerateOneUpstreamConf
+from .upstream import GenerateOneUpstreamConf, has_keepalive
+from .validate import validate_staged_tree
 
 logger = getLogger(__name__)
 
@@ -23,94 +42,257 @@ logger = getLogger(__name__)
 class NginxGenerator:
     config: Config
 
-    def __init__(self, config_nginx_toml: Path, nginx_conf_dir: Path):
+    def __init__(self, config_nginx_toml: Path, nginx_conf_dir: Path, jobs: int = 1):
         self.CONFIG_NGINX_TOML = config_nginx_toml
+        self.jobs = jobs
         self.NGINX_CONF_DIR = get_file_path(nginx_conf_dir)
+        # as referenced by nginx.conf, before get_file_path()
+        self.NGINX_CONF_LIVE_INCLUDE = Path(nginx_conf_dir).joinpath(NGINX_CONF_LIVE)
         self.prepair_conf_file_path(self.NGINX_CONF_DIR)
 
-        self.NGINX_HTTP_DEFAULT_CONF = self.NGINX_CONF_DIR.joinpath(
+        # all files are rendered relative to live dir, then staged and published
+        self.NGINX_CONF_LIVE_DIR = self.NGINX_CONF_DIR.joinpath(NGINX_CONF_LIVE)
+
+        self.NGINX_MAIN_CONF = self.NGINX_CONF_LIVE_DIR.joinpath(NGINX_MAIN_CONF_NAME)
+        self.NGINX_HTTP_DEFAULT_CONF = self.NGINX_CONF_LIVE_DIR.joinpath(
             NGINX_HTTP_DEFAULT_CONF
         )
-        self.NGINX_HTTP_UPSTREAM_DIR = self.NGINX_CONF_DIR.joinpath(
+        self.NGINX_HTTP_PROXY_CACHE_CONF = self.NGINX_CONF_LIVE_DIR.joinpath(
+            NGINX_HTTP_PROXY_CACHE_CONF
+        )
+        self.NGINX_HTTP_HASH_CONF = self.NGINX_CONF_LIVE_DIR.joinpath(
+            NGINX_HTTP_HASH_CONF
+        )
+        self.NGINX_HTTP_UPSTREAM_DIR = self.NGINX_CONF_LIVE_DIR.joinpath(
             NGINX_HTTP_UPSTREAM_DIR
         )
-        self.NGINX_HTTP_SERVER_DIR = self.NGINX_CONF_DIR.joinpath(NGINX_HTTP_SERVER_DIR)
-        self.NGINX_STREAM_UPSTREAM_DIR = self.NGINX_CONF_DIR.joinpath(
+        self.NGINX_HTTP_SERVER_DIR = self.NGINX_CONF_LIVE_DIR.joinpath(
+            NGINX_HTTP_SERVER_DIR
+        )
+        self.NGINX_STREAM_UPSTREAM_DIR = self.NGINX_CONF_LIVE_DIR.joinpath(
             NGINX_STREAM_UPSTREAM_DIR
         )
-        self.NGINX_STREAM_SERVER_DIR = self.NGINX_CONF_DIR.joinpath(
+        self.NGINX_STREAM_SERVER_DIR = self.NGINX_CONF_LIVE_DIR.joinpath(
             NGINX_STREAM_SERVER_DIR
         )
-        self.NGINX_MAIL_SERVER_DIR = self.NGINX_CONF_DIR.joinpath(NGINX_MAIL_SERVER_DIR)
+        self.NGINX_MAIL_SERVER_DIR = self.NGINX_CONF_LIVE_DIR.joinpath(
+            NGINX_MAIL_SERVER_DIR
+        )
+
+    def __call__(self, *args, **kwargs) -> bool:
+        """return True if any *.conf file changed"""
+        generations = ConfGenerations(conf_dir=self.NGINX_CONF_DIR)
+        # cron update.sh, watch and entrypoint may generate at the same time
+        with generations.lock():
+            return self.generate(generations)
 
-    def __call__(self, *args, **kwargs):
+    def generate(self, generations: ConfGenerations) -> bool:
         # parse nginx.toml
         self.config = get_config_from_file(self.CONFIG_NGINX_TOML)
+        manifest = ConfManifest(live_dir=self.NGINX_CONF_LIVE_DIR)
+
+        # render(serial or process pool), then collect in order
+        generators = self.build_generators()
+        contents = render_all(generators, jobs=self.jobs)
+        # sized by the keys in all other http *.conf, so rendered after them
+        generators.append(self.build_http_hash_generator(generators, contents))
+        contents.append(generators[-1]._generate_conf_content())
+        for generator, content in zip(generators, contents):
+            generator.generate(manifest, content=content)
+
+        logger.debug(f"Template registry: {template_registry.stats}")
+        self.consolidate(manifest)
+        if not manifest.changed:
+            logger.info(f"Generate {self.NGINX_CONF_DIR} finished, nothing changed")
+            return False
+
+        # stage the complete tree, then publish it with one symlink flip
+        staging_dir = generations.stage(
+            manifest=manifest, managed_dirs=self.managed_dirs, jobs=self.jobs
+        )
+        # publish only if NGINX accepts the complete tree
+        if not validate_staged_tree(
+            staging_dir, live_dir=self.NGINX_CONF_LIVE_INCLUDE.as_posix()
+        ):
+            generations.discard(staging_dir)
+            logger.error(f"Generate {self.NGINX_CONF_DIR} failed, live tree unchanged")
+            exit(1)
+
+        generations.publish(staging_dir)
+
+        logger.info(
+            f"Generate {self.NGINX_CONF_DIR} finished, written: {len(manifest.written)}, removed: {len(manifest.removed)}"
+        )
+        return True
 
+    def build_generators(self) -> list[GenerateOneConfAbc]:
         logger.info(f"Generate {self.NGINX_HTTP_SERVER_DIR}/*.conf ...")
         # generate http_default.conf
-        GenerateHttpDefaultConf(
-            http_default=self.config.http_default,
-            full_path=self.NGINX_HTTP_DEFAULT_CONF,
-        ).generate()
+        generators: list[GenerateOneConfAbc] = [
+            # generate nginx.conf, sized from cgroup/rlimit
+            GenerateNginxMainConf(
+                config=self.config,
+                full_path=self.NGINX_MAIN_CONF,
+                live_dir=self.NGINX_CONF_LIVE_INCLUDE.as_posix(),
+            ),
+            GenerateHttpDefaultConf(
+                http_default=self.config.http_default,
+                full_path=self.NGINX_HTTP_DEFAULT_CONF,
+            ),
+            # generate http_proxy_cache.conf, always, it is included by nginx.conf
+            GenerateHttpProxyCacheConf(
+                zones=get_proxy_cache_zones(
+                    self.config.proxy_cache_zone,
+                    [
+                        cache
+                        for server in self.config.http_server
+                        if server.enable
+                        for cache in [server.proxy_cache]
+                        + list(server.location_proxy_cache.values())
+                        if cache is not None
+                    ],
+                ),
+                full_path=self.NGINX_HTTP_PROXY_CACHE_CONF,
+            ),
+        ]
 
         # parser/generate http_upstream.d/*.conf
         if self.config.http_upstream:
             logger.info(f"Generate {self.NGINX_HTTP_UPSTREAM_DIR}/*.conf ...")
 
-            self.prepair_conf_file_path(path=self.NGINX_HTTP_UPSTREAM_DIR)
             for http_upstream in self.config.http_upstream:
-                GenerateOneUpstreamConf(
-                    upstream=http_upstream,
-                    base_path=self.NGINX_HTTP_UPSTREAM_DIR,
-                ).generate()
+                generators.append(
+                    GenerateOneUpstreamConf(
+                        upstream=http_upstream,
+                        base_path=self.NGINX_HTTP_UPSTREAM_DIR,
+                    )
+                )
 
         # parser/generate http_server.d/*.conf
         if self.config.http_server:
             logger.info(f"Generate {self.NGINX_HTTP_SERVER_DIR}/*.conf ...")
 
-            self.prepair_conf_file_path(path=self.NGINX_HTTP_SERVER_DIR)
-            for http_server in self.config.http_server:
-                GenerateOneHttpServerConf(
-                    server=http_server,
-                    ssl_cert=self.config.ssl_cert,
-                    base_path=self.NGINX_HTTP_SERVER_DIR,
-                ).generate()
+            keepalive_upstreams = frozenset(
+                upstream.name
+                for upstream in self.config.http_upstream
+                if has_keepalive(upstream)
+            )
+            # only formats which `plush precompress` can write here
+            precompress_formats = tuple(get_precompress_formats(self.config))
+            if self.config.generate.merge_servers:
+                http_servers, _ = merge_http_servers(
+                    self.config.http_server, self.config.ssl_cert
+                )
+            else:
+                http_servers = [(None, server) for server in self.config.http_server]
+
+            for name, http_server in http_servers:
+                generators.append(
+                    GenerateOneHttpServerConf(
+                        name=name,
+                        server=http_server,
+                        ssl_cert=self.config.ssl_cert,
+                        base_path=self.NGINX_HTTP_SERVER_DIR,
+                        inline_values=self.config.generate.inline_values,
+                        keepalive_upstreams=keepalive_upstreams,
+                        precompress_formats=precompress_formats,
+                        access_log=self.config.access_log,
+                    )
+                )
 
         # parser/generate stream_upstream.d/*.conf
         if self.config.stream_upstream:
             logger.info(f"Generate {self.NGINX_STREAM_UPSTREAM_DIR}/*.conf ...")
 
-            self.prepair_conf_file_path(path=self.NGINX_STREAM_UPSTREAM_DIR)
             for stream_upstream in self.config.stream_upstream:
-                GenerateOneUpstreamConf(
-                    upstream=stream_upstream,
-                    base_path=self.NGINX_STREAM_UPSTREAM_DIR,
-                ).generate()
+                generators.append(
+                    GenerateOneUpstreamConf(
+                        upstream=stream_upstream,
+                        base_path=self.NGINX_STREAM_UPSTREAM_DIR,
+                        is_http=False,
+                    )
+                )
 
         # parser/generate stram_server.d/*.conf
         if self.config.stream_server:
             logger.info(f"Generate {self.NGINX_STREAM_SERVER_DIR}/*.conf ...")
 
-            self.prepair_conf_file_path(path=self.NGINX_STREAM_SERVER_DIR)
             for stream_server in self.config.stream_server:
-                GenerateOneStreamServerConf(
-                    server=stream_server,
-                    ssl_cert=self.config.ssl_cert,
-                    base_path=self.NGINX_STREAM_SERVER_DIR,
-                ).generate()
+                generators.append(
+                    GenerateOneStreamServerConf(
+                        server=stream_server,
+                        ssl_cert=self.config.ssl_cert,
+                        base_path=self.NGINX_STREAM_SERVER_DIR,
+                        inline_values=self.config.generate.inline_values,
+                        access_log=self.config.access_log,
+                    )
+                )
 
         # parser/generate mail_server.d/*.conf
-        if self.config.stream_server:
+        if self.config.mail_server:
             logger.info(f"Generate {self.NGINX_MAIL_SERVER_DIR}/*.conf ...")
 
-            self.prepair_conf_file_path(path=self.NGINX_MAIL_SERVER_DIR)
             for mail_server in self.config.mail_server:
-                GenerateOneMailServerConf(
-                    server=mail_server,
-                    ssl_cert=self.config.ssl_cert,
-                    base_path=self.NGINX_MAIL_SERVER_DIR,
-                ).generate()
+                generators.append(
+                    GenerateOneMailServerConf(
+                        server=mail_server,
+                        ssl_cert=self.config.ssl_cert,
+                        base_path=self.NGINX_MAIL_SERVER_DIR,
+                        inline_values=self.config.generate.inline_values,
+                    )
+                )
+
+        return generators
+
+    def build_http_hash_generator(
+        self, generators: list[GenerateOneConfAbc], contents: list[str]
+    ) -> GenerateHttpHashConf:
+        http_files = {
+            self.NGINX_MAIN_CONF,
+            self.NGINX_HTTP_DEFAULT_CONF,
+            self.NGINX_HTTP_PROXY_CACHE_CONF,
+        }
+        http_dirs = {self.NGINX_HTTP_UPSTREAM_DIR, self.NGINX_HTTP_SERVER_DIR}
+        return GenerateHttpHashConf(
+            contents=[
+                content
+                for generator, content in zip(generators, contents)
+                if generator.enable
+                and (
+                    generator.full_path in http_files
+                    or generator.full_path.parent in http_dirs
+                )
+            ],
+            full_path=self.NGINX_HTTP_HASH_CONF,
+            live_dir=self.NGINX_CONF_LIVE_INCLUDE.as_posix(),
+        )
+
+    def consolidate(self, manifest: ConfManifest):
+        """output_mode = "consolidated", one *.conf per section dir, with an index"""
+        if self.config.generate.output_mode != NginxConfOutputMode.CONSOLIDATED:
+            return
+
+        index = dict()
+        for section_dir in self.managed_dirs:
+            index.update(manifest.consolidate(section_dir, NGINX_CONF_CONSOLIDATED))
+
+        manifest.add(
+            self.NGINX_CONF_LIVE_DIR.joinpath(NGINX_CONF_CONSOLIDATED_INDEX),
+            json.dumps(index, indent=2),
+        )
+        logger.info(
+            f"Consolidate {len(index)} files into {len(set(v['file'] for v in index.values()))} files"
+        )
+
+    @property
+    def managed_dirs(self) -> list[Path]:
+        return [
+            self.NGINX_HTTP_UPSTREAM_DIR,
+            self.NGINX_HTTP_SERVER_DIR,
+            self.NGINX_STREAM_UPSTREAM_DIR,
+            self.NGINX_STREAM_SERVER_DIR,
+            self.NGINX_MAIL_SERVER_DIR,
+        ]
 
     def prepair_conf_file_path(self, path: Path):
         if not path.exists():
@@ -118,12 +300,3 @@ class NginxGenerator:
 
         if not path.is_dir():
             raise
-
-        for file_path in path.iterdir():
-            if not file_path.is_file() or file_path.suffix != ".conf":
-                continue
-
-            try:
-                file_path.unlink()
-            except Exception as e:
-                print(f"Failed to delete {file_path}. Reason: {e}")
@@ -0,0 +1,68 @@
+from logging import getLogger
+
+from ..config import AccessLog, AccessLogDefault
+
+logger = getLogger("plush.nginx")
+
+# set by `map $uri` in nginx.conf, 0 for not sampled health checks
+LOGGABLE_VARIABLE = "$plush_loggable"
+LOG_SAMPLE_VARIABLE = "$plush_log_sample"
+
+
+def get_health_check_value(sample: str) -> str:
+    """value of health check paths in `map $uri $plush_loggable`"""
+    match sample.strip():
+        case "0%" | "0":
+            return "0"
+        case "100%":
+            return "1"
+
+    return LOG_SAMPLE_VARIABLE
+
+
+def get_access_log_directive(
+    default: AccessLogDefault, log: AccessLog | None, is_http: bool
+) -> str | None:
+    """`access_log ...` of server level, None if nothing to override"""
+    if log is None or log == AccessLog():
+        return None
+    if log.enable is False:
+        return "access_log off"
+
+    return _get_access_log_directive(default, log, is_http)
+
+
+def get_default_access_log_directive(default: AccessLogDefault, is_http: bool) -> str:
+    """`access_log ...` of http/stream level in nginx.conf"""
+    return _get_access_log_directive(default, AccessLog(), is_http)
+
+
+def _get_access_log_directive(
+    default: AccessLogDefault, log: AccessLog, is_http: bool
+) -> str:
+    default_path = default.http_path if is_http else default.stream_path
+    path = log.path or default_path
+    buffer, flush, gzip = default.buffer, default.flush, default.gzip
+    if (log.buffer, log.flush, log.gzip) != (None, None, None):
+        if path == default_path:
+            # NGINX rejects conflicting buffer parameters of the same file
+            logger.warning(
+                f"access_log {path} is shared, buffer/flush/gzip are ignored"
+            )
+        else:
+            buffer = log.buffer if log.buffer is not None else buffer
+            flush = log.flush if log.flush is not None else flush
+            gzip = log.gzip if log.gzip is not None else gzip
+
+    result = [f"access_log {path} {log.format or default.format}"]
+    if buffer:
+        result.append(f"buffer={buffer}")
+    if gzip:
+        result.append(f"gzip={gzip}")
+    if flush and (buffer or gzip):
+        # flush is valid with buffer only
+        result.append(f"flush={flush}")
+    if is_http and default.health_check_paths:
+        result.append(f"if={LOGGABLE_VARIABLE}")
+
+    return " ".join(result)
@@ -1,9 +1,12 @@
 import builtins
+import re
 from logging import getLogger
 from pathlib import Path
 
 from ..config import HttpServer, MailServer, ServerAbc, SSLCert, StreamServer
+from ..constants import CERT_PEM_FILES
 from ..tempalte import Template
+from .manifest import ConfManifest
 
 logger = getLogger("plush.nginx")
 
@@ -14,9 +17,10 @@ class GenerateOneConfAbc:
     content: str
 
     enable: bool = True
+    inline_values: bool = False
 
     # 内部数据
-    _values: dict = dict()
+    _values: dict
 
     # 输出信息
     file_name: str
@@ -28,6 +32,7 @@ class GenerateOneConfAbc:
 
     def _init_common(self, name: str, enable: bool, base_path: Path):
         self.name = name
+        self._values = dict()
 
         self.enable = enable
 
@@ -47,49 +52,77 @@ class GenerateOneConfAbc:
     def update_value(self, k, v):
         self._values[k] = v
 
-    def generate_values_list_str(self) -> str:
-        result = "# values list\n"
+    def get_value_ref(self, k: str) -> str:
+        """`$k` in directive, or the literal value if inlined"""
+        if self.inline_values:
+            return str(self._values[k])
+
+        return f"${k}"
+
+    def get_values_referenced_text(self) -> str:
+        """text which may reference values, e.g. custom location"""
+        return ""
+
+    def generate_values_list(self) -> list[tuple[str, str]]:
+        text = self.get_values_referenced_text() if self.inline_values else ""
+        result = list()
         for k, v in self._values.items():
+            # inlined, keep `set` only if still referenced
+            if self.inline_values and not re.search(rf"\$\{{?{k}\b", text):
+                continue
+
             match type(v):
                 case builtins.str:
-                    result += f'    set ${k} "{v}";\n'
+                    result.append((k, f'"{v}"'))
                 case builtins.int:
-                    result += f"    set ${k} {v};\n"
+                    result.append((k, str(v)))
                 case _:
                     raise
         return result
 
-    def generate(self):
-        self.content = self._generate_conf_content()
-        self._generate_conf_file()
+    def generate(self, manifest: ConfManifest, content: str | None = None):
+        """content: already rendered by process pool"""
+        if content is None:
+            content = self._generate_conf_content()
+
+        self.content = content
+        self._generate_conf_file(manifest)
 
     def _generate_conf_content(self) -> str:
         raise NotImplementedError
 
-    def _generate_conf_file(self):
+    def _generate_conf_file(self, manifest: ConfManifest):
         message_base = f" {self.label} >> {self.file_name}"
 
         if not self.enable:
             logger.warning(f"{message_base} Skip(Disabled)!")
             return
 
-        logger.info(f"{message_base} Generate...")
-        try:
-            with open(self.full_path, "w") as f:
-                f.write(self.content)
-
+        if manifest.add(self.full_path, self.content):
             logger.info(f"{message_base} Generate...DONE")
+        else:
+            logger.info(f"{message_base} Generate...UNCHANGED")
+
 
-        except OSError as e:
-            logger.critical(f"{message_base} Generate...failed, {e}")
-            exit(1)
+# sub blocks shared by server templates, they are concatenated into the server
+# template source, so every server is rendered by one compiled template in one pass
+server_block_values = """
+{%- if values %}
 
+    # values list
+{%- for k, v in values %}
+    set ${{ k }} {{ v }};
+{%- endfor %}
+{%- endif %}"""
 
-server_block_template_ssl = """
-# SSL certificate
-ssl_certificate     {{ ssl_pem_file_base_path }}/fullchain.pem;
-ssl_certificate_key {{ ssl_pem_file_base_path }}/privkey.pem;
-include /app/nginx/snippets/ssl-params.conf;"""
+server_block_ssl = """
+{%- if ssl_pem_file_base_path is not none %}
+
+    # SSL certificate
+    ssl_certificate     {{ ssl_pem_file_base_path }}/fullchain.pem;
+    ssl_certificate_key {{ ssl_pem_file_base_path }}/privkey.pem;
+    include /app/nginx/snippets/ssl-params.conf;
+{%- endif %}"""
 
 
 class GenerateOneServerConfAbc(GenerateOneConfAbc):
@@ -101,8 +134,14 @@ class GenerateOneServerConfAbc(GenerateOneConfAbc):
         server: HttpServer | StreamServer | MailServer,
         ssl_cert: SSLCert,
         base_path: Path,
+        inline_values: bool = False,
+        name: str | None = None,
     ):
-        self._init_common(name=server.name, enable=server.enable, base_path=base_path)
+        # name: file name of merged server, server.name by default
+        self._init_common(
+            name=name or server.name, enable=server.enable, base_path=base_path
+        )
+        self.inline_values = inline_values
 
         self.server = server
         self.ssl_cert = ssl_cert
@@ -110,21 +149,38 @@ class GenerateOneServerConfAbc(GenerateOneConfAbc):
         if server.proxy_pass:
             self.update_value(k="proxy_pass", v=server.proxy_pass)
 
-    def generate_block_ssl(self) -> str:
-        if self.server.ssl_cert_domain is None:
-            ssl_cert_domain = self.ssl_cert.default_ssl_cert_domain
-        else:
-            ssl_cert_domain = self.server.ssl_cert_domain
+        # e.g. first boot, dnsrobocert has not issued it yet, `nginx -t` would fail
+        if self.enable and self.listen_ssl_required and self.is_ssl_pem_missing():
+            logger.warning(f"{self.label} certificate not found, skip until issued")
+            self.enable = False
+
+    @property
+    def listen_ssl_required(self) -> bool:
+        return isinstance(getattr(self.server, "listen_ssl", None), int)
+
+    def is_ssl_pem_missing(self) -> bool:
+        """referenced *.pem not found, as NGINX reads it"""
+        path = self.ssl_cert.get_pem_file_base_path(self.server.ssl_cert_domain)
+        if path is None:
+            return False
+
+        return not all(path.joinpath(name).exists() for name in CERT_PEM_FILES)
+
+    def get_ssl_pem_file_base_path(self) -> str | None:
+        path = self.ssl_cert.get_pem_file_base_path(self.server.ssl_cert_domain)
+        if path is None:
+            return None
+        if not self.listen_ssl_required and self.is_ssl_pem_missing():
+            # plain server, NGINX loads ssl_certificate even without `listen ssl`
+            return None
 
-        if ssl_cert_domain is None:
-            # default is None
-            return ""
+        return path.as_posix()
 
+    def render(self, template: str, **kwargs) -> str:
+        # flat context, avoid attribute lookup in sandbox
         return Template().render(
-            server_block_template_ssl,
-            {
-                "ssl_pem_file_base_path": Path(self.ssl_cert.pem_file_base_path)
-                .joinpath(ssl_cert_domain)
-                .as_posix()
-            },
+            template,
+            values=self.generate_values_list(),
+            ssl_pem_file_base_path=self.get_ssl_pem_file_base_path(),
+            **kwargs,
         )
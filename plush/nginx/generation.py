@@ -0,0 +1,167 @@
+import fcntl
+import os
+import shutil
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from logging import getLogger
+from pathlib import Path
+
+from ..constants import (
+    NGINX_CONF_GENERATIONS_DIR,
+    NGINX_CONF_LIVE,
+    NGINX_CONF_LOCK,
+    NGINX_CONF_MANIFEST,
+    NGINX_CONF_PREVIOUS,
+)
+from .manifest import ConfManifest
+
+logger = getLogger("plush.nginx")
+
+
+class ConfGenerations:
+    """
+    every generation is a complete tree under generations/,
+    `live` and `previous` are symlinks, publish/rollback is one atomic rename,
+    generate/rollback of processes(cron, watch, entrypoint) are serialized by lock()
+    """
+
+    conf_dir: Path
+    generations_dir: Path
+    live_link: Path
+    previous_link: Path
+
+    def __init__(self, conf_dir: Path):
+        self.conf_dir = conf_dir
+        self.generations_dir = conf_dir.joinpath(NGINX_CONF_GENERATIONS_DIR)
+        self.live_link = conf_dir.joinpath(NGINX_CONF_LIVE)
+        self.previous_link = conf_dir.joinpath(NGINX_CONF_PREVIOUS)
+
+    @contextmanager
+    def lock(self) -> Iterator[None]:
+        """exclusive flock on <conf_dir>/.lock, blocking, released on exit/crash"""
+        self.conf_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.conf_dir.joinpath(NGINX_CONF_LOCK), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _read_link(link: Path) -> Path | None:
+        if not link.is_symlink():
+            return None
+
+        target = link.resolve()
+        if not target.is_dir():
+            return None
+
+        return target
+
+    @property
+    def live_dir(self) -> Path | None:
+        return self._read_link(self.live_link)
+
+    @property
+    def previous_dir(self) -> Path | None:
+        return self._read_link(self.previous_link)
+
+    def _flip(self, link: Path, target: Path):
+        tmp_link = link.with_name(f".{link.name}.tmp")
+        tmp_link.unlink(missing_ok=True)
+        tmp_link.symlink_to(target.relative_to(self.conf_dir))
+
+        os.replace(tmp_link, link)
+
+    def stage(
+        self, manifest: ConfManifest, managed_dirs: list[Path], jobs: int = 1
+    ) -> Path:
+        """write all files into a new generation dir, unchanged files are hard linked"""
+        staging_dir = self.generations_dir.joinpath(
+            datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        )
+        staging_dir.mkdir(parents=True)
+        for path in managed_dirs:
+            staging_dir.joinpath(path.relative_to(manifest.live_dir)).mkdir(
+                parents=True, exist_ok=True
+            )
+        for parent in {staging_dir.joinpath(key).parent for key in manifest.files}:
+            parent.mkdir(parents=True, exist_ok=True)
+
+        live_dir = self.live_dir
+
+        def write_one(key: str):
+            full_path = staging_dir.joinpath(key)
+            if live_dir is not None and manifest.is_unchanged(key):
+                try:
+                    os.link(live_dir.joinpath(key), full_path)
+                    return
+                except OSError:
+                    pass
+
+            with open(full_path, "w") as f:
+                f.write(manifest.files[key])
+
+        if jobs > 1:
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                # consume the iterator, raise the first exception
+                list(executor.map(write_one, manifest.files.keys()))
+        else:
+            for key in manifest.files.keys():
+                write_one(key)
+
+        with open(staging_dir.joinpath(NGINX_CONF_MANIFEST), "w") as f:
+            f.write(manifest.dump())
+
+        return staging_dir
+
+    def discard(self, staging_dir: Path):
+        try:
+            shutil.rmtree(staging_dir)
+        except OSError as e:
+            logger.error(f"Failed to delete {staging_dir}. Reason: {e}")
+
+    def publish(self, staging_dir: Path):
+        old_live_dir = self.live_dir
+
+        self._flip(self.live_link, staging_dir)
+        if old_live_dir is not None and old_live_dir != staging_dir:
+            self._flip(self.previous_link, old_live_dir)
+
+        logger.info(f"Publish {staging_dir} => {self.live_link}")
+        self.prune(staging_dir)
+
+    def rollback(self) -> bool:
+        live_dir = self.live_dir
+        previous_dir = self.previous_dir
+        if previous_dir is None:
+            logger.error(f"Rollback failed, {self.previous_link} is not available")
+            return False
+
+        self._flip(self.live_link, previous_dir)
+        if live_dir is not None:
+            self._flip(self.previous_link, live_dir)
+
+        logger.info(f"Rollback {previous_dir} => {self.live_link}")
+        return True
+
+    def prune(self, staging_dir: Path):
+        """remove generations older than staging_dir, which is neither live nor previous
+
+        newer ones may be staged by another process, e.g. without lock()
+        """
+        keep = {self.live_dir, self.previous_dir}
+        for path in self.generations_dir.iterdir():
+            if (
+                not path.is_dir()
+                or path.name >= staging_dir.name
+                or path.resolve() in keep
+            ):
+                continue
+
+            try:
+                shutil.rmtree(path)
+            except OSError as e:
+                logger.error(f"Failed to delete {path}. Reason: {e}")
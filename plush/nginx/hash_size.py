@@ -0,0 +1,305 @@
+"""
+size *_hash_max_size/*_hash_bucket_size by the keys in the generated config
+
+the search is the same as ngx_hash_init() of NGINX(64-bit, 64 bytes cacheline),
+so NGINX finds a table without overflowed bucket, no "could not build optimal ..."
+"""
+
+import re
+from logging import getLogger
+from pathlib import Path
+
+from ..constants import NGINX_HASH_SIZE_DEFAULTS
+from ..tempalte import Template
+from .common import GenerateOneConfAbc
+
+logger = getLogger("plush.nginx")
+
+_POINTER_SIZE = 8
+_CACHELINE_SIZE = 64
+_UINT_MASK = (1 << 64) - 1
+
+# built in keys of ngx_http_proxy_module, with proxy_cache
+NGX_PROXY_SET_HEADERS = [
+    "Host",
+    "Connection",
+    "Content-Length",
+    "Transfer-Encoding",
+    "TE",
+    "Keep-Alive",
+    "Expect",
+    "Upgrade",
+    "If-Modified-Since",
+    "If-Unmodified-Since",
+    "If-None-Match",
+    "If-Match",
+    "Range",
+    "If-Range",
+]
+NGX_PROXY_HIDE_HEADERS = [
+    "Date",
+    "Server",
+    "X-Pad",
+    "X-Accel-Expires",
+    "X-Accel-Redirect",
+    "X-Accel-Limit-Rate",
+    "X-Accel-Buffering",
+    "X-Accel-Charset",
+]
+
+_MAP_PARAMETERS = {"default", "hostnames", "volatile", "include"}
+
+# `COPY docker /app` of Dockerfile, snippets are read from source tree if not installed
+_APP_DIR = "/app/"
+_SOURCE_APP_DIR = Path(__file__).parent.parent.parent.joinpath("docker")
+
+_TOKEN = re.compile(
+    r"""#[^\n]*|"((?:\\.|[^"\\])*)"|'((?:\\.|[^'\\])*)'|([;{}])|([^\s;{}"'#]+)"""
+)
+
+http_hash_conf_template = """# generated by plush, sized for the keys of generated http config
+{%- for name, keys, max_size, bucket_size in tables %}
+
+# {{ keys }} keys
+{{ name }}_max_size {{ max_size }};
+{{ name }}_bucket_size {{ bucket_size }};
+{%- endfor %}
+"""
+
+
+def ngx_hash_key(key: str) -> int:
+    """ngx_hash_key(), key * 31 + c on ngx_uint_t"""
+    value = 0
+    for c in key.encode("utf-8"):
+        value = (value * 31 + c) & _UINT_MASK
+
+    return value
+
+
+def _align(size: int, alignment: int) -> int:
+    return (size + alignment - 1) // alignment * alignment
+
+
+def _elt_size(key: bytes) -> int:
+    """NGX_HASH_ELT_SIZE()"""
+    return _POINTER_SIZE + _align(len(key) + 2, _POINTER_SIZE)
+
+
+def _find_hash_size(
+    elts: list[tuple[int, int]], max_size: int, bucket_size: int
+) -> int | None:
+    """ngx_hash_init(), the first table size without overflowed bucket"""
+    bucket_size -= _POINTER_SIZE
+    start = len(elts) // (bucket_size // (2 * _POINTER_SIZE)) or 1
+    if max_size > 10000 and elts and max_size // len(elts) < 100:
+        start = max_size - 1000
+
+    for size in range(start, max_size + 1):
+        test = [0] * size
+        for key_hash, elt_size in elts:
+            key = key_hash % size
+            test[key] += elt_size
+            if test[key] > bucket_size:
+                break
+        else:
+            return size
+
+    return None
+
+
+def get_hash_size(
+    keys: set[str], default_max_size: int, default_bucket_size: int
+) -> tuple[int, int]:
+    """return (max_size, bucket_size), not less than defaults"""
+    if not keys:
+        return default_max_size, default_bucket_size
+
+    elts = [(ngx_hash_key(key), _elt_size(key.encode("utf-8"))) for key in keys]
+
+    # the longest key must fit in one bucket
+    bucket_size = max(
+        default_bucket_size,
+        _align(max(e[1] for e in elts) + _POINTER_SIZE, _CACHELINE_SIZE),
+    )
+    search_max_size = max(default_max_size, len(elts) * 4)
+    for _ in range(4):
+        size = _find_hash_size(elts, search_max_size, bucket_size)
+        if size is not None:
+            break
+
+        # too many collisions, fewer but larger buckets
+        bucket_size += _CACHELINE_SIZE
+    else:
+        logger.warning(
+            f"Hash table of {len(keys)} keys is not optimal, bucket_size:{bucket_size}"
+        )
+        return search_max_size, bucket_size
+
+    # NGINX searches from about max_size - 1000 for a large max_size
+    max_size = max(default_max_size, _align(size, _CACHELINE_SIZE))
+    if _find_hash_size(elts, max_size, bucket_size) is None:
+        max_size = size
+
+    return max_size, bucket_size
+
+
+class HttpHashKeys:
+    """keys of http level hash tables, scanned from generated config text
+
+    includes with absolute path are followed, as NGINX does at runtime,
+    e.g. /etc/nginx/mime.types and snippets
+    """
+
+    def __init__(self, live_dir: str):
+        self.live_dir = live_dir
+        self._scanned_includes: set[str] = set()
+
+        self.server_names: set[str] = set()
+        # only the longest one matters, wildcard/regex names are not in this hash
+        self.server_names_other: set[str] = set()
+        self.proxy_set_headers: set[str] = {h.lower() for h in NGX_PROXY_SET_HEADERS}
+        self.proxy_hide_headers: set[str] = {h.lower() for h in NGX_PROXY_HIDE_HEADERS}
+        self.types: list[set[str]] = list()
+        self.maps: list[set[str]] = list()
+
+    def scan(self, content: str):
+        blocks: list[str] = list()
+        words: list[str] = list()
+        for match in _TOKEN.finditer(content):
+            double_quoted, single_quoted, punct, word = match.groups()
+            if punct is None:
+                if word is not None:
+                    words.append(word)
+                elif double_quoted is not None:
+                    words.append(double_quoted)
+                elif single_quoted is not None:
+                    words.append(single_quoted)
+                continue
+
+            if punct == "{":
+                block = words[0] if words else ""
+                blocks.append(block)
+                if block == "map":
+                    self.maps.append(set())
+                elif block == "types":
+                    self.types.append(set())
+            elif punct == "}":
+                if blocks:
+                    blocks.pop()
+            elif words and "stream" not in blocks and "mail" not in blocks:
+                self._add_statement(blocks[-1] if blocks else "", words)
+
+            words = list()
+
+    def _add_statement(self, block: str, words: list[str]):
+        name, args = words[0], words[1:]
+        if block == "map":
+            if name not in _MAP_PARAMETERS and not name.startswith("~"):
+                self.maps[-1].add(name)
+        elif block == "types":
+            # `text/html html htm;`, extensions are keys
+            self.types[-1].update(arg.lower() for arg in args)
+        elif name == "server_name":
+            for server_name in args:
+                server_name = server_name.lower()
+                if server_name.startswith(("~", "*", ".")) or server_name.endswith("*"):
+                    self.server_names_other.add(server_name)
+                else:
+                    self.server_names.add(server_name)
+        elif name == "proxy_set_header" and args:
+            self.proxy_set_headers.add(args[0].lower())
+        elif name in ("proxy_hide_header", "proxy_pass_header") and args:
+            self.proxy_hide_headers.add(args[0].lower())
+        elif name.endswith("_types"):
+            self.types.append({arg.lower() for arg in args if arg != "*"})
+        elif name == "include" and args:
+            self._scan_include(args[0])
+
+    def _scan_include(self, path: str):
+        if (
+            not path.startswith("/")
+            or path.startswith(f"{self.live_dir}/")
+            or "*" in path
+            or path in self._scanned_includes
+        ):
+            return
+
+        self._scanned_includes.add(path)
+        include_file = Path(path)
+        if not include_file.exists() and path.startswith(_APP_DIR):
+            include_file = _SOURCE_APP_DIR.joinpath(path.removeprefix(_APP_DIR))
+
+        try:
+            self.scan(include_file.read_text())
+        except OSError:
+            # not installed here, e.g. dev stage
+            logger.debug(f"Include {path} not found, skip")
+
+    def get_tables(self) -> list[tuple[str, int, int, int]]:
+        """[(name, keys, max_size, bucket_size), ...]
+
+        every table is sized by the largest key set using it
+        """
+        tables = list()
+        for name, key_sets, other_keys in (
+            ("server_names_hash", [self.server_names], self.server_names_other),
+            (
+                "proxy_headers_hash",
+                [self.proxy_set_headers, self.proxy_hide_headers],
+                set(),
+            ),
+            ("types_hash", self.types, set()),
+            ("map_hash", self.maps, set()),
+        ):
+            default_max_size, default_bucket_size = NGINX_HASH_SIZE_DEFAULTS[name]
+            if other_keys:
+                default_bucket_size = max(
+                    default_bucket_size,
+                    _align(
+                        max(_elt_size(k.encode("utf-8")) for k in other_keys)
+                        + _POINTER_SIZE,
+                        _CACHELINE_SIZE,
+                    ),
+                )
+
+            max_size, bucket_size = default_max_size, default_bucket_size
+            for keys in key_sets:
+                size = get_hash_size(keys, default_max_size, default_bucket_size)
+                max_size = max(max_size, size[0])
+                bucket_size = max(bucket_size, size[1])
+
+            tables.append(
+                (
+                    name,
+                    max((len(keys) for keys in key_sets), default=0),
+                    max_size,
+                    bucket_size,
+                )
+            )
+
+        return tables
+
+
+class GenerateHttpHashConf(GenerateOneConfAbc):
+    @property
+    def type(self) -> str:
+        return "HttpHash"
+
+    @property
+    def label(self) -> str:
+        return self.type
+
+    def __init__(self, contents: list[str], full_path: Path, live_dir: str):
+        self._init_common(enable=True, name=full_path.stem, base_path=full_path.parent)
+
+        self.contents = contents
+        self.live_dir = live_dir
+
+    def _generate_conf_content(self) -> str:
+        keys = HttpHashKeys(live_dir=self.live_dir)
+        for content in self.contents:
+            keys.scan(content)
+
+        tables = keys.get_tables()
+        logger.debug(f"Hash tables: {tables}")
+        return Template().render(http_hash_conf_template, {"tables": tables})
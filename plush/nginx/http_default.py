@@ -60,8 +60,7 @@ class GenerateHttpDefaultConf(GenerateOneConfAbc):
         http_default: HttpDeafult,
         full_path: Path,
     ):
-        self._init_common(enable=True, name=full_path.name, base_path=full_path)
-        self.full_path = full_path
+        self._init_common(enable=True, name=full_path.stem, base_path=full_path.parent)
 
         self.http_default_listen = http_default.http_default_listen
         self.http_default_listen_ssl = http_default.http_default_listen_ssl
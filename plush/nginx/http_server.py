@@ -1,94 +1,239 @@
 from logging import getLogger
-
-from ..config import HttpServer
-from ..tempalte import Template
-from .common import GenerateOneServerConfAbc
+from pathlib import Path
+
+from ..config import (
+    AccessLogDefault,
+    HttpServer,
+    ProxySettings,
+    SSLCert,
+    StaticProfile,
+)
+from ..constants import PrecompressFormat
+from .access_log import get_access_log_directive
+from .common import GenerateOneServerConfAbc, server_block_ssl, server_block_values
+from .proxy_cache import get_proxy_cache_directives
 
 logger = getLogger("plush.nginx")
 
 
-block_template_websocket = """
-# Enable WebSocket Support
-include /app/nginx/snippets/websocket.conf;"""
-
-block_template_client_max_body_size = """
-# Fix: 413 - Request Entity Too Large
-client_max_body_size {{ client_max_body_size }};"""
-
 # https://www.nginx.com/blog/http-strict-transport-security-hsts-and-nginx/
 block_template_hsts = """
-# Enable HSTS
-add_header Strict-Transport-Security "max-age={{ hsts_max_age }}; includeSubDomains" always;"""  # noqa E501
+{%- if hsts %}
+    # Enable HSTS
+    add_header Strict-Transport-Security "max-age={{ hsts_max_age }}; includeSubDomains" always;
+{%- endif %}"""  # noqa E501
 
+block_template_access_log = """
+{%- if access_log %}
 
-http_conf_template_main_only_http = """
-server {
-    server_name {{ server_name }};
-    {{ listen }}
+    {{ access_log }};
+{%- endif %}"""
 
-    {{ values }}
-    {{ locations }}
-}
-"""
+block_template_proxy_cache = """
+{%- if proxy_cache %}
 
-http_conf_template_main_only_https = """
-server {
-    server_name {{ server_name }};
-    {{ listen_ssl }}
+    # Proxy cache
+{%- for directive in proxy_cache %}
+    {{ directive }};
+{%- endfor %}
+{%- endif %}"""
 
-    {{ values }}
-    {{ block_ssl }}
-    {{ block_hsts }}
-    {{ locations }}
-}
-"""
+block_template_proxy = """
+{%- if proxy %}
+
+    # Proxy buffering/timeouts
+{%- for directive in proxy %}
+    {{ directive }};
+{%- endfor %}
+{%- endif %}"""
 
-http_conf_template_main_http_and_https = """
+block_template_locations = """
+{%- if location_root == "root_path" %}
+
+    location / {
+        root {{ root_path }};
+{%- if static %}
+
+        # Static files
+{%- for directive in static %}
+        {{ directive }};
+{%- endfor %}
+{%- endif %}
+{%- if precompress %}
+
+        # Precompressed siblings, by `plush precompress`
+{%- for directive in precompress %}
+        {{ directive }};
+{%- endfor %}
+{%- endif %}
+    }
+{%- elif location_root == "proxy_pass" %}
+
+    location / {
+{%- if client_max_body_size is not none %}
+        # Fix: 413 - Request Entity Too Large
+        client_max_body_size {{ client_max_body_size }};
+{%- endif %}
+
+        include /app/nginx/snippets/proxy-params.conf;
+{%- if support_websocket %}
+        # Enable WebSocket Support
+        include /app/nginx/snippets/websocket.conf;
+{%- elif upstream_keepalive %}
+        # Reuse keepalive connections of upstream
+        proxy_http_version 1.1;
+        proxy_set_header Connection "";
+{%- endif %}
+
+        proxy_pass {{ proxy_pass }};
+    }
+{%- endif %}
+{%- for location_path, location_directives, location_content in locations %}
+
+    location {{ location_path }} {
+{%- for directive in location_directives %}
+        {{ directive }};
+{%- endfor %}
+        {{ location_content }}
+    }
+{%- endfor %}"""
+
+# one compiled template per server, sub blocks are concatenated into the source
+http_conf_template = (
+    """
+{%- if mode == "http_and_https" %}
 server {
     server_name {{ server_name }};
     {{ listen }}
+{%- if access_log %}
+    {{ access_log }};
+{%- endif %}
 
-    return 301 https://{{ server_name }}$request_uri;
+    return 301 https://{{ redirect_host }}$request_uri;
 }
-
+{% endif %}
 server {
-    {{ listen_ssl }}
     server_name {{ server_name }};
-
-    {{ values }}
-
-    proxy_buffering off; ## Sends data as fast as it can not buffering large chunks.
-
-    {{ block_ssl }}
-    {{ block_hsts }}
-    {{ locations }}
+{%- if mode == "only_http" %}
+    {{ listen }}
+{%- else %}
+    {{ listen_ssl }}
+{%- endif %}
+"""
+    + server_block_values
+    + """
+{%- if mode != "only_http" %}
+"""
+    + server_block_ssl
+    + block_template_hsts
+    + """
+{%- endif %}
+"""
+    + block_template_access_log
+    + block_template_proxy_cache
+    + block_template_proxy
+    + block_template_locations
+    + """
 }
 """
+)
+
+
+def get_proxy_directives(settings: ProxySettings | None) -> list[str]:
+    if settings is None:
+        return []
+
+    result = list()
+    for k in ("buffering", "request_buffering"):
+        v = getattr(settings, k)
+        if v is not None:
+            result.append(f"proxy_{k} {'on' if v else 'off'}")
+    for k in (
+        "buffers",
+        "buffer_size",
+        "busy_buffers_size",
+        "connect_timeout",
+        "read_timeout",
+        "send_timeout",
+    ):
+        v = getattr(settings, k)
+        if v is not None:
+            result.append(f"proxy_{k} {v}")
+
+    return result
+
+
+PRECOMPRESS_STATIC_DIRECTIVES = {
+    PrecompressFormat.GZIP: "gzip_static",
+    PrecompressFormat.BROTLI: "brotli_static",
+    PrecompressFormat.ZSTD: "zstd_static",
+}
 
-block_template_location_root_with_root_path = """
-    location / {
-        root $root_path;
-    }"""
 
-block_template_location_root_with_proxy_pass = """
-    location / {
-        {{ block_client_max_body_size }}
+def get_static_directives(profile: StaticProfile | None) -> list[str]:
+    if profile is None:
+        return []
 
-        include /app/nginx/snippets/proxy-params.conf;
-        {{ block_websocket }}
+    def on_off(v: bool) -> str:
+        return "on" if v else "off"
 
-        proxy_pass $proxy_pass;
-    }"""
+    result = [
+        f"sendfile {on_off(profile.sendfile)}",
+        f"tcp_nopush {on_off(profile.tcp_nopush)}",
+    ]
+    if profile.open_file_cache is None:
+        result.append("open_file_cache off")
+    else:
+        result += [
+            f"open_file_cache {profile.open_file_cache}",
+            f"open_file_cache_valid {profile.open_file_cache_valid}",
+            f"open_file_cache_min_uses {profile.open_file_cache_min_uses}",
+            f"open_file_cache_errors {on_off(profile.open_file_cache_errors)}",
+        ]
+    if profile.aio_threads:
+        result.append("aio threads")
+    if profile.directio is not None:
+        result.append(f"directio {profile.directio}")
+    if profile.expires is not None:
+        result.append(f"expires {profile.expires}")
+    if profile.cache_control is not None:
+        result.append(f'add_header Cache-Control "{profile.cache_control}"')
 
-block_template_location_custom = """
-    location {{ location_path }} {
-        {{ location_content }}
-    }"""
+    return result
+
+
+def get_proxy_pass_host(proxy_pass: str) -> str:
+    """http://upstream_name/path => upstream_name"""
+    return proxy_pass.split("://", 1)[-1].split("/", 1)[0]
 
 
 class GenerateOneHttpServerConf(GenerateOneServerConfAbc):
     server: HttpServer
 
+    def __init__(
+        self,
+        server: HttpServer,
+        ssl_cert: SSLCert,
+        base_path: Path,
+        inline_values: bool = False,
+        keepalive_upstreams: frozenset[str] = frozenset(),
+        precompress_formats: tuple[PrecompressFormat, ...] = (),
+        name: str | None = None,
+        access_log: AccessLogDefault | None = None,
+    ):
+        super().__init__(
+            server=server,
+            ssl_cert=ssl_cert,
+            base_path=base_path,
+            inline_values=inline_values,
+            name=name,
+        )
+
+        # names of http upstream with keepalive
+        self.keepalive_upstreams = keepalive_upstreams
+        self.precompress_formats = precompress_formats
+        self.access_log = access_log
+
     @property
     def type(self) -> str:
         return "HttpServer"
@@ -107,26 +252,34 @@ class GenerateOneHttpServerConf(GenerateOneServerConfAbc):
 
         return "?"
 
+    def get_values_referenced_text(self) -> str:
+        return "\n".join(self.server.location.values())
+
     def _generate_conf_content(self) -> str:
         # httpd location
-        locations_str = ""
+        location_root = None
+        root_path = proxy_pass = None
         if "/" not in self.server.location:
             # create from default template
             if isinstance(self.server.root_path, str):
                 self.update_value(k="root_path", v=self.server.root_path)
-                locations_str = self._generate_location_root_with_root()
+                location_root = "root_path"
+                root_path = self.get_value_ref("root_path")
             elif isinstance(self.server.proxy_pass, str):
                 self.update_value(k="proxy_pass", v=self.server.proxy_pass)
-                locations_str = self._generate_location_root_with_proxy_pass()
+                location_root = "proxy_pass"
+                proxy_pass = self.get_value_ref("proxy_pass")
+                if self.inline_values and "://" not in proxy_pass:
+                    # e.g. upstream name, proxy_pass requires a scheme
+                    proxy_pass = f"http://{proxy_pass}"
             else:
                 logger.error(f"{self.label} miss [root_path] and [proxy_pass]")
                 return ""
 
-        for k, v in self.server.location.items():
-            locations_str += Template().render(
-                block_template_location_custom,
-                {"location_path": k, "location_content": v},
-            )
+        if self.server.static is not None and location_root != "root_path":
+            logger.warning(f"{self.label} [static] is for root_path only, skip")
+        if self.server.precompress and location_root != "root_path":
+            logger.warning(f"{self.label} [precompress] is for root_path only, skip")
 
         # httpd main
         match (
@@ -134,11 +287,11 @@ class GenerateOneHttpServerConf(GenerateOneServerConfAbc):
             isinstance(self.server.listen_ssl, int),
         ):
             case (True, False):
-                template_name = http_conf_template_main_only_http
+                mode = "only_http"
             case (False, True):
-                template_name = http_conf_template_main_only_https
+                mode = "only_https"
             case (True, True):
-                template_name = http_conf_template_main_http_and_https
+                mode = "http_and_https"
             case _:
                 logger.error(f"{self.label} miss [listen] and [listen_ssl]")
                 return ""
@@ -167,53 +320,52 @@ class GenerateOneHttpServerConf(GenerateOneServerConfAbc):
             case _:
                 raise
 
-        if self.server.hsts:
-            block_hsts = Template().render(
-                block_template_hsts,
-                {"hsts_max_age": self.server.hsts_max_age},
-            )
-        else:
-            block_hsts = ""
-
-        result = Template().render(
-            template_name,
-            {
-                "values": self.generate_values_list_str(),
-                "server_name": self.server.server_name,
-                "listen": listen,
-                "listen_ssl": listen_ssl,
-                "block_ssl": self.generate_block_ssl(),
-                "block_hsts": block_hsts,
-                "locations": locations_str,
-            },
-        )
-
-        return result
-
-    def _generate_location_root_with_root(self) -> str:
-        return Template().render(
-            block_template_location_root_with_root_path,
-            {"root_path": self.server.root_path},
-        )
-
-    def _generate_location_root_with_proxy_pass(self) -> str:
-        if self.server.client_max_body_size is None:
-            block_client_max_body_size_str = ""
-        else:
-            block_client_max_body_size_str = Template().render(
-                block_template_client_max_body_size,
-                {"client_max_body_size": self.server.client_max_body_size},
-            )
-
-        if self.server.support_websocket:
-            block_websocket = block_template_websocket
-        else:
-            block_websocket = ""
-
-        return Template().render(
-            block_template_location_root_with_proxy_pass,
-            {
-                "block_websocket": block_websocket,
-                "block_client_max_body_size": block_client_max_body_size_str,
-            },
+        return self.render(
+            http_conf_template,
+            mode=mode,
+            server_name=self.server.server_name,
+            # several names, e.g. merged server
+            redirect_host=(
+                "$host" if " " in self.server.server_name else self.server.server_name
+            ),
+            listen=listen,
+            listen_ssl=listen_ssl,
+            hsts=self.server.hsts,
+            hsts_max_age=self.server.hsts_max_age,
+            location_root=location_root,
+            root_path=root_path,
+            proxy_pass=proxy_pass,
+            locations=[
+                (
+                    path,
+                    get_proxy_cache_directives(
+                        self.server.location_proxy_cache.get(path)
+                    )
+                    + get_proxy_directives(self.server.location_proxy.get(path)),
+                    content,
+                )
+                for path, content in self.server.location.items()
+            ],
+            proxy_cache=get_proxy_cache_directives(self.server.proxy_cache),
+            proxy=get_proxy_directives(self.server.proxy),
+            static=get_static_directives(self.server.static),
+            precompress=(
+                [
+                    f"{PRECOMPRESS_STATIC_DIRECTIVES[fmt]} on"
+                    for fmt in self.precompress_formats
+                ]
+                if self.server.precompress
+                else []
+            ),
+            access_log=(
+                get_access_log_directive(
+                    self.access_log, self.server.access_log, is_http=True
+                )
+                if self.access_log is not None
+                else None
+            ),
+            client_max_body_size=self.server.client_max_body_size,
+            support_websocket=self.server.support_websocket,
+            upstream_keepalive=location_root == "proxy_pass"
+            and get_proxy_pass_host(self.server.proxy_pass) in self.keepalive_upstreams,
         )
@@ -2,40 +2,36 @@ from logging import getLogger
 
 from ..config import MailServer
 from ..constants import NginxMailServerType
-from ..tempalte import Template
-from .common import GenerateOneServerConfAbc
+from .common import GenerateOneServerConfAbc, server_block_ssl
 
 logger = getLogger("plush.nginx")
 
 
-mail_conf_template_ssl = """
+mail_conf_template = (
+    """
 server {
-    listen     {{ server.port }} ssl;
+{%- if type == "ssl" %}
+    listen     {{ port }} ssl;
     protocol   smtp;
     proxy_protocol on;
     xclient    on;
-
-    {{ block_ssl }}
-
-    smtp_auth login plain;
-    auth_http {{ server.auth_http }};
-}
-"""
-
-mail_conf_template_starttls = """
-server {
-    listen    {{ server.port }};
+{%- else %}
+    listen    {{ port }};
     protocol  smtp;
     proxy_protocol on;
     xclient    on;
 
     starttls  on;
-    {{ block_ssl }}
+{%- endif %}
+"""
+    + server_block_ssl
+    + """
 
     smtp_auth login plain;
-    auth_http {{ server.auth_http }};
+    auth_http {{ auth_http }};
 }
 """
+)
 
 
 class GenerateOneMailServerConf(GenerateOneServerConfAbc):
@@ -45,24 +41,28 @@ class GenerateOneMailServerConf(GenerateOneServerConfAbc):
     def type(self) -> str:
         return "MailServer"
 
+    @property
+    def listen_ssl_required(self) -> bool:
+        # ssl or starttls
+        return True
+
     @property
     def label(self) -> str:
         return f"{self.type}: [{self.server.port}] => [{self.server.auth_http}]"
 
     def _generate_conf_content(self) -> str:
         match self.server.type:
-            case NginxMailServerType.SSL:
-                template_name = mail_conf_template_ssl
-            case NginxMailServerType.STARTTLS:
-                template_name = mail_conf_template_starttls
+            case NginxMailServerType.SSL | NginxMailServerType.STARTTLS:
+                pass
             case _:
                 logger.error(
                     f"{self.label}, type: {self.server.type} that is not supported"
                 )
                 return ""
 
-        template = Template()
-        return template.render(
-            template_name,
-            {"server": self.server, "block_ssl": self.generate_block_ssl()},
+        return self.render(
+            mail_conf_template,
+            type=self.server.type.value,
+            port=self.server.port,
+            auth_http=self.server.auth_http,
         )
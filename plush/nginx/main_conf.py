@@ -0,0 +1,269 @@
+from pathlib import Path
+
+from ..config import Config
+from ..tempalte import Template
+from .access_log import get_default_access_log_directive, get_health_check_value
+from .common import GenerateOneConfAbc
+from .sizing import NginxMainSizing, get_nginx_main_sizing
+
+# was docker/nginx/nginx.conf, `nginx -c /data/nginx/live/nginx.conf`
+nginx_main_conf_template = """# generated by plush, sized for cpu:{{ cpu_count }} memory:{{ memory_mb }}MiB servers:{{ server_count }}
+
+#user nginx;  # disable it for non-root user
+
+# Sized from cgroup CPU/memory and fd limit, override by [nginx] in nginx.toml.
+worker_processes {{ worker_processes }};
+{%- if worker_cpu_affinity %}
+worker_cpu_affinity {{ worker_cpu_affinity }};
+{%- endif %}
+
+# Maximum number of open files for worker processes, instead of `ulimit -n`.
+worker_rlimit_nofile {{ worker_rlimit_nofile }};
+
+# Enables the use of JIT for regular expressions to speed-up their processing.
+pcre_jit on;
+
+# Configures default error logger.
+error_log /logs/nginx/error.log warn;
+
+# 进程pid路径, 确保 nginx 有路径的写权限
+pid /run/nginx/nginx.pid;
+
+# Includes files with directives to load dynamic modules.
+include /etc/nginx/modules/*.conf;
+
+# Include files with config snippets into the root context.
+#include /etc/nginx/conf.d/*.conf;
+
+events {
+    # The maximum number of simultaneous connections that can be opened by
+    # a worker process.
+    worker_connections {{ worker_connections }};
+}
+
+http {
+    # Includes mapping of file name extensions to MIME types of responses
+    # and defines the default type.
+    include /etc/nginx/mime.types;
+    default_type application/octet-stream;
+
+    # Name servers used to resolve names of upstream servers into addresses.
+    # It's also needed when using tcpsocket and udpsocket in Lua modules.
+    #resolver 1.1.1.1 1.0.0.1 2606:4700:4700::1111 2606:4700:4700::1001;
+
+    # Don't tell nginx version to the clients. Default is 'on'.
+    server_tokens off;
+
+    # Specifies the maximum accepted body size of a client request, as
+    # indicated by the request header Content-Length. If the stated content
+    # length is greater than this size, then the client receives the HTTP
+    # error code 413. Set to 0 to disable. Default is '1m'.
+    client_max_body_size 1m;
+
+    # Sendfile copies data between one FD and other from within the kernel,
+    # which is more efficient than read() + write(). Default is off.
+    #sendfile on;
+    ## 开启高效传输模式
+    ## Sendfile not used in a proxy environment.
+    sendfile off;
+
+    # Causes nginx to attempt to send its HTTP response head in one packet,
+    # instead of using partial frames. Default is 'off'.
+    ## 激活tcp_nopush参数可以允许把http response header和文件的开始放在一个文件里发布，作用是减少网络报文段的数量
+    tcp_nopush on;
+
+    ## Sends data as fast as it can not buffering large chunks, saves about 200ms per request.
+    ## 激活tcp_nodelay，内核会等待将更多的字节组成一个数据包，从而提高I/O性能
+    tcp_nodelay on;
+
+    ## 为了快速处理静态数据集，例如服务器名称， 映射指令的值，MIME类型，请求头字符串的名称，nginx使用哈希表
+    # Includes *_hash_max_size/*_hash_bucket_size, sized for the generated config.
+    include {{ live_dir }}/http_hash.conf;
+
+    # http://nginx.org/en/docs/http/ngx_http_upstream_module.html#keepalive_time
+    # Limits the maximum time during which requests can be processed through one keepalive connection.
+    # After this time is reached, the connection is closed following the subsequent request processing.
+    #keepalive_time 1h;
+
+    # Sets a timeout during which an idle keepalive connection to an upstream server will stay open.
+    # 设置与上游服务器的空闲 keepalive 连接保持打开的超时。
+    # 默认值为 60s
+    #keepalive_timeout 60s;
+
+    # Enables the specified protocols. Default is TLSv1 TLSv1.1 TLSv1.2.
+    # TIP: If you're not obligated to support ancient clients, remove TLSv1.1.
+    #ssl_protocols TLSv1.1 TLSv1.2 TLSv1.3;
+    ssl_protocols TLSv1.2 TLSv1.3;
+
+    # Path of the file with Diffie-Hellman parameters for EDH ciphers.
+    # TIP: Generate with: `openssl dhparam -out /etc/ssl/nginx/dh2048.pem 2048`
+    #ssl_dhparam /etc/ssl/nginx/dh2048.pem;
+
+    # Specifies that our cipher suits should be preferred over client ciphers.
+    # Default is 'off'.
+    ssl_prefer_server_ciphers on;
+
+    # Enables a shared SSL cache with size that can hold around 8000 sessions.
+    # Default is 'none'.
+    #ssl_session_cache shared:SSL:2m;
+    # 1m ~= 4000 connections
+    ssl_session_cache shared:SSL:{{ ssl_session_cache_size }};
+
+    # Specifies a time during which a client may reuse the session parameters.
+    # Default is '5m'.
+    #ssl_session_timeout 1h;
+    ssl_session_timeout 4h;
+
+    # Disable TLS session tickets (they are insecure). Default is 'on'.
+    ssl_session_tickets off;
+
+    # Compression
+    include /app/nginx/snippets/zstd.conf;
+    include /app/nginx/snippets/brotli.conf;
+    include /app/nginx/snippets/gzip.conf;
+
+    # Helper variable for proxying websockets.
+    map $http_upgrade $connection_upgrade {
+        default upgrade;
+        '' close;
+    }
+
+    # logs
+    log_format main '$remote_addr - $remote_user [$time_local] "$request" '
+            '$status $body_bytes_sent "$http_referer" '
+            '"$http_user_agent" "$http_x_forwarded_for"';
+    log_format timed '$remote_addr - $remote_user [$time_local] "$request" '
+            '$status $body_bytes_sent "$http_referer" '
+            '"$http_user_agent" "$http_x_forwarded_for" '
+            '$host rt=$request_time uct="$upstream_connect_time" '
+            'uht="$upstream_header_time" urt="$upstream_response_time" '
+            'ua="$upstream_addr" us="$upstream_status" rid=$request_id';
+    log_format json escape=json '{"time":"$time_iso8601","remote_addr":"$remote_addr",'
+            '"host":"$host","request":"$request","status":$status,'
+            '"bytes_sent":$bytes_sent,"body_bytes_sent":$body_bytes_sent,'
+            '"request_time":$request_time,"upstream_addr":"$upstream_addr",'
+            '"upstream_status":"$upstream_status",'
+            '"upstream_connect_time":"$upstream_connect_time",'
+            '"upstream_header_time":"$upstream_header_time",'
+            '"upstream_response_time":"$upstream_response_time",'
+            '"request_id":"$request_id","http_referer":"$http_referer",'
+            '"http_user_agent":"$http_user_agent",'
+            '"http_x_forwarded_for":"$http_x_forwarded_for"}';
+{%- if health_check_paths %}
+
+    # Health checks are logged by sampling.
+{%- if health_check_value == "$plush_log_sample" %}
+    split_clients $request_id $plush_log_sample {
+        {{ health_check_sample }} 1;
+        * 0;
+    }
+{%- endif %}
+    map $uri $plush_loggable {
+        default 1;
+{%- for path in health_check_paths %}
+        {{ path }} {{ health_check_value }};
+{%- endfor %}
+    }
+{%- endif %}
+
+    {{ http_access_log }};
+    error_log /logs/nginx/http_error.log warn;
+    error_log /dev/stderr error;
+
+    # Includes proxy_cache_path of generated cache zones.
+    include {{ live_dir }}/http_proxy_cache.conf;
+
+    # Includes virtual hosts/servers configs.
+    include {{ live_dir }}/http_default.conf;
+    include {{ live_dir }}/http_upstream.d/*.conf;
+    include {{ live_dir }}/http_server.d/*.conf;
+}
+
+stream {
+    # from: /etc/nginx/conf.d/stream.conf
+
+    # logs
+    log_format main '$remote_addr [$time_local] '
+            '$protocol $status $bytes_sent $bytes_received '
+            '$session_time "$upstream_addr" '
+            '"$upstream_bytes_sent" "$upstream_bytes_received" "$upstream_connect_time"';
+    log_format timed '$remote_addr [$time_local] '
+            '$protocol $status $bytes_sent $bytes_received '
+            '$session_time "$upstream_addr" '
+            '"$upstream_bytes_sent" "$upstream_bytes_received" "$upstream_connect_time" '
+            '"$upstream_first_byte_time" "$upstream_session_time"';
+    log_format json escape=json '{"time":"$time_iso8601","remote_addr":"$remote_addr",'
+            '"protocol":"$protocol","status":$status,'
+            '"bytes_sent":$bytes_sent,"bytes_received":$bytes_received,'
+            '"session_time":$session_time,"upstream_addr":"$upstream_addr",'
+            '"upstream_connect_time":"$upstream_connect_time",'
+            '"upstream_first_byte_time":"$upstream_first_byte_time",'
+            '"upstream_session_time":"$upstream_session_time"}';
+
+    {{ stream_access_log }};
+    error_log /logs/nginx/stream_error.log warn;
+    error_log /dev/stderr error;
+
+    # Includes servers configs.
+    include {{ live_dir }}/stream_upstream.d/*.conf;
+    include {{ live_dir }}/stream_server.d/*.conf;
+}
+
+mail {
+    # logs
+    error_log /logs/nginx/mail_error.log warn;
+    error_log /dev/stderr error;
+
+    # Includes servers configs.
+    include {{ live_dir }}/mail_server.d/*.conf;
+}
+"""
+
+
+class GenerateNginxMainConf(GenerateOneConfAbc):
+    sizing: NginxMainSizing
+
+    @property
+    def type(self) -> str:
+        return "NginxMain"
+
+    @property
+    def label(self) -> str:
+        return self.type
+
+    def __init__(self, config: Config, full_path: Path, live_dir: str):
+        self._init_common(enable=True, name=full_path.stem, base_path=full_path.parent)
+
+        self.live_dir = live_dir
+        self.access_log = config.access_log
+        # sized in parent process, before render in pool
+        self.sizing = get_nginx_main_sizing(
+            config.nginx,
+            server_count=sum(
+                1
+                for server in config.http_server
+                + config.stream_server
+                + config.mail_server
+                if server.enable
+            ),
+        )
+
+    def _generate_conf_content(self) -> str:
+        return Template().render(
+            nginx_main_conf_template,
+            {
+                "live_dir": self.live_dir,
+                "http_access_log": get_default_access_log_directive(
+                    self.access_log, is_http=True
+                ),
+                "stream_access_log": get_default_access_log_directive(
+                    self.access_log, is_http=False
+                ),
+                "health_check_paths": self.access_log.health_check_paths,
+                "health_check_sample": self.access_log.health_check_sample,
+                "health_check_value": get_health_check_value(
+                    self.access_log.health_check_sample
+                ),
+            }
+            | vars(self.sizing),
+        )
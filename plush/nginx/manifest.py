@@ -0,0 +1,107 @@
+import json
+from hashlib import sha256
+from logging import getLogger
+from pathlib import Path
+
+from ..constants import NGINX_CONF_MANIFEST
+
+logger = getLogger("plush.nginx")
+
+
+def load_manifest(conf_dir: Path) -> dict[str, str]:
+    manifest_file = conf_dir.joinpath(NGINX_CONF_MANIFEST)
+    try:
+        with open(manifest_file) as f:
+            data = json.load(f)
+
+    except FileNotFoundError:
+        return dict()
+    except (OSError, ValueError) as e:
+        logger.warning(f"Load manifest {manifest_file} failed, {e}")
+        return dict()
+
+    if not isinstance(data, dict):
+        return dict()
+
+    return data
+
+
+class ConfManifest:
+    """all generated files of one round, key is the path relative to live_dir"""
+
+    live_dir: Path
+
+    previous: dict[str, str]
+    current: dict[str, str]
+    files: dict[str, str]
+
+    def __init__(self, live_dir: Path):
+        self.live_dir = live_dir
+
+        self.previous = load_manifest(live_dir)
+        self.current = dict()
+        self.files = dict()
+
+    def _key(self, full_path: Path) -> str:
+        return full_path.relative_to(self.live_dir).as_posix()
+
+    @property
+    def changed(self) -> bool:
+        return self.current != self.previous
+
+    @property
+    def written(self) -> list[str]:
+        return [k for k, v in self.current.items() if self.previous.get(k) != v]
+
+    @property
+    def removed(self) -> list[str]:
+        return [k for k in self.previous.keys() if k not in self.current]
+
+    def is_unchanged(self, key: str) -> bool:
+        return self.previous.get(key) == self.current.get(key)
+
+    def add(self, full_path: Path, content: str) -> bool:
+        """add file to this round, return True if content hash changed"""
+        key = self._key(full_path)
+        digest = sha256(content.encode("utf-8")).hexdigest()
+
+        self.current[key] = digest
+        self.files[key] = content
+
+        return self.previous.get(key) != digest
+
+    def consolidate(self, section_dir: Path, file_name: str) -> dict[str, dict]:
+        """merge all files of section_dir into one file, in the same order as
+        nginx's `include *.conf` glob, return the byte range of every merged file
+
+        merged files are kept in current(hash only), so changes are still tracked per file
+        """
+        prefix = f"{self._key(section_dir)}/"
+        consolidated_key = f"{prefix}{file_name}"
+        keys = sorted(
+            k
+            for k in self.files
+            if k.startswith(prefix) and "/" not in k[len(prefix) :]
+        )
+        if not keys:
+            return dict()
+
+        chunks = list()
+        index = dict()
+        offset = 0
+        for key in keys:
+            data = self.files.pop(key).encode("utf-8")
+            index[key] = {
+                "file": consolidated_key,
+                "offset": offset,
+                "length": len(data),
+            }
+
+            chunks.append(data + b"\n")
+            offset += len(data) + 1
+
+        self.add(section_dir.joinpath(file_name), b"".join(chunks).decode("utf-8"))
+        return index
+
+    def dump(self) -> str:
+        return json.dumps(self.current, indent=2, sort_keys=True)
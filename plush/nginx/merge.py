@@ -0,0 +1,121 @@
+import json
+from dataclasses import asdict, dataclass, replace
+from logging import getLogger
+
+from ..config import HttpServer, SSLCert
+from ..constants import (
+    NGINX_SERVER_BLOCK_MEMORY,
+    NGINX_SSL_CONTEXT_LOAD_MS,
+    NGINX_SSL_CONTEXT_MEMORY,
+)
+
+logger = getLogger("plush.nginx")
+
+
+@dataclass
+class ServerMergeReport:
+    servers: int = 0
+    blocks_before: int = 0
+    blocks_after: int = 0
+    ssl_contexts_before: int = 0
+    ssl_contexts_after: int = 0
+
+    @staticmethod
+    def count(server: HttpServer) -> tuple[int, int]:
+        """(server blocks, SSL contexts), http_and_https has a redirect block"""
+        blocks = 2 if server.listen is not None and server.listen_ssl else 1
+        return blocks, 1 if server.listen_ssl else 0
+
+    def add_before(self, server: HttpServer):
+        blocks, ssl_contexts = self.count(server)
+        self.servers += 1
+        self.blocks_before += blocks
+        self.ssl_contexts_before += ssl_contexts
+
+    def add_after(self, server: HttpServer):
+        blocks, ssl_contexts = self.count(server)
+        self.blocks_after += blocks
+        self.ssl_contexts_after += ssl_contexts
+
+    @property
+    def memory_saved(self) -> int:
+        """bytes, rough, per NGINX process"""
+        return (self.blocks_before - self.blocks_after) * NGINX_SERVER_BLOCK_MEMORY + (
+            self.ssl_contexts_before - self.ssl_contexts_after
+        ) * NGINX_SSL_CONTEXT_MEMORY
+
+    @property
+    def reload_ms_saved(self) -> float:
+        """rough, certificates are loaded once per server block on every reload"""
+        return (
+            self.ssl_contexts_before - self.ssl_contexts_after
+        ) * NGINX_SSL_CONTEXT_LOAD_MS
+
+    def __str__(self) -> str:
+        return (
+            f"servers: {self.servers}"
+            f", server blocks: {self.blocks_before} => {self.blocks_after}"
+            f", SSL contexts: {self.ssl_contexts_before} => {self.ssl_contexts_after}"
+            f", saved ~{self.memory_saved / 1024:.0f}KiB memory per process"
+            f", ~{self.reload_ms_saved:.0f}ms per reload"
+        )
+
+
+def get_merge_key(server: HttpServer, ssl_cert: SSLCert) -> str:
+    """everything except server_name, the cert by resolved path"""
+    data = asdict(server)
+    del data["server_name"]
+    data["ssl_cert_domain"] = (
+        str(ssl_cert.get_pem_file_base_path(server.ssl_cert_domain))
+        if server.listen_ssl
+        else None
+    )
+    # keep the order of location, regex locations are matched in order
+    return json.dumps(data, default=str)
+
+
+def merge_http_servers(
+    servers: list[HttpServer], ssl_cert: SSLCert
+) -> tuple[list[tuple[str, HttpServer]], ServerMergeReport]:
+    """group enabled servers with the same effective config into one server block
+
+    return [(name, server), ...] in the order of first member, name of a merged
+    server is the name of its first member
+    """
+    report = ServerMergeReport()
+    groups: dict[str, list[HttpServer]] = dict()
+    result: list[tuple[str, list[HttpServer]]] = list()
+    for server in servers:
+        if not server.enable or not server.server_name:
+            result.append((server.name, [server]))
+            continue
+
+        report.add_before(server)
+        key = get_merge_key(server, ssl_cert)
+        if key in groups:
+            groups[key].append(server)
+            continue
+
+        groups[key] = [server]
+        result.append((server.name, groups[key]))
+
+    merged_servers = list()
+    for name, members in result:
+        if len(members) == 1:
+            server = members[0]
+        else:
+            server_names = list()
+            for member in members:
+                for server_name in member.server_name.split():
+                    if server_name not in server_names:
+                        server_names.append(server_name)
+
+            server = replace(members[0], server_name=" ".join(server_names))
+            logger.debug(f"Merge {len(members)} servers into {name}: {server_names}")
+
+        if server.enable and server.server_name:
+            report.add_after(server)
+        merged_servers.append((name, server))
+
+    logger.info(f"Merge http servers, {report}")
+    return merged_servers, report
@@ -0,0 +1,66 @@
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from logging import LogRecord, getLogger
+
+from .common import GenerateOneConfAbc
+
+logger = getLogger("plush.nginx")
+
+
+class _RecordCollector(logging.Handler):
+    def __init__(self):
+        super().__init__(level=logging.DEBUG)
+        self.records: list[LogRecord] = list()
+
+    def emit(self, record: LogRecord):
+        # make it picklable
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        self.records.append(record)
+
+
+def _init_worker(level: int):
+    getLogger("plush").setLevel(level)
+
+
+def _render_one(generator: GenerateOneConfAbc) -> tuple[str, list[LogRecord]]:
+    """run in worker process, log records are sent back and emitted by parent"""
+    plush_logger = getLogger("plush")
+    collector = _RecordCollector()
+    propagate = plush_logger.propagate
+
+    plush_logger.addHandler(collector)
+    plush_logger.propagate = False
+    try:
+        content = generator._generate_conf_content()
+    finally:
+        plush_logger.removeHandler(collector)
+        plush_logger.propagate = propagate
+
+    return content, collector.records
+
+
+def render_all(generators: list[GenerateOneConfAbc], jobs: int) -> list[str]:
+    """render in a process pool, result/log order is same as the serial path"""
+    if jobs <= 1 or len(generators) <= 1:
+        return [generator._generate_conf_content() for generator in generators]
+
+    chunksize = max(1, len(generators) // (jobs * 4))
+    result = list()
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        initializer=_init_worker,
+        initargs=(logger.getEffectiveLevel(),),
+    ) as executor:
+        for content, records in executor.map(
+            _render_one, generators, chunksize=chunksize
+        ):
+            for record in records:
+                record_logger = getLogger(record.name)
+                if record_logger.isEnabledFor(record.levelno):
+                    record_logger.handle(record)
+
+            result.append(content)
+
+    return result
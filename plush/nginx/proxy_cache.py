@@ -0,0 +1,119 @@
+from pathlib import Path
+
+from ..config import ProxyCache, ProxyCacheZone
+from ..constants import NGINX_PROXY_CACHE_DIR, ProxyCachePreset
+from ..tempalte import Template
+from .common import GenerateOneConfAbc
+
+# fields of ProxyCache, explicit value in nginx.toml wins
+proxy_cache_presets = {
+    ProxyCachePreset.MICROCACHE: {
+        "zone": ProxyCachePreset.MICROCACHE.value,
+        "valid": ["200 301 302 1s"],
+        "use_stale": "updating error timeout http_500 http_502 http_503 http_504",
+        "lock": True,
+        "background_update": True,
+    },
+}
+
+# zone created for presets which are not declared in [[proxy_cache_zone]]
+proxy_cache_preset_zones = {
+    ProxyCachePreset.MICROCACHE: ProxyCacheZone(
+        name=ProxyCachePreset.MICROCACHE.value,
+        keys_zone_size="10m",
+        max_size="1g",
+        inactive="10m",
+    ),
+}
+
+http_proxy_cache_conf_template = """# proxy_cache_path, included in http {}
+{%- for directive in directives %}
+{{ directive }};
+{%- endfor %}
+"""
+
+
+def get_proxy_cache_zone_directive(zone: ProxyCacheZone) -> str:
+    path = zone.path or Path(NGINX_PROXY_CACHE_DIR).joinpath(zone.name).as_posix()
+    result = (
+        f"proxy_cache_path {path} levels={zone.levels}"
+        f" keys_zone={zone.name}:{zone.keys_zone_size}"
+    )
+    if zone.max_size is not None:
+        result += f" max_size={zone.max_size}"
+    if zone.inactive is not None:
+        result += f" inactive={zone.inactive}"
+    result += f" use_temp_path={'on' if zone.use_temp_path else 'off'}"
+
+    return result
+
+
+def get_proxy_cache_directives(cache: ProxyCache | None) -> list[str]:
+    if cache is None:
+        return []
+
+    values = dict(proxy_cache_presets.get(cache.preset, {}))
+    for k in ("zone", "valid", "use_stale", "lock", "background_update"):
+        v = getattr(cache, k)
+        if v is not None:
+            values[k] = v
+
+    if not values.get("zone"):
+        return []
+
+    result = [f"proxy_cache {values['zone']}"]
+    for valid in values.get("valid") or []:
+        result.append(f"proxy_cache_valid {valid}")
+    if values.get("use_stale"):
+        result.append(f"proxy_cache_use_stale {values['use_stale']}")
+    if values.get("lock") is not None:
+        result.append(f"proxy_cache_lock {'on' if values['lock'] else 'off'}")
+    if values.get("background_update") is not None:
+        result.append(
+            f"proxy_cache_background_update {'on' if values['background_update'] else 'off'}"
+        )
+
+    return result
+
+
+def get_proxy_cache_zones(
+    zones: list[ProxyCacheZone], caches: list[ProxyCache]
+) -> list[ProxyCacheZone]:
+    """declared zones, and zones of presets in use"""
+    result = list(zones)
+    names = {zone.name for zone in zones}
+    for cache in caches:
+        if cache.zone is not None or cache.preset not in proxy_cache_preset_zones:
+            continue
+
+        zone = proxy_cache_preset_zones[cache.preset]
+        if zone.name not in names:
+            result.append(zone)
+            names.add(zone.name)
+
+    return result
+
+
+class GenerateHttpProxyCacheConf(GenerateOneConfAbc):
+    @property
+    def type(self) -> str:
+        return "HttpProxyCache"
+
+    @property
+    def label(self) -> str:
+        return self.type
+
+    def __init__(self, zones: list[ProxyCacheZone], full_path: Path):
+        self._init_common(enable=True, name=full_path.stem, base_path=full_path.parent)
+
+        self.zones = zones
+
+    def _generate_conf_content(self) -> str:
+        return Template().render(
+            http_proxy_cache_conf_template,
+            {
+                "directives": [
+                    get_proxy_cache_zone_directive(zone) for zone in self.zones
+                ]
+            },
+        )
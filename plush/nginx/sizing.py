@@ -0,0 +1,172 @@
+"""
+size nginx.conf from the resources the container really has
+
+- cgroup v2: /sys/fs/cgroup/cpu.max, /sys/fs/cgroup/memory.max
+- cgroup v1: cpu.cfs_quota_us/cpu.cfs_period_us, memory.limit_in_bytes
+- cpuset: affinity mask of this process, e.g. `docker run --cpuset-cpus`
+"""
+
+import math
+import os
+import resource
+from dataclasses import dataclass
+from pathlib import Path
+
+from ..config import NginxMain
+from ..constants import (
+    NGINX_CONNECTION_MEMORY,
+    NGINX_RLIMIT_NOFILE_MAX,
+    NGINX_SSL_SESSION_CACHE_MIN_MB,
+    NGINX_WORKER_CONNECTIONS_MAX,
+    NGINX_WORKER_CONNECTIONS_MIN,
+)
+
+_CGROUP_DIR = Path("/sys/fs/cgroup")
+
+# 1m of ssl_session_cache holds about 4000 sessions
+_SSL_SESSIONS_PER_MB = 4000
+
+
+def _read_int(path: Path) -> int | None:
+    try:
+        value = path.read_text().strip()
+    except OSError:
+        return None
+
+    if not value.isdigit():
+        # "max", "-1"
+        return None
+
+    return int(value)
+
+
+def get_cpu_count() -> int:
+    """CPUs we may run on, limited by cgroup quota"""
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = os.cpu_count() or 1
+
+    quota = period = None
+    try:
+        # cgroup v2, "max 100000" or "200000 100000"
+        quota_str, period_str = _CGROUP_DIR.joinpath("cpu.max").read_text().split()
+        if quota_str != "max":
+            quota, period = int(quota_str), int(period_str)
+    except (OSError, ValueError):
+        quota = _read_int(_CGROUP_DIR.joinpath("cpu", "cpu.cfs_quota_us"))
+        period = _read_int(_CGROUP_DIR.joinpath("cpu", "cpu.cfs_period_us"))
+
+    if quota and period:
+        count = min(count, math.ceil(quota / period))
+
+    return max(1, count)
+
+
+def get_cpuset_count() -> int | None:
+    """CPUs of an explicit cpuset, None if we may run on every CPU of the host"""
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        return None
+
+    if count >= (os.cpu_count() or 1):
+        return None
+
+    return count
+
+
+def get_memory_bytes() -> int:
+    """memory limit of cgroup, or total memory"""
+    for path in (
+        _CGROUP_DIR.joinpath("memory.max"),
+        _CGROUP_DIR.joinpath("memory", "memory.limit_in_bytes"),
+    ):
+        value = _read_int(path)
+        # v1 reports a huge number when unlimited
+        if value is not None and value < 1 << 60:
+            return value
+
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+
+
+def get_nofile_limit() -> int:
+    _, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY:
+        return NGINX_RLIMIT_NOFILE_MAX
+
+    return min(hard, NGINX_RLIMIT_NOFILE_MAX)
+
+
+@dataclass
+class NginxMainSizing:
+    worker_processes: int | str
+    worker_cpu_affinity: str | None
+    worker_connections: int
+    worker_rlimit_nofile: int
+    ssl_session_cache_size: str
+
+    # inputs, written into nginx.conf as comment
+    cpu_count: int
+    memory_mb: int
+    server_count: int
+
+
+def get_nginx_main_sizing(nginx: NginxMain, server_count: int) -> NginxMainSizing:
+    """explicit values in nginx.toml win"""
+    cpu_count = get_cpu_count()
+    memory_bytes = get_memory_bytes()
+
+    worker_processes = nginx.worker_processes or cpu_count
+    cpuset_count = get_cpuset_count()
+    if nginx.worker_cpu_affinity is not None:
+        worker_cpu_affinity = nginx.worker_cpu_affinity or None
+    elif cpuset_count is not None and worker_processes == cpuset_count == cpu_count:
+        # one worker per CPU of the cpuset, not cut by quota, pin them, the
+        # host's CPUs are shared with everything else, leave those to the kernel
+        worker_cpu_affinity = "auto"
+    else:
+        worker_cpu_affinity = None
+
+    worker_rlimit_nofile = nginx.worker_rlimit_nofile or get_nofile_limit()
+
+    if nginx.worker_connections:
+        worker_connections = nginx.worker_connections
+    else:
+        workers = worker_processes if isinstance(worker_processes, int) else cpu_count
+        # a proxied connection uses 2 fds, client and upstream
+        by_nofile = worker_rlimit_nofile // 2
+        by_memory = memory_bytes // workers // NGINX_CONNECTION_MEMORY
+        worker_connections = min(
+            max(
+                min(by_nofile, by_memory),
+                NGINX_WORKER_CONNECTIONS_MIN,
+                # at least a few connections per configured server
+                server_count * 4,
+            ),
+            by_nofile,
+            NGINX_WORKER_CONNECTIONS_MAX,
+        )
+
+    if nginx.ssl_session_cache_size:
+        ssl_session_cache_size = nginx.ssl_session_cache_size
+    else:
+        workers = worker_processes if isinstance(worker_processes, int) else cpu_count
+        # room for 2 sessions per connection, no more than 1/64 of memory
+        sessions = workers * worker_connections * 2
+        size_mb = min(
+            math.ceil(sessions / _SSL_SESSIONS_PER_MB),
+            memory_bytes // (1 << 20) // 64,
+        )
+        ssl_session_cache_size = f"{max(size_mb, NGINX_SSL_SESSION_CACHE_MIN_MB)}m"
+
+    return NginxMainSizing(
+        worker_processes=worker_processes,
+        worker_cpu_affinity=worker_cpu_affinity,
+        worker_connections=worker_connections,
+        worker_rlimit_nofile=worker_rlimit_nofile,
+        ssl_session_cache_size=ssl_session_cache_size,
+        cpu_count=cpu_count,
+        memory_mb=memory_bytes // (1 << 20),
+        server_count=server_count,
+    )
@@ -1,39 +1,70 @@
 from logging import getLogger
+from pathlib import Path
 
-from ..config import StreamServer
-from ..tempalte import Template
-from .common import GenerateOneServerConfAbc
+from ..config import AccessLogDefault, SSLCert, StreamServer
+from .access_log import get_access_log_directive
+from .common import GenerateOneServerConfAbc, server_block_ssl, server_block_values
 
 logger = getLogger(__name__)
-stream_conf_template_main_no_ssl = """
+stream_conf_template = (
+    """
+{%- if listen is not none %}
 server {
     # {{ comment }}
     listen {{ listen }}; listen [::]:{{ listen }};
-
-    {{ values }}
+{%- if access_log %}
+    {{ access_log }};
+{%- endif %}
+"""
+    + server_block_values
+    + """
 
     proxy_pass {{ proxy_pass }};
 }
-"""
-
-stream_conf_template_main_only_ssl = """
+{%- endif %}
+{%- if listen_ssl is not none %}
 server {
     # {{ comment }}
     listen {{ listen_ssl }} ssl; listen [::]:{{ listen_ssl }} ssl;
-
-    {{ values }}
+{%- if access_log %}
+    {{ access_log }};
+{%- endif %}
+"""
+    + server_block_values
+    + """
 
     proxy_ssl on;
-    {{ block_ssl }}
+"""
+    + server_block_ssl
+    + """
 
     proxy_pass {{ proxy_pass }};
 }
+{%- endif %}
 """
+)
 
 
 class GenerateOneStreamServerConf(GenerateOneServerConfAbc):
     server: StreamServer
 
+    def __init__(
+        self,
+        server: StreamServer,
+        ssl_cert: SSLCert,
+        base_path: Path,
+        inline_values: bool = False,
+        access_log: AccessLogDefault | None = None,
+    ):
+        super().__init__(
+            server=server,
+            ssl_cert=ssl_cert,
+            base_path=base_path,
+            inline_values=inline_values,
+        )
+
+        self.access_log = access_log
+
     @property
     def type(self) -> str:
         return "StreamServer"
@@ -43,35 +74,24 @@ class GenerateOneStreamServerConf(GenerateOneServerConfAbc):
         return f"{self.type}: [{self.server.proxy_pass}]"
 
     def _generate_conf_content(self) -> str:
-        result = ""
-        if isinstance(self.server.listen, int):
-            template = Template()
-            result += template.render(
-                stream_conf_template_main_no_ssl,
-                {
-                    "comment": self.server.comment,
-                    "values": self.generate_values_list_str(),
-                    "listen": self.server.listen,
-                    "proxy_pass": self.server.proxy_pass,
-                },
-            )
-
-        if isinstance(self.server.listen_ssl, int):
-            block_ssl_str = self.generate_block_ssl()
-            if block_ssl_str is None:
-                logger.error(f"{self.label} miss [ssl_cert_domain]")
-                return ""
-
-            template = Template()
-            result += template.render(
-                stream_conf_template_main_only_ssl,
-                {
-                    "comment": self.server.comment,
-                    "values": self.generate_values_list_str(),
-                    "listen_ssl": self.server.listen_ssl,
-                    "block_ssl": block_ssl_str,
-                    "proxy_pass": self.server.proxy_pass,
-                },
-            )
-
-        return result
+        if (
+            isinstance(self.server.listen_ssl, int)
+            and self.get_ssl_pem_file_base_path() is None
+        ):
+            logger.error(f"{self.label} miss [ssl_cert_domain]")
+            return ""
+
+        return self.render(
+            stream_conf_template,
+            comment=self.server.comment,
+            listen=self.server.listen,
+            listen_ssl=self.server.listen_ssl,
+            proxy_pass=self.server.proxy_pass,
+            access_log=(
+                get_access_log_directive(
+                    self.access_log, self.server.access_log, is_http=False
+                )
+                if self.access_log is not None
+                else None
+            ),
+        )
@@ -1,13 +1,55 @@
+import re
+from logging import getLogger
 from pathlib import Path
 
-from ..config import Upstream
+from ..config import Upstream, UpstreamServer
 from ..tempalte import Template
 from .common import GenerateOneConfAbc
 
+logger = getLogger("plush.nginx")
+
+# keepalive after raw content, NGINX requires a balancer(`least_conn;`, `hash ...;`)
+# in raw content before keepalive, or the keepalive pool is silently dropped
 upstream_conf_tempalte = """upstream {{ upstream_name }} {
+{%- for directive in directives %}
+    {{ directive }};
+{%- endfor %}
+{%- if upstream_content or not (directives or keepalive_directives) %}
     {{ upstream_content }}
+{%- endif %}
+{%- for directive in keepalive_directives %}
+    {{ directive }};
+{%- endfor %}
 }"""
 
+_KEEPALIVE_DIRECTIVE = re.compile(r"(?:^|[;{\s])keepalive\s+\d+\s*;")
+
+
+def has_keepalive(upstream: Upstream) -> bool:
+    """http upstream with a keepalive pool, structured or in raw content"""
+    if not upstream.enable:
+        return False
+
+    return bool(upstream.keepalive) or bool(
+        _KEEPALIVE_DIRECTIVE.search(upstream.content)
+    )
+
+
+def get_upstream_server_directive(server: UpstreamServer) -> str:
+    result = f"server {server.address}"
+    if server.weight is not None:
+        result += f" weight={server.weight}"
+    if server.max_fails is not None:
+        result += f" max_fails={server.max_fails}"
+    if server.fail_timeout is not None:
+        result += f" fail_timeout={server.fail_timeout}"
+    if server.backup:
+        result += " backup"
+    if server.down:
+        result += " down"
+
+    return result
+
 
 class GenerateOneUpstreamConf(GenerateOneConfAbc):
     @property
@@ -18,12 +60,46 @@ class GenerateOneUpstreamConf(GenerateOneConfAbc):
     def label(self) -> str:
         return self.name
 
-    def __init__(self, upstream: Upstream, base_path: Path):
+    def __init__(self, upstream: Upstream, base_path: Path, is_http: bool = True):
         self._init_common(
             enable=upstream.enable, name=upstream.name, base_path=base_path
         )
 
         self.upstream = upstream
+        self.is_http = is_http
+
+    def get_directives(self) -> list[str]:
+        """balance/zone/servers, before raw content"""
+        upstream = self.upstream
+
+        directives = list()
+        if upstream.balance:
+            directives.append(upstream.balance)
+        if upstream.zone:
+            directives.append(f"zone {upstream.name} {upstream.zone}")
+        for server in upstream.servers:
+            directives.append(get_upstream_server_directive(server))
+
+        return directives
+
+    def get_keepalive_directives(self) -> list[str]:
+        """keepalive*, after raw content"""
+        upstream = self.upstream
+
+        keepalive = [
+            (k, v)
+            for k, v in (
+                ("keepalive", upstream.keepalive),
+                ("keepalive_requests", upstream.keepalive_requests),
+                ("keepalive_timeout", upstream.keepalive_timeout),
+            )
+            if v is not None
+        ]
+        if keepalive and not self.is_http:
+            logger.warning(f" {self.label} keepalive is for http upstream only, skip")
+            return []
+
+        return [f"{k} {v}" for k, v in keepalive]
 
     def _generate_conf_content(self) -> str:
         return Template().render(
@@ -31,5 +107,7 @@ class GenerateOneUpstreamConf(GenerateOneConfAbc):
             {
                 "upstream_name": self.upstream.name,
                 "upstream_content": self.upstream.content,
+                "directives": self.get_directives(),
+                "keepalive_directives": self.get_keepalive_directives(),
             },
         )
@@ -0,0 +1,67 @@
+import subprocess
+from logging import getLogger
+from pathlib import Path
+
+from ..constants import (
+    NGINX_BIN,
+    NGINX_HTTP_HASH_CONF,
+    NGINX_MAIN_CONF,
+    NGINX_MAIN_CONF_NAME,
+    NGINX_VALIDATE_TIMEOUT,
+)
+
+logger = getLogger("plush.nginx")
+
+
+def validate_staged_tree(staging_dir: Path, live_dir: str) -> bool:
+    """`nginx -t` with a temporary copy of staged nginx.conf, which includes staging_dir instead of live_dir
+
+    return True if passed, or skipped because NGINX is not installed
+    """
+    nginx_bin = Path(NGINX_BIN)
+    main_conf = staging_dir.joinpath(NGINX_MAIN_CONF_NAME)
+    if not main_conf.exists():
+        main_conf = Path(NGINX_MAIN_CONF)
+    if not nginx_bin.exists() or not main_conf.exists():
+        logger.warning(f"{NGINX_BIN} or {main_conf} not found, skip validate")
+        return True
+
+    content = main_conf.read_text()
+    if f"{live_dir}/" not in content:
+        logger.warning(f"{main_conf} does not include {live_dir}/")
+
+    # keep it out of staging_dir, it is not part of the generation
+    tmp_conf = staging_dir.with_name(f".{staging_dir.name}.nginx.conf")
+    tmp_conf.write_text(content.replace(f"{live_dir}/", f"{staging_dir}/"))
+    try:
+        result = subprocess.run(
+            [nginx_bin, "-t", "-q", "-e", "stderr", "-c", tmp_conf],
+            capture_output=True,
+            timeout=NGINX_VALIDATE_TIMEOUT,
+        )
+
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.error(f"Validate {staging_dir} failed, {e}")
+        return False
+
+    finally:
+        tmp_conf.unlink(missing_ok=True)
+
+    output = result.stderr.decode("utf-8").strip()
+    if result.returncode != 0:
+        logger.error(
+            f"Validate {staging_dir} failed, returncode:{result.returncode}, {output}"
+        )
+        return False
+
+    if output:
+        logger.warning(f"Validate {staging_dir}: {output}")
+    if "could not build" in output:
+        # NGINX does not agree with the sizes of http_hash.conf
+        logger.error(
+            f"Validate {staging_dir}: NGINX could not build a hash table"
+            f" with the sizes of {NGINX_HTTP_HASH_CONF}"
+        )
+
+    logger.info(f"Validate {staging_dir} passed")
+    return True
@@ -0,0 +1,301 @@
+"""
+precompressed siblings for static roots, served by gzip_static/brotli_static/zstd_static
+
+- gzip: stdlib
+- zstd: stdlib `compression.zstd`, Python 3.14+
+- br: optional `brotli` package
+"""
+
+import gzip
+import json
+import mimetypes
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from logging import getLogger
+from pathlib import Path
+
+from .config import Config
+from .constants import (
+    PRECOMPRESS_LEVELS,
+    PRECOMPRESS_MAX_RATIO,
+    PRECOMPRESS_STATE_FILE,
+    PRECOMPRESS_SUFFIXES,
+    PRECOMPRESS_TYPES,
+    PrecompressFormat,
+)
+from .deploy_stage import get_file_path
+
+logger = getLogger(__name__)
+
+# written by precompress, not sources
+SIBLING_SUFFIXES = tuple(PRECOMPRESS_SUFFIXES.values()) + (".tmp",)
+
+
+def _compress_gzip(data: bytes) -> bytes:
+    # mtime=0, same input same output
+    return gzip.compress(
+        data, compresslevel=PRECOMPRESS_LEVELS[PrecompressFormat.GZIP], mtime=0
+    )
+
+
+def _compress_brotli(data: bytes) -> bytes:
+    import brotli
+
+    return brotli.compress(data, quality=PRECOMPRESS_LEVELS[PrecompressFormat.BROTLI])
+
+
+def _compress_zstd(data: bytes) -> bytes:
+    from compression import zstd
+
+    return zstd.compress(data, level=PRECOMPRESS_LEVELS[PrecompressFormat.ZSTD])
+
+
+_COMPRESSORS = {
+    PrecompressFormat.GZIP: _compress_gzip,
+    PrecompressFormat.BROTLI: _compress_brotli,
+    PrecompressFormat.ZSTD: _compress_zstd,
+}
+
+
+def get_available_formats(formats: list[PrecompressFormat]) -> list[PrecompressFormat]:
+    """formats with an encoder in this runtime, e.g. zstd needs Python 3.14+"""
+    result = list()
+    for fmt in formats:
+        try:
+            _COMPRESSORS[fmt](b"")
+        except ImportError as e:
+            logger.warning(f"Precompress {fmt.value} is not available, skip, {e}")
+            continue
+
+        result.append(fmt)
+
+    return result
+
+
+def is_compressible(path: Path) -> bool:
+    mime_type, encoding = mimetypes.guess_type(path.name)
+    if mime_type is None or encoding is not None:
+        return False
+
+    return mime_type.startswith("text/") or mime_type in PRECOMPRESS_TYPES
+
+
+def get_precompress_formats(config: Config) -> list[PrecompressFormat]:
+    """available formats, [] if no server has precompress = true"""
+    if not get_precompress_roots(config):
+        return []
+
+    return get_available_formats(config.precompress.formats)
+
+
+def get_precompress_roots(config: Config) -> list[Path]:
+    return sorted(
+        {
+            Path(server.root_path)
+            for server in config.http_server
+            if server.enable and server.precompress and server.root_path
+        }
+    )
+
+
+def _precompress_one(
+    path: str, formats: list[PrecompressFormat], mtime_ns: int
+) -> dict[str, int | None] | None:
+    """run in worker process, return compressed size, None if not worth it
+
+    return None if failed, it is retried next time
+    """
+    try:
+        return _precompress_one_file(path, formats, mtime_ns)
+    except OSError as e:
+        logger.warning(f"Precompress {path} failed, {e}")
+        return None
+
+
+def _precompress_one_file(
+    path: str, formats: list[PrecompressFormat], mtime_ns: int
+) -> dict[str, int | None]:
+    with open(path, "rb") as f:
+        data = f.read()
+
+    result = dict()
+    for fmt in formats:
+        compressed = _COMPRESSORS[fmt](data)
+        sibling = f"{path}{PRECOMPRESS_SUFFIXES[fmt]}"
+        if len(compressed) >= len(data) * PRECOMPRESS_MAX_RATIO:
+            Path(sibling).unlink(missing_ok=True)
+            result[fmt.value] = None
+            continue
+
+        tmp_sibling = f"{sibling}.tmp"
+        with open(tmp_sibling, "wb") as f:
+            f.write(compressed)
+        # same mtime as source, for Last-Modified/ETag
+        os.utime(tmp_sibling, ns=(mtime_ns, mtime_ns))
+        os.replace(tmp_sibling, sibling)
+
+        result[fmt.value] = len(compressed)
+
+    return result
+
+
+class Precompressor:
+    """incremental by source mtime/size, state is saved in PRECOMPRESS_STATE_FILE"""
+
+    def __init__(
+        self,
+        roots: list[Path],
+        formats: list[PrecompressFormat],
+        min_size: int,
+        jobs: int,
+        state_file: str | Path = PRECOMPRESS_STATE_FILE,
+    ):
+        self.roots = roots
+        self.formats = get_available_formats(formats)
+        self.min_size = min_size
+        self.jobs = jobs
+        self.state_file = get_file_path(state_file)
+
+        self.stats = {
+            "scanned": 0,
+            "unchanged": 0,
+            "skipped_type": 0,
+            "skipped_size": 0,
+            "compressed": 0,
+            "removed": 0,
+            "failed": 0,
+            "bytes_in": 0,
+            "bytes_out": {fmt.value: 0 for fmt in self.formats},
+            "seconds": 0.0,
+        }
+
+    def _load_state(self) -> dict[str, list[int]]:
+        try:
+            with open(self.state_file) as f:
+                data = json.load(f)
+
+        except FileNotFoundError:
+            return dict()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Load {self.state_file} failed, {e}")
+            return dict()
+
+        files = data.get("files") if isinstance(data, dict) else None
+        if not isinstance(files, dict) or data.get("formats") != [
+            fmt.value for fmt in self.formats
+        ]:
+            # formats changed, redo all
+            return dict()
+
+        return files
+
+    def _save_state(self, files: dict[str, list[int]]):
+        self.state_file.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = self.state_file.with_name(f".{self.state_file.name}.tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(
+                {
+                    "formats": [fmt.value for fmt in self.formats],
+                    "stats": self.stats,
+                    "files": files,
+                },
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+
+        tmp_file.replace(self.state_file)
+
+    def _scan(self) -> dict[str, list[int]]:
+        """source files, value is [mtime_ns, size]"""
+        result = dict()
+        for root in self.roots:
+            if not root.is_dir():
+                logger.warning(f"Precompress root {root} is not a dir, skip")
+                continue
+
+            for dir_path, _, file_names in os.walk(root):
+                for file_name in file_names:
+                    if file_name.endswith(SIBLING_SUFFIXES):
+                        continue
+
+                    self.stats["scanned"] += 1
+                    path = Path(dir_path).joinpath(file_name)
+                    if not is_compressible(path):
+                        self.stats["skipped_type"] += 1
+                        continue
+
+                    try:
+                        stat = path.stat()
+                    except OSError:
+                        continue
+
+                    if stat.st_size < self.min_size:
+                        self.stats["skipped_size"] += 1
+                        continue
+
+                    result[path.as_posix()] = [stat.st_mtime_ns, stat.st_size]
+
+        return result
+
+    def _remove_siblings(self, path: str):
+        for suffix in PRECOMPRESS_SUFFIXES.values():
+            Path(f"{path}{suffix}").unlink(missing_ok=True)
+
+    def _remove_stale_siblings(self, path: str, mtime_ns: int):
+        """NGINX serves a sibling even if the source is newer, drop it until rewritten
+
+        a sibling has the same mtime as its source
+        """
+        for suffix in PRECOMPRESS_SUFFIXES.values():
+            sibling = Path(f"{path}{suffix}")
+            try:
+                if sibling.stat().st_mtime_ns != mtime_ns:
+                    sibling.unlink()
+            except FileNotFoundError:
+                pass
+
+    def __call__(self) -> dict:
+        started = time.perf_counter()
+        previous = self._load_state()
+        current = self._scan()
+
+        # source removed, or not compressible any more
+        for path in previous.keys() - current.keys():
+            self._remove_siblings(path)
+            self.stats["removed"] += 1
+
+        todo = [path for path, value in current.items() if previous.get(path) != value]
+        self.stats["unchanged"] = len(current) - len(todo)
+        for path in todo:
+            self._remove_stale_siblings(path, current[path][0])
+
+        if self.formats and todo:
+            with ProcessPoolExecutor(max_workers=max(1, self.jobs)) as executor:
+                results = executor.map(
+                    _precompress_one,
+                    todo,
+                    [self.formats] * len(todo),
+                    [current[path][0] for path in todo],
+                    chunksize=max(1, len(todo) // (max(1, self.jobs) * 4)),
+                )
+                for path, sizes in zip(todo, results):
+                    if sizes is None:
+                        self.stats["failed"] += 1
+                        del current[path]
+                        continue
+
+                    self.stats["compressed"] += 1
+                    self.stats["bytes_in"] += current[path][1]
+                    for fmt, size in sizes.items():
+                        if size is not None:
+                            self.stats["bytes_out"][fmt] += size
+
+        self.stats["seconds"] = time.perf_counter() - started
+        self._save_state(current)
+
+        logger.info(
+            f"Precompress {len(self.roots)} root(s) finished, {json.dumps(self.stats)}"
+        )
+        return self.stats
@@ -0,0 +1,410 @@
+import json
+import os
+import sched
+import select
+import signal
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from logging import getLogger
+from os import kill, mkfifo
+from pathlib import Path
+from stat import S_ISFIFO
+
+from .constants import (
+    NGINX_ERROR_LOG,
+    NGINX_PID,
+    NGINX_RELOAD_DRAIN_TIMEOUT,
+    NGINX_RELOAD_POLL_INTERVAL,
+    NGINX_RELOAD_TIMEOUT,
+    NGINX_WORKER_TITLE,
+    RELOAD_FIFO,
+    RELOAD_REPLY_TIMEOUT,
+)
+from .deploy_stage import get_file_path
+
+logger = getLogger(__name__)
+
+
+def get_nginx_master_pid() -> int | None:
+    try:
+        pid = int(Path(NGINX_PID).read_text().strip())
+    except (OSError, ValueError):
+        return None
+
+    try:
+        kill(pid, 0)
+    except ProcessLookupError:
+        return None
+    except PermissionError:
+        pass
+
+    return pid
+
+
+def get_children_pids(pid: int) -> set[int]:
+    children = Path(f"/proc/{pid}/task/{pid}/children")
+    try:
+        return {int(v) for v in children.read_text().split()}
+    except OSError:
+        pass
+
+    # kernel without CONFIG_PROC_CHILDREN, scan ppid of every process
+    result = set()
+    for stat in Path("/proc").glob("[0-9]*/stat"):
+        try:
+            # pid (comm) state ppid ..., comm may contain space
+            ppid = int(stat.read_text().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+
+        if ppid == pid:
+            result.add(int(stat.parent.name))
+
+    return result
+
+
+def get_worker_pids(pid: int) -> set[int]:
+    """worker processes of master, by process title"""
+    result = set()
+    for child in get_children_pids(pid):
+        try:
+            title = Path(f"/proc/{child}/cmdline").read_bytes()
+        except OSError:
+            continue
+
+        # old workers are "nginx: worker process is shutting down"
+        if title.startswith(NGINX_WORKER_TITLE):
+            result.add(child)
+
+    return result
+
+
+@dataclass
+class ReloadResult:
+    ok: bool
+    # since SIGHUP, None if not reached
+    up_seconds: float | None = None
+    drain_seconds: float | None = None
+    # old workers still running at drain timeout
+    draining: int = 0
+
+
+def _wait_drained(
+    pid: int, old_workers: set[int], started: float, timeout: float
+) -> tuple[float | None, int]:
+    """wait for old workers exited, return (seconds since SIGHUP, still draining)"""
+    deadline = time.monotonic() + timeout
+    while True:
+        draining = old_workers & get_children_pids(pid)
+        if not draining:
+            return time.monotonic() - started, 0
+
+        if time.monotonic() > deadline:
+            return None, len(draining)
+
+        time.sleep(NGINX_RELOAD_POLL_INTERVAL)
+
+
+def reload_nginx(
+    timeout: float = NGINX_RELOAD_TIMEOUT,
+    drain_timeout: float = NGINX_RELOAD_DRAIN_TIMEOUT,
+) -> ReloadResult:
+    """SIGHUP the master, wait for new workers up, then for old workers exited
+
+    new workers up is the success of reload; old workers drain long-lived
+    connections(e.g. websocket), still running after drain_timeout is reported,
+    not a failure
+
+    not ok if NGINX is not running, or no new worker is up in timeout,
+    e.g. the new config is broken and NGINX keeps the old workers
+    """
+    pid = get_nginx_master_pid()
+    if pid is None:
+        logger.warning("NGINX is not running, skip reload")
+        return ReloadResult(ok=False)
+
+    # certs NGINX is going to load, recorded once the reload succeeded
+    from .cert import CertFingerprint
+
+    cert_fingerprint = CertFingerprint()
+    loaded_certs = cert_fingerprint.current()
+
+    old_workers = get_worker_pids(pid)
+    logger.info(f"Reload NGINX(pid:{pid}) ...")
+    started = time.monotonic()
+    try:
+        kill(pid, signal.SIGHUP)
+    except OSError as e:
+        logger.error(f"Reload NGINX failed, {e}")
+        return ReloadResult(ok=False)
+
+    deadline = started + timeout
+    while True:
+        # master starts all new workers at once, then signals the old ones
+        new_workers = get_worker_pids(pid) - old_workers
+        if new_workers:
+            break
+
+        if time.monotonic() > deadline:
+            logger.error(
+                f"Reload NGINX failed, no new worker in {timeout}s, see {NGINX_ERROR_LOG}"
+            )
+            return ReloadResult(ok=False)
+
+        time.sleep(NGINX_RELOAD_POLL_INTERVAL)
+
+    up_seconds = time.monotonic() - started
+    logger.info(
+        f"Reload NGINX, {len(new_workers)} new worker(s) up in {up_seconds:.3f}s,"
+        f" {len(old_workers)} old worker(s) draining"
+    )
+    cert_fingerprint.save(loaded_certs)
+
+    drain_seconds, draining = _wait_drained(pid, old_workers, started, drain_timeout)
+    if drain_seconds is None:
+        logger.warning(
+            f"Reload NGINX finished, {draining} old worker(s) still draining"
+            f" after {drain_timeout}s"
+        )
+    else:
+        logger.info(
+            f"Reload NGINX finished, old worker(s) exited in {drain_seconds:.3f}s"
+        )
+
+    return ReloadResult(
+        ok=True,
+        up_seconds=up_seconds,
+        drain_seconds=drain_seconds,
+        draining=draining,
+    )
+
+
+class ReloadQueue:
+    """coalesce reload requests in window, and keep min interval between reloads
+
+    scheduled by the worker's sched.scheduler, clock is time.monotonic,
+    the result is sent to every requester waiting on a reply fifo
+    """
+
+    def __init__(
+        self,
+        scheduler: sched.scheduler,
+        window_seconds: float,
+        min_interval_seconds: float,
+        func_reload: Callable[[], ReloadResult] = reload_nginx,
+    ):
+        self.scheduler = scheduler
+        self.window_seconds = window_seconds
+        self.min_interval_seconds = min_interval_seconds
+        self.func_reload = func_reload
+
+        self.pending: sched.Event | None = None
+        self.reasons: list[str] = list()
+        self.reply_files: list[Path] = list()
+        self.last_reload_at: float | None = None
+
+        # counters since worker started
+        self.requested = 0
+        self.reloaded = 0
+        self.merged = 0
+
+    def request(self, reason: str, reply_file: Path | None = None):
+        self.requested += 1
+        self.reasons.append(reason)
+        if reply_file is not None:
+            self.reply_files.append(reply_file)
+        if self.pending is not None:
+            return
+
+        reload_at = self.scheduler.timefunc() + self.window_seconds
+        if self.last_reload_at is not None:
+            reload_at = max(reload_at, self.last_reload_at + self.min_interval_seconds)
+
+        self.pending = self.scheduler.enterabs(reload_at, 0, self.flush)
+        logger.debug(f"Reload requested by {reason}, will reload at {reload_at:.3f}")
+
+    def flush(self):
+        reasons, self.reasons, self.pending = self.reasons, list(), None
+        reply_files, self.reply_files = self.reply_files, list()
+        if not reasons:
+            return
+
+        self.reloaded += 1
+        self.merged += len(reasons) - 1
+        logger.info(
+            f"Reload NGINX for {len(reasons)} request(s): {', '.join(reasons)};"
+            f" total requested:{self.requested}, reloaded:{self.reloaded}, merged:{self.merged}"
+        )
+
+        self.last_reload_at = self.scheduler.timefunc()
+        result = self.func_reload()
+        for reply_file in reply_files:
+            send_reload_result(reply_file, result)
+
+
+def _open_fifo(fifo_file: Path) -> tuple[int, int]:
+    """create fifo, return (read fd, write fd)
+
+    keep a writer open, or select() returns EOF forever once a writer closes
+    """
+    fifo_file.unlink(missing_ok=True)
+    mkfifo(fifo_file, 0o600)
+    fd = os.open(fifo_file, os.O_RDONLY | os.O_NONBLOCK)
+    fd_keep = os.open(fifo_file, os.O_WRONLY | os.O_NONBLOCK)
+    return fd, fd_keep
+
+
+class ReloadFifo:
+    """worker side of RELOAD_FIFO, one request per line: reason, optional reply fifo"""
+
+    def __init__(self, fifo_file: str | Path = RELOAD_FIFO):
+        self.fifo_file = get_file_path(fifo_file)
+
+        self.fd, self._fd_keep = _open_fifo(self.fifo_file)
+        self._buffer = b""
+
+    def close(self):
+        os.close(self._fd_keep)
+        os.close(self.fd)
+        self.fifo_file.unlink(missing_ok=True)
+
+    def wait(self, timeout: float) -> list[tuple[str, Path | None]]:
+        """block up to timeout, return received (reason, reply fifo)"""
+        readable, _, _ = select.select([self.fd], [], [], max(timeout, 0))
+        if not readable:
+            return []
+
+        try:
+            self._buffer += os.read(self.fd, select.PIPE_BUF)
+        except BlockingIOError:
+            return []
+
+        *lines, self._buffer = self._buffer.split(b"\n")
+        result = list()
+        for line in lines:
+            reason, _, reply_file = line.decode("utf-8", "replace").partition("\t")
+            result.append(
+                (reason.strip() or "unknown", self._get_reply_file(reply_file))
+            )
+
+        return result
+
+    def _get_reply_file(self, value: str) -> Path | None:
+        """only a fifo next to ours, never write into a regular file"""
+        if not value:
+            return None
+
+        path = Path(value)
+        if not path.name.startswith(f"{self.fifo_file.name}."):
+            return None
+        if path.parent != self.fifo_file.parent:
+            return None
+
+        return path
+
+
+def send_reload_result(reply_file: Path, result: ReloadResult):
+    try:
+        if not S_ISFIFO(reply_file.stat().st_mode):
+            return
+
+        # ENXIO if the requester gave up waiting
+        fd = os.open(reply_file, os.O_WRONLY | os.O_NONBLOCK)
+    except OSError as e:
+        logger.warning(f"Reply to {reply_file} failed, {e}")
+        return
+
+    try:
+        os.write(fd, f"{json.dumps(asdict(result))}\n".encode())
+    except OSError as e:
+        logger.warning(f"Reply to {reply_file} failed, {e}")
+    finally:
+        os.close(fd)
+
+
+def _wait_reload_result(fd: int, timeout: float) -> ReloadResult | None:
+    buffer = b""
+    deadline = time.monotonic() + timeout
+    while b"\n" not in buffer:
+        readable, _, _ = select.select(
+            [fd], [], [], max(deadline - time.monotonic(), 0)
+        )
+        if not readable:
+            return None
+
+        try:
+            buffer += os.read(fd, select.PIPE_BUF)
+        except BlockingIOError:
+            continue
+
+    try:
+        return ReloadResult(**json.loads(buffer.split(b"\n", 1)[0]))
+    except (TypeError, ValueError) as e:
+        logger.error(f"Invalid reload result {buffer!r}, {e}")
+        return None
+
+
+def request_reload(
+    reason: str,
+    fifo_file: str | Path = RELOAD_FIFO,
+    timeout: float = RELOAD_REPLY_TIMEOUT,
+) -> bool:
+    """queue reload to worker if it is running and wait for the result,
+    or reload NGINX right now
+
+    return True only if NGINX is reloaded
+    """
+    fifo_file = get_file_path(fifo_file)
+    try:
+        fd = os.open(fifo_file, os.O_WRONLY | os.O_NONBLOCK)
+    except OSError:
+        # FileNotFoundError, or ENXIO: no worker is reading
+        return reload_nginx().ok
+
+    reply_file = fifo_file.with_name(
+        f"{fifo_file.name}.{os.getpid()}-{time.monotonic_ns()}.reply"
+    )
+    try:
+        reply_fd, reply_fd_keep = _open_fifo(reply_file)
+    except OSError as e:
+        os.close(fd)
+        logger.warning(f"Create {reply_file} failed, {e}")
+        return reload_nginx().ok
+
+    try:
+        try:
+            # one line, shorter than PIPE_BUF, written atomically
+            reason = " ".join(reason.split())[:128]
+            os.write(fd, f"{reason}\t{reply_file}\n".encode())
+        except OSError as e:
+            logger.warning(f"Queue reload failed, {e}")
+            return reload_nginx().ok
+        finally:
+            os.close(fd)
+
+        logger.info(f"Reload NGINX queued to worker, reason: {reason}")
+        result = _wait_reload_result(reply_fd, timeout)
+    finally:
+        os.close(reply_fd_keep)
+        os.close(reply_fd)
+        reply_file.unlink(missing_ok=True)
+
+    if result is None:
+        logger.error(f"Reload NGINX queued, no result from worker in {timeout}s")
+        return False
+
+    if result.ok:
+        drained = (
+            f"old worker(s) exited in {result.drain_seconds:.3f}s"
+            if result.drain_seconds is not None
+            else f"{result.draining} old worker(s) still draining"
+        )
+        logger.info(
+            f"Reload NGINX finished by worker, new worker(s) up in"
+            f" {result.up_seconds:.3f}s, {drained}"
+        )
+    else:
+        logger.error("Reload NGINX failed by worker, see worker log")
+
+    return result.ok
@@ -0,0 +1,397 @@
+"""
+streaming analyzer of NGINX access logs, `plush stats`
+
+- formats: `main`, `timed` and `json` of generated nginx.conf
+- plain files are memory mapped, gzip files(rotated *.gz, `access_log ... gzip`)
+  are detected by magic bytes and decompressed as a stream
+- one pass, memory is bounded by STATS_MAX_KEYS and the quantile sketch size
+"""
+
+import gzip
+import json
+import math
+import mmap
+import re
+import time
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+from logging import getLogger
+from pathlib import Path
+from typing import BinaryIO
+
+from .constants import (
+    STATS_LOG_GLOB,
+    STATS_MAX_KEYS,
+    STATS_QUANTILES,
+    STATS_SKETCH_ACCURACY,
+    STATS_SKETCH_MAX_BUCKETS,
+)
+from .deploy_stage import get_env_value, get_file_path
+
+logger = getLogger(__name__)
+
+# `main` and `timed`, timing fields are appended by `timed`
+_LINE = re.compile(
+    rb'\S+ - \S+ \[[^\]]*\] "[^"]*" (?P<status>\d{3}) (?P<bytes>\d+|-) '
+    rb'"[^"]*" "[^"]*" "[^"]*"'
+    rb'(?: (?P<host>\S+) rt=(?P<rt>[\d.]+) uct="[^"]*" uht="[^"]*" '
+    rb'urt="(?P<urt>[^"]*)" ua="(?P<ua>[^"]*)")?'
+)
+# `$upstream_addr`, "a, b" for next upstream, "a : b" for internal redirect
+_UPSTREAM_SEPARATOR = re.compile(rb", | : ")
+
+_OTHER_KEY = "(other)"
+
+_GZIP_MAGIC = b"\x1f\x8b"
+
+
+class QuantileSketch:
+    """log bucketed histogram with relative error, mergeable, like DDSketch
+
+    value v is counted in bucket ceil(log(v, gamma)), at most max_buckets
+    buckets are kept, the lowest ones are collapsed first
+    """
+
+    __slots__ = ("gamma", "log_gamma", "max_buckets", "buckets", "zero", "count")
+
+    # NGINX times are in seconds with millisecond resolution, 0.000 is zero
+    MIN_VALUE = 1e-4
+
+    def __init__(
+        self,
+        accuracy: float = STATS_SKETCH_ACCURACY,
+        max_buckets: int = STATS_SKETCH_MAX_BUCKETS,
+    ):
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.max_buckets = max_buckets
+
+        self.buckets: dict[int, int] = dict()
+        self.zero = 0
+        self.count = 0
+
+    def add(self, value: float):
+        self.count += 1
+        if value < self.MIN_VALUE:
+            self.zero += 1
+            return
+
+        key = math.ceil(math.log(value) / self.log_gamma)
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+
+    def _collapse(self):
+        while len(self.buckets) > self.max_buckets:
+            lowest, second = sorted(self.buckets)[:2]
+            self.buckets[second] += self.buckets.pop(lowest)
+
+    def merge(self, other: "QuantileSketch"):
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self.zero += other.zero
+        self.count += other.count
+        self._collapse()
+
+    def quantile(self, q: float) -> float | None:
+        if self.count == 0:
+            return None
+
+        rank = q * (self.count - 1)
+        seen = self.zero
+        if seen > rank:
+            return 0.0
+
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return 2 * self.gamma**key / (self.gamma + 1)
+
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+class KeyStats:
+    __slots__ = ("requests", "bytes", "status_4xx", "status_5xx", "latency")
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes = 0
+        self.status_4xx = 0
+        self.status_5xx = 0
+        self.latency = QuantileSketch()
+
+    def add(self, status: int, body_bytes: int, latency: float | None):
+        self.requests += 1
+        self.bytes += body_bytes
+        if 400 <= status < 500:
+            self.status_4xx += 1
+        elif status >= 500:
+            self.status_5xx += 1
+        if latency is not None:
+            self.latency.add(latency)
+
+    def merge(self, other: "KeyStats"):
+        self.requests += other.requests
+        self.bytes += other.bytes
+        self.status_4xx += other.status_4xx
+        self.status_5xx += other.status_5xx
+        self.latency.merge(other.latency)
+
+    def to_dict(self) -> dict:
+        result = {
+            "requests": self.requests,
+            "bytes": self.bytes,
+            "error_rate_4xx": self.status_4xx / self.requests if self.requests else 0,
+            "error_rate_5xx": self.status_5xx / self.requests if self.requests else 0,
+        }
+        for q in STATS_QUANTILES:
+            result[f"p{round(q * 100)}"] = self.latency.quantile(q)
+
+        return result
+
+
+class GroupStats:
+    """KeyStats by key, at most STATS_MAX_KEYS keys"""
+
+    __slots__ = ("keys",)
+
+    def __init__(self):
+        self.keys: dict[str, KeyStats] = dict()
+
+    def get(self, key: str) -> KeyStats:
+        stats = self.keys.get(key)
+        if stats is None:
+            if len(self.keys) >= STATS_MAX_KEYS:
+                key = _OTHER_KEY
+                stats = self.keys.get(key)
+
+            if stats is None:
+                stats = self.keys[key] = KeyStats()
+
+        return stats
+
+    def merge(self, other: "GroupStats"):
+        for key, stats in other.keys.items():
+            self.get(key).merge(stats)
+
+    def to_dict(self) -> dict:
+        return {
+            key: stats.to_dict()
+            for key, stats in sorted(
+                self.keys.items(), key=lambda item: item[1].requests, reverse=True
+            )
+        }
+
+
+class LogStats:
+    def __init__(self):
+        self.files: list[str] = list()
+        self.lines = 0
+        self.skipped = 0
+
+        self.server = GroupStats()
+        self.upstream = GroupStats()
+        self.status = GroupStats()
+
+    def add_line(self, line: bytes, default_server: str):
+        if line.startswith(b"{"):
+            try:
+                record = json.loads(line)
+                status = int(record["status"])
+                body_bytes = int(record.get("body_bytes_sent") or 0)
+                latency = float(record["request_time"])
+            except (ValueError, KeyError, TypeError):
+                self.skipped += 1
+                return
+
+            server = record.get("host") or default_server
+            upstream_addr = (record.get("upstream_addr") or "").encode()
+            upstream_time = (record.get("upstream_response_time") or "").encode()
+        else:
+            match = _LINE.match(line)
+            if match is None:
+                self.skipped += 1
+                return
+
+            status = int(match["status"])
+            body_bytes = int(match["bytes"]) if match["bytes"] != b"-" else 0
+            latency = float(match["rt"]) if match["rt"] else None
+            server = match["host"].decode() if match["host"] else default_server
+            upstream_addr = match["ua"] or b""
+            upstream_time = match["urt"] or b""
+
+        self.lines += 1
+        self.server.get(server).add(status, body_bytes, latency)
+        self.status.get(str(status)).add(status, body_bytes, latency)
+        if upstream_addr and upstream_addr != b"-":
+            self._add_upstream(status, upstream_addr, upstream_time)
+
+    def _add_upstream(self, status: int, addrs: bytes, times: bytes):
+        times_list = _UPSTREAM_SEPARATOR.split(times)
+        for i, addr in enumerate(_UPSTREAM_SEPARATOR.split(addrs)):
+            try:
+                latency = float(times_list[i])
+            except (IndexError, ValueError):
+                # "-", not connected
+                latency = None
+
+            # bytes are counted in server/status
+            self.upstream.get(addr.decode()).add(status, 0, latency)
+
+    def add_file(self, path: Path):
+        self.files.append(path.as_posix())
+        default_server = path.name.split(".log", 1)[0]
+        for line in iter_lines(path):
+            self.add_line(line, default_server)
+
+    def merge(self, other: "LogStats"):
+        self.files += other.files
+        self.lines += other.lines
+        self.skipped += other.skipped
+        self.server.merge(other.server)
+        self.upstream.merge(other.upstream)
+        self.status.merge(other.status)
+
+    def to_dict(self) -> dict:
+        return {
+            "files": self.files,
+            "lines": self.lines,
+            "skipped": self.skipped,
+            "server": self.server.to_dict(),
+            "upstream": self.upstream.to_dict(),
+            "status": self.status.to_dict(),
+        }
+
+
+def iter_lines(path: Path) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        if f.read(len(_GZIP_MAGIC)) == _GZIP_MAGIC:
+            f.seek(0)
+            yield from _iter_gzip_lines(f)
+            return
+
+        if path.stat().st_size == 0:
+            return
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mmap, "MADV_SEQUENTIAL"):
+                # let kernel read ahead
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            yield from iter(mm.readline, b"")
+
+
+def _iter_gzip_lines(f: BinaryIO) -> Iterator[bytes]:
+    """NGINX appends one gzip member per flush, the last one may be incomplete"""
+    with gzip.open(f, "rb") as gz:
+        try:
+            yield from gz
+        except EOFError:
+            return
+
+
+def get_logrotate_patterns() -> list[str]:
+    """log file patterns of generated logrotate.conf"""
+    try:
+        content = get_file_path(get_env_value().LOGROTATE_CONF).read_text()
+    except OSError:
+        return [STATS_LOG_GLOB]
+
+    return re.findall(r"^(/\S+)\s*\{", content, re.MULTILINE) or [STATS_LOG_GLOB]
+
+
+def get_log_files(paths: list[str]) -> list[Path]:
+    """access logs and their rotated files(dateext, *.gz), or given paths"""
+    if paths:
+        patterns = paths
+    else:
+        patterns = list()
+        for pattern in get_logrotate_patterns():
+            patterns += [pattern, f"{pattern}-*"]
+
+    files = set()
+    for pattern in patterns:
+        for file_name in glob(pattern) or ([pattern] if paths else []):
+            path = Path(file_name)
+            if not paths and "access" not in path.name:
+                continue
+
+            files.add(path)
+
+    return sorted(files)
+
+
+def _analyze_file(path: Path) -> LogStats:
+    """run in worker process"""
+    result = LogStats()
+    try:
+        result.add_file(path)
+    except (OSError, EOFError) as e:
+        logger.warning(f"Read {path} failed, {e}")
+
+    return result
+
+
+def analyze(files: list[Path], jobs: int = 1) -> LogStats:
+    result = LogStats()
+    if jobs <= 1 or len(files) <= 1:
+        for stats in map(_analyze_file, files):
+            result.merge(stats)
+        return result
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for stats in executor.map(_analyze_file, files):
+            result.merge(stats)
+
+    return result
+
+
+def _format_bytes(value: int) -> str:
+    for unit in ("B", "K", "M", "G"):
+        if value < 1024:
+            return f"{value:.0f}{unit}"
+        value /= 1024
+
+    return f"{value:.1f}T"
+
+
+def _format_ms(value: float | None) -> str:
+    return "-" if value is None else f"{value * 1000:.0f}ms"
+
+
+def format_text(data: dict, top: int) -> str:
+    lines = [
+        f"files: {len(data['files'])}, lines: {data['lines']}, skipped: {data['skipped']}"
+        f", seconds: {data['seconds']:.1f}"
+    ]
+    for group in ("server", "upstream", "status"):
+        lines += [
+            "",
+            f"{group:<40} {'requests':>10} {'bytes':>8} {'4xx':>7} {'5xx':>7}"
+            + "".join(f" {f'p{round(q * 100)}':>8}" for q in STATS_QUANTILES),
+        ]
+        for key, value in list(data[group].items())[:top]:
+            lines.append(
+                f"{key[:40]:<40} {value['requests']:>10} {_format_bytes(value['bytes']):>8}"
+                f" {value['error_rate_4xx']:>7.2%} {value['error_rate_5xx']:>7.2%}"
+                + "".join(
+                    f" {_format_ms(value[f'p{round(q * 100)}']):>8}"
+                    for q in STATS_QUANTILES
+                )
+            )
+
+    return "\n".join(lines)
+
+
+def run_stats(paths: list[str], jobs: int, top: int, as_json: bool) -> str:
+    started = time.perf_counter()
+    files = get_log_files(paths)
+    if not files:
+        logger.warning("No access log found")
+
+    data = analyze(files, jobs=jobs).to_dict()
+    data["seconds"] = time.perf_counter() - started
+    if as_json:
+        return json.dumps(data, indent=2)
+
+    return format_text(data, top=top)
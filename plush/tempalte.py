@@ -1,15 +1,47 @@
-from functools import cache
-
 from jinja2.environment import Template as jinjaTemplate
 from jinja2.sandbox import SandboxedEnvironment
 
+jinja_env = SandboxedEnvironment()
+
+
+class TemplateRegistry:
+    """process-wide compiled templates, key is the template source"""
+
+    _templates: dict[str, jinjaTemplate]
+
+    hits: int
+    misses: int
+
+    def __init__(self):
+        self._templates = dict()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, template: str) -> jinjaTemplate:
+        compiled = self._templates.get(template)
+        if compiled is not None:
+            self.hits += 1
+            return compiled
+
+        self.misses += 1
+        compiled = jinja_env.from_string(template)
+        self._templates[template] = compiled
+        return compiled
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self._templates), "hits": self.hits, "misses": self.misses}
+
+
+template_registry = TemplateRegistry()
+
 
 class Template:
-    jinja_env = SandboxedEnvironment()
+    jinja_env = jinja_env
 
-    @cache
     def get_tempalte(self, template: str) -> jinjaTemplate:
-        return self.jinja_env.from_string(template)
+        return template_registry.get(template)
 
     def render(self, template_name: str, *args, **kwargs) -> str:
         return self.get_tempalte(template_name).render(*args, **kwargs)
@@ -0,0 +1,206 @@
+import os
+from logging import getLogger
+from pathlib import Path
+
+from .cert import CertFingerprint, get_referenced_cert_dirs
+from .config import Config, get_config_from_file
+from .inotify import (
+    IN_CLOSE_WRITE,
+    IN_CREATE,
+    IN_DELETE,
+    IN_DELETE_SELF,
+    IN_IGNORED,
+    IN_ISDIR,
+    IN_MOVE_SELF,
+    IN_MOVED_FROM,
+    IN_MOVED_TO,
+    IN_Q_OVERFLOW,
+    Inotify,
+    InotifyEvent,
+)
+from .nginx import NginxGenerator
+from .precompress import (
+    SIBLING_SUFFIXES,
+    Precompressor,
+    get_precompress_formats,
+    get_precompress_roots,
+)
+from .reload import request_reload
+
+logger = getLogger(__name__)
+
+# watch the directory, editors/`docker cp`/certbot replace the file by rename
+WATCH_MASK = (
+    IN_CLOSE_WRITE
+    | IN_CREATE
+    | IN_DELETE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+)
+# the watched dir itself is gone, its watch is removed and has to be added again
+WATCH_GONE_MASK = IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED
+
+
+class NginxTomlWatcher:
+    """watch nginx.toml and the referenced cert dirs, reload NGINX only on real change
+
+    static roots with precompress = true are watched too, changed files get fresh
+    siblings at once, NGINX would serve a stale .gz/.br/.zst until the next cron run
+    """
+
+    def __init__(
+        self,
+        config_nginx_toml: Path,
+        nginx_conf_dir: Path,
+        debounce_seconds: float,
+    ):
+        self.config_nginx_toml = config_nginx_toml.absolute()
+        self.nginx_conf_dir = nginx_conf_dir
+        self.debounce_seconds = debounce_seconds
+
+        self.cert_fingerprint = CertFingerprint(nginx_conf_dir=nginx_conf_dir)
+        self.cert_dirs: set[Path] = set()
+        self.static_dirs: set[Path] = set()
+
+    def _load_config(self) -> Config | None:
+        try:
+            return get_config_from_file(self.config_nginx_toml)
+        except SystemExit:
+            # get_config_from_file() exit on bad config, keep watching
+            logger.error(f"Load {self.config_nginx_toml} failed, skip")
+            return None
+
+    def _classify(self, events: list[InotifyEvent]) -> tuple[bool, bool, bool]:
+        """return (config changed, cert touched, static touched)"""
+        config_changed = False
+        cert_touched = False
+        static_touched = False
+        for event in events:
+            if event.mask & IN_Q_OVERFLOW:
+                return True, True, True
+
+            if event.path == self.config_nginx_toml or (
+                event.mask & WATCH_GONE_MASK
+                and event.path == self.config_nginx_toml.parent
+            ):
+                config_changed = True
+            elif event.path.parent in self.cert_dirs or event.path in self.cert_dirs:
+                cert_touched = True
+            elif event.path.parent in self.static_dirs and (
+                event.mask & IN_ISDIR or not event.name.endswith(SIBLING_SUFFIXES)
+            ):
+                # siblings are written by precompress itself
+                static_touched = True
+
+        return config_changed, cert_touched, static_touched
+
+    @staticmethod
+    def _add_watch(inotify: Inotify, path: Path):
+        """idempotent, also re-adds a watch dropped by IN_IGNORED"""
+        if path in inotify.watches.values() or not path.is_dir():
+            return
+
+        try:
+            inotify.add_watch(path, WATCH_MASK)
+        except OSError as e:
+            logger.warning(f"Watch {path} failed, {e}")
+
+    def _watch_dirs(self, inotify: Inotify, config: Config | None):
+        self._add_watch(inotify, self.config_nginx_toml.parent)
+        if config is None:
+            return
+
+        for cert_dir in get_referenced_cert_dirs(config):
+            self.cert_dirs.add(cert_dir)
+            # cert may be issued later or its dir replaced on renewal, watch the parent too
+            for path in (cert_dir.parent, cert_dir):
+                self._add_watch(inotify, path)
+
+    def _watch_static_dirs(self, inotify: Inotify, config: Config | None):
+        """every dir under precompress roots, new dirs are picked up on next change"""
+        if config is None:
+            return
+
+        for root in get_precompress_roots(config):
+            for dir_path, _, _ in os.walk(root):
+                path = Path(dir_path)
+                self.static_dirs.add(path)
+                self._add_watch(inotify, path)
+
+    def regenerate(self) -> bool:
+        """incremental generate, return True if *.conf changed"""
+        try:
+            return NginxGenerator(
+                config_nginx_toml=self.config_nginx_toml,
+                nginx_conf_dir=self.nginx_conf_dir,
+            )()
+        except SystemExit:
+            logger.error(f"Generate from {self.config_nginx_toml} failed, skip")
+            return False
+
+    def precompress(self, config: Config | None):
+        """incremental, only changed files are compressed"""
+        if config is None:
+            return
+
+        formats = get_precompress_formats(config)
+        if not formats:
+            return
+
+        Precompressor(
+            roots=get_precompress_roots(config),
+            formats=formats,
+            min_size=config.precompress.min_size,
+            jobs=os.cpu_count() or 1,
+        )()
+
+    def check_cert(self) -> bool:
+        """return True if any cert changed since NGINX loaded it"""
+        return bool(self.cert_fingerprint.check())
+
+    def run(self):
+        with Inotify() as inotify:
+            config = self._load_config()
+            self._watch_dirs(inotify, config)
+            self._watch_static_dirs(inotify, config)
+            logger.info(
+                f"Watching {self.config_nginx_toml}, {len(self.cert_dirs)} cert dir(s)"
+                f" and {len(self.static_dirs)} static dir(s) ..."
+            )
+
+            while True:
+                # blocking, no CPU cost when idle
+                changes = self._classify(inotify.read_events())
+                if not any(changes):
+                    continue
+
+                # debounce, wait until no more event in debounce_seconds
+                while events := inotify.read_events(timeout=self.debounce_seconds):
+                    changes = tuple(
+                        a or b for a, b in zip(changes, self._classify(events))
+                    )
+                config_changed, cert_touched, static_touched = changes
+
+                need_reload = False
+                if config_changed:
+                    logger.info(f"{self.config_nginx_toml} changed")
+                    config = self._load_config()
+                if config_changed or cert_touched:
+                    # a server skipped for its missing cert is generated once issued
+                    need_reload |= self.regenerate()
+                # new referenced cert dirs, or dirs replaced since last events
+                self._watch_dirs(inotify, config)
+                if config_changed or static_touched:
+                    # new roots/dirs, fresh siblings of changed static files
+                    self._watch_static_dirs(inotify, config)
+                    self.precompress(config)
+
+                # recorded by the reload, not here, cron and worker see it too
+                need_reload |= self.check_cert()
+
+                if need_reload:
+                    request_reload("watch")
+                else:
+                    logger.info("Nothing changed, skip reload")
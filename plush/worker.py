@@ -1,12 +1,12 @@
 import sched
-import subprocess
 import time
 from logging import Formatter, getLogger
 from logging.handlers import WatchedFileHandler
 
-from .constants import NGINX_RELOAD_SH, WORKER_LOG, WORKER_PID
+from .constants import WORKER_LOG, WORKER_PID
 from .daemon_runner import DaemonRunner
-from .deploy_stage import EV, DeployStage, get_file_path
+from .deploy_stage import DeployStage, get_env_value, get_file_path
+from .reload import ReloadFifo, ReloadQueue
 
 logger = getLogger(__name__)
 logger_formatter = Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
@@ -18,24 +18,14 @@ def _logging_add_file_handler():
     logger.addHandler(logger_handler)
 
 
-def task_nginx_reload():
-    logger.info("Worker: Reload NGINX ...")
-    try:
-        result = subprocess.run(
-            [
-                NGINX_RELOAD_SH,
-            ],
-            capture_output=True,
-        )
+def task_cert_check(reload_queue: ReloadQueue):
+    """reload NGINX only if any cert in use is renewed"""
+    from .cert import CertFingerprint
 
-    except Exception as e:
-        logger.error(e)
-        return
-
-    logger.info(f"Worker: Reload NGINX finished, returncode:{result.returncode}")
-    logger.info(f"stdout: {result.stdout.decode('utf-8')}")
-    if result.stderr:
-        logger.info(f"stderr: {result.stderr.decode('utf-8')}")
+    if CertFingerprint().check():
+        reload_queue.request("cert")
+    else:
+        logger.info("Worker: Cert unchanged, skip reload")
 
 
 def schedule_func(**kwargs):
@@ -43,24 +33,40 @@ def schedule_func(**kwargs):
     logger.info(f"Plush worker starting...pid: {kwargs.get('pid')}")
 
     # init schedule
+    EV = get_env_value()
     if EV.DEPLOY_STAGE == DeployStage.PRD:
         interval_seconds = 60 * 60 * 24 * 7  # 1 week
     else:
         interval_seconds = 10
 
+    reload_fifo = ReloadFifo()
+
+    def delay_func(seconds: float):
+        # wait for reload requests from other processes instead of sleeping
+        for reason, reply_file in reload_fifo.wait(seconds):
+            reload_queue.request(reason, reply_file=reply_file)
+
     def task_func():
         # call real task function
-        task_nginx_reload()
+        task_cert_check(reload_queue)
         # reschedule
-        scheduler.enter(interval_seconds, 1, task_func, (scheduler,))
+        scheduler.enter(interval_seconds, 1, task_func)
 
     # create scheduler
-    scheduler = sched.scheduler(time.time, time.sleep)
-    scheduler.enter(interval_seconds, 1, task_func, (scheduler,))
+    scheduler = sched.scheduler(time.monotonic, delay_func)
+    reload_queue = ReloadQueue(
+        scheduler,
+        window_seconds=EV.RELOAD_COALESCE_WINDOW,
+        min_interval_seconds=EV.RELOAD_MIN_INTERVAL,
+    )
+    scheduler.enter(interval_seconds, 1, task_func)
 
     # start schedule, blocking
     logger.info("Plush worker schedule starting...")
-    scheduler.run()
+    try:
+        scheduler.run()
+    finally:
+        reload_fifo.close()
 
 
 class ScheduleDaemon(DaemonRunner):
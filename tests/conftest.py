@@ -0,0 +1,4 @@
+import os
+
+# paths like /data/nginx are mapped into /tmp, see plush.deploy_stage.get_file_path
+os.environ.setdefault("PLUSH_DEPLOY_STAGE", "dev")
@@ -0,0 +1,84 @@
+from plush.config import AccessLog, AccessLogDefault
+from plush.constants import AccessLogFormat
+from plush.nginx.access_log import (
+    get_access_log_directive,
+    get_default_access_log_directive,
+    get_health_check_value,
+)
+
+DEFAULT = AccessLogDefault(
+    http_path="/logs/nginx/http_access.log",
+    stream_path="/logs/nginx/stream_access.log",
+    buffer="64k",
+    flush="5s",
+)
+
+
+def test_default():
+    assert (
+        get_default_access_log_directive(DEFAULT, is_http=True)
+        == "access_log /logs/nginx/http_access.log main buffer=64k flush=5s"
+    )
+    assert (
+        get_default_access_log_directive(DEFAULT, is_http=False)
+        == "access_log /logs/nginx/stream_access.log main buffer=64k flush=5s"
+    )
+
+
+def test_unbuffered_has_no_flush():
+    default = AccessLogDefault(buffer=None, flush="5s", http_path="/l/a.log")
+
+    assert (
+        get_default_access_log_directive(default, is_http=True)
+        == "access_log /l/a.log main"
+    )
+
+
+def test_server_inherits_nothing_to_override():
+    assert get_access_log_directive(DEFAULT, None, is_http=True) is None
+    assert get_access_log_directive(DEFAULT, AccessLog(), is_http=True) is None
+
+
+def test_server_off():
+    assert (
+        get_access_log_directive(DEFAULT, AccessLog(enable=False), is_http=True)
+        == "access_log off"
+    )
+
+
+def test_server_own_file():
+    log = AccessLog(path="/logs/nginx/a.log", format=AccessLogFormat.JSON, gzip=1)
+
+    assert (
+        get_access_log_directive(DEFAULT, log, is_http=True)
+        == "access_log /logs/nginx/a.log json buffer=64k gzip=1 flush=5s"
+    )
+
+
+def test_server_shared_file_ignores_buffer():
+    # NGINX rejects different buffer parameters for the same file
+    log = AccessLog(format=AccessLogFormat.TIMED, buffer="1m", gzip=5)
+
+    assert (
+        get_access_log_directive(DEFAULT, log, is_http=True)
+        == "access_log /logs/nginx/http_access.log timed buffer=64k flush=5s"
+    )
+
+
+def test_health_check_sampling():
+    default = AccessLogDefault(
+        http_path="/l/a.log", buffer=None, health_check_paths=["/healthz"]
+    )
+
+    assert (
+        get_default_access_log_directive(default, is_http=True)
+        == "access_log /l/a.log main if=$plush_loggable"
+    )
+    # not for stream
+    assert (
+        get_default_access_log_directive(default, is_http=False)
+        == f"access_log {default.stream_path} main"
+    )
+    assert get_health_check_value("0%") == "0"
+    assert get_health_check_value("100%") == "1"
+    assert get_health_check_value("5%") == "$plush_log_sample"
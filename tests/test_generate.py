@@ -0,0 +1,93 @@
+"""
+`plush generate --exit-code`, as docker/cron/update.sh runs it
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from plush.constants import GENERATE_EXIT_CODE_CHANGED, NGINX_CONF_LIVE
+from plush.deploy_stage import get_file_path
+
+ROOT = Path(__file__).parent.parent
+
+NGINX_TOML = """
+[ssl_cert]
+pem_file_base_path = "/data/dnsrobocert/live"
+
+[[http_upstream]]
+name = "backend"
+servers = [{ address = "127.0.0.1:8080" }]
+keepalive = 16
+
+[[http_server]]
+server_name = "a.example.com"
+listen = 80
+proxy_pass = "http://backend"
+"""
+
+
+@pytest.fixture
+def work_dir(tmp_path: Path):
+    yield tmp_path
+
+    # dev stage writes into /tmp/plush_<path>
+    for name in ("nginx", "crontabs", "logrotate.conf"):
+        path = get_file_path(tmp_path.joinpath(name))
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)
+
+
+def generate(work_dir: Path) -> int:
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "plush",
+            "generate",
+            "--exit-code",
+            "--config-nginx-toml",
+            work_dir.joinpath("nginx.toml").as_posix(),
+            "--nginx-conf-dir",
+            work_dir.joinpath("nginx").as_posix(),
+        ],
+        capture_output=True,
+        cwd=ROOT,
+        env=os.environ
+        | {
+            "PLUSH_DEPLOY_STAGE": "dev",
+            "PLUSH_CRONTAB_FILE": work_dir.joinpath("crontabs").as_posix(),
+            "PLUSH_LOGROTATE_CONF": work_dir.joinpath("logrotate.conf").as_posix(),
+        },
+        timeout=60,
+    )
+    assert result.returncode in (0, GENERATE_EXIT_CODE_CHANGED), result.stderr
+    return result.returncode
+
+
+def test_exit_code(work_dir: Path):
+    toml_file = work_dir.joinpath("nginx.toml")
+    toml_file.write_text(NGINX_TOML)
+    live_dir = get_file_path(work_dir.joinpath("nginx")).joinpath(NGINX_CONF_LIVE)
+
+    assert generate(work_dir) == GENERATE_EXIT_CODE_CHANGED
+    server_conf = live_dir.joinpath("http_server.d", "a.example.com.conf")
+    # upstream with keepalive
+    assert 'proxy_set_header Connection "";' in server_conf.read_text()
+    first = live_dir.resolve()
+
+    # nothing changed, no new generation
+    assert generate(work_dir) == 0
+    assert live_dir.resolve() == first
+
+    toml_file.write_text(NGINX_TOML.replace("a.example.com", "b.example.com"))
+    assert generate(work_dir) == GENERATE_EXIT_CODE_CHANGED
+    assert live_dir.resolve() != first
+    assert not server_conf.exists()
+    assert live_dir.joinpath("http_server.d", "b.example.com.conf").exists()
@@ -0,0 +1,107 @@
+import fcntl
+from pathlib import Path
+
+import pytest
+
+from plush.constants import NGINX_CONF_LOCK
+from plush.nginx.generation import ConfGenerations
+from plush.nginx.manifest import ConfManifest
+
+
+@pytest.fixture
+def generations(tmp_path: Path) -> ConfGenerations:
+    return ConfGenerations(conf_dir=tmp_path)
+
+
+def stage(generations: ConfGenerations, files: dict[str, str]) -> Path:
+    live_dir = generations.live_link
+    manifest = ConfManifest(live_dir=live_dir)
+    for key, content in files.items():
+        manifest.add(live_dir.joinpath(key), content)
+
+    return generations.stage(
+        manifest=manifest, managed_dirs=[live_dir.joinpath("http_server.d")]
+    )
+
+
+def test_stage_and_publish(generations: ConfGenerations):
+    staging_dir = stage(generations, {"nginx.conf": "a"})
+
+    # every managed dir exists, `include *.d/*.conf` never fails
+    assert staging_dir.joinpath("http_server.d").is_dir()
+    assert generations.live_dir is None
+
+    generations.publish(staging_dir)
+    assert generations.live_dir == staging_dir
+    assert generations.previous_dir is None
+    assert generations.live_link.joinpath("nginx.conf").read_text() == "a"
+
+
+def test_unchanged_file_is_hard_linked(generations: ConfGenerations):
+    first = stage(generations, {"nginx.conf": "a", "http_default.conf": "b"})
+    generations.publish(first)
+
+    second = stage(generations, {"nginx.conf": "a2", "http_default.conf": "b"})
+    assert second.joinpath("nginx.conf").read_text() == "a2"
+    assert (
+        second.joinpath("http_default.conf").stat().st_ino
+        == first.joinpath("http_default.conf").stat().st_ino
+    )
+
+
+def test_publish_keeps_previous_and_prunes_older(generations: ConfGenerations):
+    first = stage(generations, {"nginx.conf": "1"})
+    generations.publish(first)
+    second = stage(generations, {"nginx.conf": "2"})
+    generations.publish(second)
+    third = stage(generations, {"nginx.conf": "3"})
+    generations.publish(third)
+
+    assert generations.live_dir == third
+    assert generations.previous_dir == second
+    assert not first.exists()
+
+
+def test_prune_keeps_newer_staging(generations: ConfGenerations):
+    first = stage(generations, {"nginx.conf": "1"})
+    # staged by another process, not published yet
+    newer = stage(generations, {"nginx.conf": "2"})
+
+    generations.publish(first)
+    assert newer.exists()
+
+
+def test_discard(generations: ConfGenerations):
+    staging_dir = stage(generations, {"nginx.conf": "a"})
+
+    generations.discard(staging_dir)
+    assert not staging_dir.exists()
+
+
+def test_rollback(generations: ConfGenerations):
+    assert generations.rollback() is False
+
+    first = stage(generations, {"nginx.conf": "1"})
+    generations.publish(first)
+    second = stage(generations, {"nginx.conf": "2"})
+    generations.publish(second)
+
+    assert generations.rollback() is True
+    assert generations.live_dir == first
+    assert generations.previous_dir == second
+    assert generations.live_link.joinpath("nginx.conf").read_text() == "1"
+
+    # and forth
+    assert generations.rollback() is True
+    assert generations.live_dir == second
+
+
+def test_lock_excludes_others(generations: ConfGenerations):
+    lock_file = generations.conf_dir.joinpath(NGINX_CONF_LOCK)
+    with generations.lock():
+        # flock is per open file, as another process
+        with open(lock_file) as f, pytest.raises(BlockingIOError):
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    with open(lock_file) as f:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
@@ -0,0 +1,104 @@
+"""
+http_hash.conf sizing, cases where the result of ngx_hash_init() is certain
+
+NGINX is not installed here, `nginx -t` of the Docker image logs a warning if
+it disagrees, see plush/nginx/validate.py
+"""
+
+from plush.nginx.hash_size import (
+    HttpHashKeys,
+    _elt_size,
+    _find_hash_size,
+    get_hash_size,
+    ngx_hash_key,
+)
+
+LIVE_DIR = "/data/nginx/live"
+
+
+def get_elts(keys: set[str]) -> list[tuple[int, int]]:
+    return [(ngx_hash_key(key), _elt_size(key.encode())) for key in keys]
+
+
+def test_ngx_hash_key():
+    # ((h * 31 + c) * 31 + c) ..., as ngx_hash()
+    assert ngx_hash_key("") == 0
+    assert ngx_hash_key("a") == 97
+    assert ngx_hash_key("host") == ((104 * 31 + 111) * 31 + 115) * 31 + 116
+    # on 64-bit ngx_uint_t
+    assert ngx_hash_key("x" * 100) < 1 << 64
+
+
+def test_elt_size():
+    # NGX_HASH_ELT_SIZE(): value pointer + len(u_short) + name, 8 bytes aligned
+    assert _elt_size(b"host") == 16
+    assert _elt_size(b"x-forwarded-for") == 32
+    assert _elt_size(b"x" * 46) == 56
+    assert _elt_size(b"x" * 47) == 64
+
+
+def test_long_server_name_needs_larger_bucket():
+    # an element + NULL pointer must fit in one bucket, or
+    # "could not build server_names_hash, you should increase server_names_hash_bucket_size: 64"
+    assert get_hash_size({"x" * 46}, 512, 64) == (512, 64)
+    assert get_hash_size({"x" * 47}, 512, 64) == (512, 128)
+
+
+def test_same_hash_keys_never_fit_in_64():
+    # "Aa" and "BB" have the same hash, so do all their concatenations, they are
+    # in the same bucket at any size, 2 * 32 bytes > 64 - 8, NGINX warns
+    # "could not build optimal ..." whatever max_size is
+    keys = {"AaAaAaAaAaAaAaAaAa", "BBBBBBBBBBBBBBBBBB"}
+    assert len({ngx_hash_key(key) for key in keys}) == 1
+    assert _find_hash_size(get_elts(keys), 10000, 64) is None
+
+    max_size, bucket_size = get_hash_size(keys, 512, 64)
+    assert bucket_size == 128
+    assert _find_hash_size(get_elts(keys), max_size, bucket_size) is not None
+
+
+def test_many_keys_fit():
+    keys = {f"server{i}.example.com" for i in range(5000)}
+    max_size, bucket_size = get_hash_size(keys, 512, 64)
+    assert max_size >= 512 and bucket_size >= 64
+    assert _find_hash_size(get_elts(keys), max_size, bucket_size) is not None
+
+
+def test_scan_keys():
+    keys = HttpHashKeys(live_dir=LIVE_DIR)
+    keys.scan("""
+        http {
+            map $http_upgrade $connection_upgrade {
+                default upgrade;
+                '' close;
+                ~^x regex;
+            }
+            server {
+                server_name Example.com www.example.com *.example.org ~^api;
+                location / {
+                    proxy_set_header X-Real-IP $remote_addr;
+                    proxy_hide_header X-Powered-By;
+                    include /data/nginx/live/not-scanned.conf;
+                }
+            }
+        }
+        stream {
+            server {
+                server_name stream.example.com;
+            }
+        }
+        """)
+
+    assert keys.server_names == {"example.com", "www.example.com"}
+    assert keys.server_names_other == {"*.example.org", "~^api"}
+    assert "x-real-ip" in keys.proxy_set_headers
+    assert "x-powered-by" in keys.proxy_hide_headers
+    assert keys.maps == [{""}]
+
+
+def test_scan_app_snippets_from_source_tree():
+    # /app/nginx/snippets of Docker image is docker/nginx/snippets here
+    keys = HttpHashKeys(live_dir=LIVE_DIR)
+    keys.scan("include /app/nginx/snippets/proxy-params.conf;")
+
+    assert "x-forwarded-proto" in keys.proxy_set_headers
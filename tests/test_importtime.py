@@ -0,0 +1,74 @@
+"""
+`plush cron` runs from crontab often, it must not pay for the generator's imports
+
+    python -m pytest tests
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).parent.parent
+
+# only needed by generate/watch/worker, as in benchmark/importtime.py
+HEAVY_MODULES = [
+    "jinja2",
+    "dataclass_wizard",
+    "dotenv",
+    "tomllib",
+    "crontab",
+    "daemon",
+    "lockfile",
+    "plush.nginx",
+    "plush.config",
+    "plush.cert",
+    "plush.precompress",
+    "plush.stats",
+]
+
+
+def get_imported_modules(args: list[str]) -> set[str]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "plush"] + args,
+        capture_output=True,
+        text=True,
+        cwd=ROOT,
+        # as in Docker, without a running NGINX or worker
+        env={**os.environ, "PLUSH_DEPLOY_STAGE": "dev"},
+        timeout=60,
+    )
+
+    # import time: self [us] | cumulative | imported package
+    imported = {
+        line.rsplit("|", 1)[1].strip()
+        for line in result.stderr.splitlines()
+        if line.startswith("import time:")
+    }
+    assert "plush.cli" in imported, result.stderr
+    return imported
+
+
+def get_heavy_modules(imported: set[str]) -> list[str]:
+    return sorted(
+        name
+        for name in imported
+        if any(name == m or name.startswith(f"{m}.") for m in HEAVY_MODULES)
+    )
+
+
+def test_cron():
+    imported = get_imported_modules(["cron"])
+
+    assert "plush.reload" in imported
+    assert get_heavy_modules(imported) == []
+
+
+@pytest.mark.parametrize("command", ["cron", "generate", "watch", "stats"])
+def test_help(command: str):
+    imported = get_imported_modules([command, "--help"])
+
+    assert "plush.reload" not in imported
+    assert get_heavy_modules(imported) == []
@@ -0,0 +1,85 @@
+from pathlib import Path
+
+from plush.constants import NGINX_CONF_MANIFEST
+from plush.nginx.manifest import ConfManifest
+
+
+def save(manifest: ConfManifest):
+    manifest.live_dir.mkdir(parents=True, exist_ok=True)
+    manifest.live_dir.joinpath(NGINX_CONF_MANIFEST).write_text(manifest.dump())
+
+
+def test_first_round(tmp_path: Path):
+    manifest = ConfManifest(live_dir=tmp_path)
+
+    assert manifest.add(tmp_path.joinpath("nginx.conf"), "a") is True
+    assert manifest.add(tmp_path.joinpath("http_server.d", "a.com.conf"), "b")
+    assert manifest.changed
+    assert manifest.written == ["nginx.conf", "http_server.d/a.com.conf"]
+    assert manifest.removed == []
+    assert manifest.files["http_server.d/a.com.conf"] == "b"
+
+
+def test_reload_unchanged(tmp_path: Path):
+    manifest = ConfManifest(live_dir=tmp_path)
+    manifest.add(tmp_path.joinpath("nginx.conf"), "a")
+    save(manifest)
+
+    manifest = ConfManifest(live_dir=tmp_path)
+    assert manifest.add(tmp_path.joinpath("nginx.conf"), "a") is False
+    assert not manifest.changed
+    assert manifest.written == []
+    assert manifest.is_unchanged("nginx.conf")
+
+
+def test_reload_changed_and_removed(tmp_path: Path):
+    manifest = ConfManifest(live_dir=tmp_path)
+    manifest.add(tmp_path.joinpath("nginx.conf"), "a")
+    manifest.add(tmp_path.joinpath("http_server.d", "a.com.conf"), "b")
+    save(manifest)
+
+    manifest = ConfManifest(live_dir=tmp_path)
+    assert manifest.add(tmp_path.joinpath("nginx.conf"), "a2") is True
+    assert manifest.changed
+    assert manifest.written == ["nginx.conf"]
+    assert manifest.removed == ["http_server.d/a.com.conf"]
+
+
+def test_broken_manifest_is_empty(tmp_path: Path):
+    tmp_path.joinpath(NGINX_CONF_MANIFEST).write_text("not json")
+
+    manifest = ConfManifest(live_dir=tmp_path)
+    assert manifest.previous == dict()
+
+
+def test_consolidate(tmp_path: Path):
+    section_dir = tmp_path.joinpath("http_server.d")
+    manifest = ConfManifest(live_dir=tmp_path)
+    manifest.add(tmp_path.joinpath("nginx.conf"), "main")
+    # added out of order, merged in the order of `include *.conf`
+    manifest.add(section_dir.joinpath("b.conf"), "server b")
+    manifest.add(section_dir.joinpath("a.conf"), "server a")
+
+    index = manifest.consolidate(section_dir, "consolidated.conf")
+
+    content = manifest.files["http_server.d/consolidated.conf"]
+    assert content == "server a\nserver b\n"
+    assert set(manifest.files) == {"nginx.conf", "http_server.d/consolidated.conf"}
+    for key, expected in (
+        ("http_server.d/a.conf", "server a"),
+        ("http_server.d/b.conf", "server b"),
+    ):
+        item = index[key]
+        assert item["file"] == "http_server.d/consolidated.conf"
+        data = content.encode()[item["offset"] : item["offset"] + item["length"]]
+        assert data.decode() == expected
+
+    # merged files are still tracked one by one
+    assert "http_server.d/a.conf" in manifest.current
+
+
+def test_consolidate_empty_section(tmp_path: Path):
+    manifest = ConfManifest(live_dir=tmp_path)
+
+    assert manifest.consolidate(tmp_path.joinpath("mail.d"), "x.conf") == dict()
+    assert manifest.files == dict()
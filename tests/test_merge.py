@@ -0,0 +1,76 @@
+from plush.config import HttpServer, SSLCert
+from plush.nginx.merge import merge_http_servers
+
+SSL_CERT = SSLCert(pem_file_base_path="/data/dnsrobocert/live")
+
+
+def test_merge_same_config():
+    servers = [
+        HttpServer(server_name="a.example.com", listen=80, proxy_pass="http://b"),
+        HttpServer(server_name="other.com", listen=80, proxy_pass="http://c"),
+        HttpServer(
+            server_name="b.example.com a.example.com", listen=80, proxy_pass="http://b"
+        ),
+    ]
+
+    merged, report = merge_http_servers(servers, SSL_CERT)
+
+    assert [(name, server.server_name) for name, server in merged] == [
+        ("a.example.com", "a.example.com b.example.com"),
+        ("other.com", "other.com"),
+    ]
+    assert report.servers == 3
+    assert report.blocks_before == 3
+    assert report.blocks_after == 2
+    # the config objects are not changed
+    assert servers[0].server_name == "a.example.com"
+
+
+def test_location_order_matters():
+    servers = [
+        HttpServer(
+            server_name="a.com", listen=80, location={"~ /x": "return 200;", "/": ""}
+        ),
+        HttpServer(
+            server_name="b.com", listen=80, location={"/": "", "~ /x": "return 200;"}
+        ),
+    ]
+
+    merged, _ = merge_http_servers(servers, SSL_CERT)
+    assert len(merged) == 2
+
+
+def test_ssl_by_cert_dir():
+    servers = [
+        HttpServer(
+            server_name="a.example.com", listen_ssl=443, ssl_cert_domain="example.com"
+        ),
+        HttpServer(
+            server_name="b.example.com", listen_ssl=443, ssl_cert_domain="example.com"
+        ),
+        HttpServer(
+            server_name="c.example.org", listen_ssl=443, ssl_cert_domain="example.org"
+        ),
+    ]
+
+    merged, report = merge_http_servers(servers, SSL_CERT)
+
+    assert [server.server_name for _, server in merged] == [
+        "a.example.com b.example.com",
+        "c.example.org",
+    ]
+    assert report.ssl_contexts_before == 3
+    assert report.ssl_contexts_after == 2
+    assert report.memory_saved > 0
+
+
+def test_disabled_not_merged():
+    servers = [
+        HttpServer(server_name="a.com", listen=80),
+        HttpServer(server_name="b.com", listen=80, enable=False),
+    ]
+
+    merged, report = merge_http_servers(servers, SSL_CERT)
+
+    assert [name for name, _ in merged] == ["a.com", "b.com"]
+    assert report.servers == 1
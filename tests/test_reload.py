@@ -0,0 +1,175 @@
+import sched
+import threading
+from pathlib import Path
+
+import pytest
+
+from plush import reload
+from plush.reload import (
+    ReloadFifo,
+    ReloadQueue,
+    ReloadResult,
+    _wait_drained,
+    request_reload,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+@pytest.fixture
+def scheduler(clock: FakeClock) -> sched.scheduler:
+    return sched.scheduler(clock.time, clock.sleep)
+
+
+def test_queue_coalesces_in_window(clock: FakeClock, scheduler: sched.scheduler):
+    reloaded_at = list()
+    queue = ReloadQueue(
+        scheduler,
+        window_seconds=1,
+        min_interval_seconds=10,
+        func_reload=lambda: reloaded_at.append(clock.now) or ReloadResult(ok=True),
+    )
+
+    queue.request("a")
+    clock.now = 0.5
+    queue.request("b")
+    scheduler.run()
+
+    assert reloaded_at == [1.0]
+    assert (queue.requested, queue.reloaded, queue.merged) == (2, 1, 1)
+
+
+def test_queue_keeps_min_interval(clock: FakeClock, scheduler: sched.scheduler):
+    reloaded_at = list()
+    queue = ReloadQueue(
+        scheduler,
+        window_seconds=1,
+        min_interval_seconds=10,
+        func_reload=lambda: reloaded_at.append(clock.now) or ReloadResult(ok=True),
+    )
+
+    queue.request("a")
+    scheduler.run()
+    clock.now = 2
+    queue.request("b")
+    scheduler.run()
+    # window only once the interval has passed
+    clock.now = 30
+    queue.request("c")
+    scheduler.run()
+
+    assert reloaded_at == [1.0, 11.0, 31.0]
+    assert (queue.requested, queue.reloaded, queue.merged) == (3, 3, 0)
+
+
+def test_wait_drained(monkeypatch: pytest.MonkeyPatch):
+    children = iter([{1, 2, 3}, {2, 3}, {3}])
+    monkeypatch.setattr(reload, "get_children_pids", lambda pid: next(children))
+    monkeypatch.setattr(reload, "NGINX_RELOAD_POLL_INTERVAL", 0)
+
+    drain_seconds, draining = _wait_drained(0, {1, 2}, started=0, timeout=10)
+    assert drain_seconds is not None
+    assert draining == 0
+
+
+def test_wait_drained_timeout(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(reload, "get_children_pids", lambda pid: {1, 2, 3})
+    monkeypatch.setattr(reload, "NGINX_RELOAD_POLL_INTERVAL", 0)
+
+    assert _wait_drained(0, {1, 2}, started=0, timeout=0.01) == (None, 2)
+
+
+@pytest.fixture
+def fifo_file(tmp_path: Path) -> Path:
+    # mapped by get_file_path on both sides
+    return tmp_path.joinpath("reload.fifo")
+
+
+@pytest.fixture
+def fifo(fifo_file: Path):
+    fifo = ReloadFifo(fifo_file)
+    yield fifo
+    fifo.close()
+
+
+def run_request_reload(
+    fifo_file: Path, reason: str, timeout: float
+) -> tuple[threading.Thread, list[bool]]:
+    result = list()
+    thread = threading.Thread(
+        target=lambda: result.append(request_reload(reason, fifo_file, timeout))
+    )
+    thread.start()
+    return thread, result
+
+
+def test_request_reload_gets_worker_result(fifo: ReloadFifo, fifo_file: Path):
+    queue = ReloadQueue(
+        sched.scheduler(),
+        window_seconds=0,
+        min_interval_seconds=0,
+        func_reload=lambda: ReloadResult(ok=True, up_seconds=0.1, drain_seconds=0.2),
+    )
+    threads = [run_request_reload(fifo_file, f"test {i}", timeout=10) for i in range(3)]
+
+    received = list()
+    for _ in range(len(threads)):
+        received += fifo.wait(10)
+        if len(received) == len(threads):
+            break
+    for reason, reply_file in received:
+        assert reply_file is not None
+        queue.request(reason, reply_file=reply_file)
+    queue.scheduler.run()
+
+    for thread, result in threads:
+        thread.join(10)
+        assert result == [True]
+    assert sorted(reason for reason, _ in received) == ["test 0", "test 1", "test 2"]
+    assert (queue.reloaded, queue.merged) == (1, 2)
+
+
+def test_request_reload_failed_by_worker(fifo: ReloadFifo, fifo_file: Path):
+    thread, result = run_request_reload(fifo_file, "test", timeout=10)
+
+    ((_, reply_file),) = fifo.wait(10)
+    reload.send_reload_result(reply_file, ReloadResult(ok=False))
+
+    thread.join(10)
+    assert result == [False]
+
+
+def test_request_reload_no_result(fifo: ReloadFifo, fifo_file: Path):
+    thread, result = run_request_reload(fifo_file, "test", timeout=0.1)
+
+    thread.join(10)
+    assert result == [False]
+    # queued, not reloaded by the requester itself
+    ((reason, reply_file),) = fifo.wait(0)
+    assert reason == "test"
+    assert not reply_file.exists()
+
+
+def test_reply_file_next_to_fifo_only(fifo: ReloadFifo):
+    name = fifo.fifo_file.name
+
+    assert fifo._get_reply_file("") is None
+    assert fifo._get_reply_file("/etc/passwd") is None
+    assert fifo._get_reply_file(f"/etc/{name}.1.reply") is None
+    assert fifo._get_reply_file(
+        fifo.fifo_file.with_name(f"{name}.1.reply").as_posix()
+    ) == fifo.fifo_file.with_name(f"{name}.1.reply")
@@ -0,0 +1,145 @@
+import gzip
+import json
+import random
+from pathlib import Path
+
+from plush.stats import LogStats, QuantileSketch, iter_lines
+
+MAIN_LINE = (
+    b'10.0.0.1 - - [18/Oct/2026:10:00:00 +0000] "GET / HTTP/1.1" 200 512 '
+    b'"-" "curl/8.0" "-"\n'
+)
+TIMED_LINE = (
+    b'10.0.0.1 - - [18/Oct/2026:10:00:00 +0000] "GET /api HTTP/1.1" 502 0 '
+    b'"-" "curl/8.0" "-" api.example.com rt=1.500 uct="0.001, 0.002" '
+    b'uht="-, 0.400" urt="1.000, 0.500" ua="10.0.0.2:80, 10.0.0.3:80" '
+    b'us="502, 502" rid=abc\n'
+)
+JSON_LINE = json.dumps(
+    {
+        "host": "json.example.com",
+        "status": 404,
+        "body_bytes_sent": 100,
+        "request_time": 0.25,
+        "upstream_addr": "10.0.0.4:80",
+        "upstream_response_time": "0.200",
+    }
+).encode()
+
+
+def test_quantile_relative_error():
+    rng = random.Random(0)
+    values = [rng.lognormvariate(-3, 1) for _ in range(10000)]
+    sketch = QuantileSketch(accuracy=0.01)
+    for value in values:
+        sketch.add(value)
+
+    values.sort()
+    for q in (0.5, 0.95, 0.99):
+        exact = values[int(q * (len(values) - 1))]
+        assert abs(sketch.quantile(q) - exact) / exact <= 0.011
+
+
+def test_quantile_zero_and_empty():
+    sketch = QuantileSketch()
+    assert sketch.quantile(0.5) is None
+
+    for value in (0, 0, 0, 1):
+        sketch.add(value)
+    assert sketch.quantile(0.5) == 0.0
+    assert abs(sketch.quantile(1) - 1) < 0.01
+
+
+def test_quantile_merge():
+    a, b, both = QuantileSketch(), QuantileSketch(), QuantileSketch()
+    for i in range(1, 1001):
+        (a if i % 2 else b).add(i / 1000)
+        both.add(i / 1000)
+
+    a.merge(b)
+    assert a.count == both.count
+    assert a.buckets == both.buckets
+
+
+def test_quantile_max_buckets():
+    sketch = QuantileSketch(max_buckets=16)
+    for i in range(1, 10001):
+        sketch.add(i / 1000)
+
+    assert len(sketch.buckets) == 16
+    # the lowest buckets are collapsed, high quantiles keep accurate
+    assert abs(sketch.quantile(0.99) - 9.9) / 9.9 <= 0.011
+
+
+def test_main_line():
+    stats = LogStats()
+    stats.add_line(MAIN_LINE, "default")
+
+    data = stats.to_dict()
+    assert (data["lines"], data["skipped"]) == (1, 0)
+    assert data["server"]["default"]["requests"] == 1
+    assert data["server"]["default"]["bytes"] == 512
+    # no timing in `main`
+    assert data["server"]["default"]["p50"] is None
+    assert data["upstream"] == {}
+
+
+def test_timed_line():
+    stats = LogStats()
+    stats.add_line(TIMED_LINE, "default")
+
+    data = stats.to_dict()
+    server = data["server"]["api.example.com"]
+    assert server["error_rate_5xx"] == 1
+    assert abs(server["p50"] - 1.5) / 1.5 <= 0.01
+    # one entry per tried upstream
+    assert list(data["upstream"]) == ["10.0.0.2:80", "10.0.0.3:80"]
+    assert abs(data["upstream"]["10.0.0.3:80"]["p50"] - 0.5) / 0.5 <= 0.01
+    assert data["status"]["502"]["requests"] == 1
+
+
+def test_json_line():
+    stats = LogStats()
+    stats.add_line(JSON_LINE, "default")
+
+    data = stats.to_dict()
+    server = data["server"]["json.example.com"]
+    assert (server["requests"], server["bytes"]) == (1, 100)
+    assert server["error_rate_4xx"] == 1
+    assert list(data["upstream"]) == ["10.0.0.4:80"]
+
+
+def test_skipped_lines():
+    stats = LogStats()
+    for line in (b"garbage\n", b"{not json}\n", b'{"status": 200}\n'):
+        stats.add_line(line, "default")
+
+    assert (stats.lines, stats.skipped) == (0, 3)
+
+
+def test_plain_and_gzip_files(tmp_path: Path):
+    plain = tmp_path.joinpath("a.log")
+    plain.write_bytes(MAIN_LINE + TIMED_LINE)
+    # rotated name does not tell, detected by magic bytes
+    compressed = tmp_path.joinpath("b.log.1")
+    compressed.write_bytes(gzip.compress(MAIN_LINE) + gzip.compress(JSON_LINE))
+    empty = tmp_path.joinpath("c.log")
+    empty.touch()
+
+    assert list(iter_lines(plain)) == [MAIN_LINE, TIMED_LINE]
+    assert list(iter_lines(compressed)) == [MAIN_LINE, JSON_LINE]
+    assert list(iter_lines(empty)) == []
+
+    stats = LogStats()
+    for path in (plain, compressed, empty):
+        stats.add_file(path)
+    assert stats.lines == 4
+    assert stats.to_dict()["server"]["b"]["requests"] == 1
+
+
+def test_truncated_gzip(tmp_path: Path):
+    # the last member is still being written by NGINX
+    path = tmp_path.joinpath("a.log.gz")
+    path.write_bytes(gzip.compress(MAIN_LINE) + gzip.compress(TIMED_LINE)[:-10])
+
+    assert list(iter_lines(path))[0] == MAIN_LINE
@@ -0,0 +1,77 @@
+from pathlib import Path
+
+from plush.config import Upstream, UpstreamServer
+from plush.nginx.upstream import GenerateOneUpstreamConf, has_keepalive
+
+BASE_PATH = Path("/data/nginx/live/http_upstream.d")
+
+
+def render(upstream: Upstream, is_http: bool = True) -> list[str]:
+    content = GenerateOneUpstreamConf(
+        upstream=upstream, base_path=BASE_PATH, is_http=is_http
+    )._generate_conf_content()
+    return [line.strip() for line in content.splitlines() if line.strip()]
+
+
+def test_directive_order():
+    lines = render(
+        Upstream(
+            name="backend",
+            balance="least_conn",
+            zone="64k",
+            servers=[
+                UpstreamServer(address="10.0.0.1:80", weight=2, max_fails=3),
+                UpstreamServer(address="10.0.0.2:80", backup=True),
+            ],
+            keepalive=16,
+            keepalive_timeout="60s",
+        )
+    )
+
+    assert lines == [
+        "upstream backend {",
+        "least_conn;",
+        "zone backend 64k;",
+        "server 10.0.0.1:80 weight=2 max_fails=3;",
+        "server 10.0.0.2:80 backup;",
+        "keepalive 16;",
+        "keepalive_timeout 60s;",
+        "}",
+    ]
+
+
+def test_balancer_in_raw_content_before_keepalive():
+    # NGINX drops the keepalive pool if a balancer comes after keepalive
+    lines = render(
+        Upstream(
+            name="backend",
+            content="hash $remote_addr consistent; server 10.0.0.1:80;",
+            keepalive=8,
+        )
+    )
+
+    assert lines.index("hash $remote_addr consistent; server 10.0.0.1:80;") < (
+        lines.index("keepalive 8;")
+    )
+
+
+def test_raw_content_only():
+    lines = render(Upstream(name="backend", content="server 10.0.0.1:80;"))
+
+    assert lines == ["upstream backend {", "server 10.0.0.1:80;", "}"]
+
+
+def test_stream_upstream_skips_keepalive():
+    lines = render(
+        Upstream(name="db", servers=[UpstreamServer(address="db:5432")], keepalive=8),
+        is_http=False,
+    )
+
+    assert lines == ["upstream db {", "server db:5432;", "}"]
+
+
+def test_has_keepalive():
+    assert has_keepalive(Upstream(name="a", keepalive=8))
+    assert has_keepalive(Upstream(name="a", content="server b:80;\nkeepalive 8;"))
+    assert not has_keepalive(Upstream(name="a", content="server b:80;"))
+    assert not has_keepalive(Upstream(name="a", enable=False, keepalive=8))